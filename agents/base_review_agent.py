@@ -1,28 +1,58 @@
 # agents/base_review_agent.py
-from typing import Dict, List
+from typing import Callable, Dict, List, Mapping, Optional, Union
 from llm.ollama_llm import OllamaLLM
-from utils.diff_parser import DiffParser, FileDiff
+from llm.call_context import record_metric, record_route
+from llm.model_router import ModelRoute, ModelRouter, get_model_router
+from llm.prompt_budget import estimate_tokens, split_diffs
+from llm.streaming import StopCondition
+from utils.diff_parser import DiffParser, FileDiff, ParsedDiff
+from prompts.prompt_templates import create_merge_review_prompt, create_shared_review_prefix
+from config import OLLAMA_STREAM_MAX_CHARS, OLLAMA_STREAM_MAX_REPEATED_LINES
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
 
 class BaseReviewAgent:
     """Base class for review agents with common diff handling."""
+
+    # Key the orchestrator registers the agent under; selects its model and prompt budget
+    agent_type = "review"
     
-    def __init__(self):
+    def __init__(self, router: Optional[ModelRouter] = None):
         self.diff_parser = DiffParser()
         self.llm = OllamaLLM()
+        self.router = router or get_model_router()
+        # Receives partial LLM output as it streams in, e.g. for live CLI display
+        self.stream_handler: Optional[Callable[[str], None]] = None
+        self.stop_condition = self._default_stop_condition()
+
+    def _default_stop_condition(self) -> Optional[StopCondition]:
+        """Builds the early-termination guard configured for agent LLM calls."""
+        if not OLLAMA_STREAM_MAX_CHARS and not OLLAMA_STREAM_MAX_REPEATED_LINES:
+            return None
+        return StopCondition(
+            max_chars=OLLAMA_STREAM_MAX_CHARS or None,
+            max_repeated_lines=OLLAMA_STREAM_MAX_REPEATED_LINES or None
+        )
         
-    async def get_relevant_files(self, diff: str, patterns: List[str]) -> Dict[str, FileDiff]:
-        """Gets relevant file changes for this agent's review."""
+    async def get_relevant_files(self, diff: Union[str, ParsedDiff], patterns: List[str]) -> Mapping[str, FileDiff]:
+        """
+        Gets relevant file changes for this agent's review.
+
+        A ParsedDiff shared through the review context is sliced without
+        re-parsing; raw diff text is parsed on the spot.
+        """
         try:
+            if isinstance(diff, ParsedDiff):
+                return diff.select(patterns)
             result = await self.diff_parser.get_relevant_diff_content(diff, patterns)
             return result
         except Exception as e:
             logger.error(f"Error getting relevant files: {e}")
             return {}
         
-    async def format_diff_for_review(self, diffs: Dict[str, FileDiff]) -> str:
+    async def format_diff_for_review(self, diffs: Mapping[str, FileDiff]) -> str:
         """Formats diff content for LLM review."""
         try:
             formatted = []
@@ -40,10 +70,128 @@ class BaseReviewAgent:
             logger.error(f"Error formatting diff: {e}")
             return ""
 
-    async def llm_call(self, prompt: str) -> str:
+    async def review_with_budget(self, diffs: Mapping[str, FileDiff], previous_comments: str,
+                                 instructions: str, shared_diff: Optional[Union[str, ParsedDiff]] = None) -> str:
+        """
+        Reviews `diffs` with prompts that fit this agent's context window.
+
+        Args:
+            diffs: The files this agent reviews
+            previous_comments: Previous review comments
+            instructions: The agent's instructions, placed after the shared prefix
+            shared_diff: The whole review's ParsedDiff, when there is one
+
+        Returns:
+            str: The review. Whenever the whole PR diff fits, every agent sends
+            the same diff-first prefix (see create_shared_review_prefix) so
+            the model evaluates it once per PR. Otherwise the agent's own files
+            are split by file and hunk, the chunks are reviewed concurrently
+            and the partial reviews are merged by a final call.
+        """
+        sized = shared_diff if isinstance(shared_diff, ParsedDiff) else diffs
+        route = self.router.route(self.agent_type, sum(d.added_lines + d.removed_lines for d in sized.values()))
+        record_route(route.to_dict())
+        budget = route.budget
+        if isinstance(shared_diff, ParsedDiff):
+            prefix = create_shared_review_prefix(await self.format_diff_for_review(shared_diff), previous_comments)
+            suffix = self._scope_instructions(instructions, diffs, shared_diff)
+            if budget.fits(prefix + suffix):
+                record_metric("prompt_chunks", 1)
+                record_metric("prompt_tokens_estimated", estimate_tokens(prefix + suffix))
+                return await self.llm_call(suffix, route.options, prefix=prefix, model=route.model)
+
+        def build_prompt(formatted_diff: str, comments: str) -> str:
+            return create_shared_review_prefix(formatted_diff, comments) + instructions
+
+        prompt = build_prompt(await self.format_diff_for_review(diffs), previous_comments)
+        if budget.fits(prompt):
+            record_metric("prompt_chunks", 1)
+            record_metric("prompt_tokens_estimated", estimate_tokens(prompt))
+            return await self.llm_call(prompt, route.options, model=route.model)
+
+        comments = budget.trim_comments(previous_comments)
+        overhead = estimate_tokens(build_prompt("", comments))
+        chunks = split_diffs(diffs, budget.input_tokens - overhead)
+        logger.info(f"{self.agent_type}: diff exceeds num_ctx={budget.num_ctx}, "
+                    f"reviewing in {len(chunks)} chunks")
+        record_metric("prompt_chunks", len(chunks))
+
+        async def review_chunk(chunk: Mapping[str, FileDiff]) -> str:
+            chunk_prompt = build_prompt(await self.format_diff_for_review(chunk), comments)
+            record_metric("prompt_tokens_estimated", estimate_tokens(chunk_prompt))
+            return await self.llm_call(chunk_prompt, route.options, model=route.model)
+
+        partials = await asyncio.gather(*(review_chunk(chunk) for chunk in chunks))
+        valid = [review for review in partials if self._validate_response(review)]
+        if not valid:
+            return partials[0] if partials else "Error: No reviewable content"
+        if len(valid) < len(partials):
+            logger.warning(f"{self.agent_type}: {len(partials) - len(valid)} of {len(partials)} chunk reviews failed")
+        return await self._merge_reviews(valid, route)
+
+    @staticmethod
+    def _scope_instructions(instructions: str, diffs: Mapping[str, FileDiff], shared_diff: ParsedDiff) -> str:
+        """Points the agent at its own files when the shared diff contains others."""
+        if len(diffs) == len(shared_diff):
+            return instructions
+        files = "\n".join(f"    - {filename}" for filename in diffs)
+        return f"\n    **Files in scope for this review:**\n{files}\n{instructions}"
+
+    async def _merge_reviews(self, reviews: List[str], route: ModelRoute) -> str:
+        """Reduces partial reviews to one, in rounds when they do not fit one prompt together."""
+        budget = route.budget
+        while len(reviews) > 1:
+            prompt = create_merge_review_prompt(self.agent_type, reviews)
+            if budget.fits(prompt):
+                record_metric("prompt_merge_calls", 1)
+                return await self.llm_call(prompt, route.options, model=route.model)
+            overhead = estimate_tokens(create_merge_review_prompt(self.agent_type, []))
+            available = budget.input_tokens - overhead
+            groups: List[List[str]] = [[]]
+            used = 0
+            for review in reviews:
+                tokens = estimate_tokens(review) + 16
+                if groups[-1] and used + tokens > available:
+                    groups.append([])
+                    used = 0
+                groups[-1].append(review)
+                used += tokens
+            if len(groups) == len(reviews):
+                # Each review alone fills the window; shorten them all to fit together
+                per_review = available // len(reviews) - 24
+                trimmed = [budget.trim(review, per_review) for review in reviews] if per_review > 0 else reviews
+                if trimmed == reviews:
+                    # The window can't hold even the merge instructions with a little of each review
+                    logger.warning(f"{self.agent_type}: {len(reviews)} partial reviews can't be merged within "
+                                   f"{budget.input_tokens} input tokens; returning them unmerged")
+                    return self._concatenate(reviews)
+                reviews = trimmed
+                continue
+            record_metric("prompt_merge_calls", sum(1 for group in groups if len(group) > 1))
+            reviews = list(await asyncio.gather(*(
+                self.llm_call(create_merge_review_prompt(self.agent_type, group), route.options, model=route.model)
+                if len(group) > 1 else self._as_result(group[0])
+                for group in groups
+            )))
+        return reviews[0]
+
+    @staticmethod
+    async def _as_result(review: str) -> str:
+        return review
+
+    def _concatenate(self, reviews: List[str]) -> str:
+        """Joins the partial reviews that did not fail, or returns the first one if all did."""
+        valid = [review for review in reviews if self._validate_response(review)]
+        return "\n\n".join(valid) if valid else reviews[0]
+
+    async def llm_call(self, prompt: str, options: Optional[Dict] = None, prefix: Optional[str] = None,
+                       model: Optional[str] = None) -> str:
         """Async wrapper for LLM calls"""
         try:
-            response = await self.llm.call(prompt)
+            if self.stream_handler is not None or self.stop_condition is not None:
+                response = await self._stream_llm_call(prompt, options, prefix, model)
+            else:
+                response = await self.llm.call(prompt, options, prefix=prefix, model=model)
             if not response or not isinstance(response, str):
                 return "Error: Invalid response from LLM"
             return response
@@ -51,6 +199,35 @@ class BaseReviewAgent:
             logger.error(f"Error in LLM call: {e}")
             return f"Error: {str(e)}"
 
+    async def _stream_llm_call(self, prompt: str, options: Optional[Dict] = None,
+                               prefix: Optional[str] = None, model: Optional[str] = None) -> str:
+        """Streams an LLM call, forwarding chunks to the stream handler."""
+        chunks = []
+        async for chunk in self.llm.stream(prompt, self.stop_condition, options, prefix=prefix, model=model):
+            chunks.append(chunk)
+            if self.stream_handler is not None:
+                try:
+                    self.stream_handler(chunk)
+                except Exception as e:
+                    logger.warning(f"Stream handler failed: {e}")
+        return "".join(chunks)
+
+    def merge_cached_results(self, review: Union[str, Dict, None], findings: Dict[str, List[Dict]],
+                             reviews: List[str]) -> Union[str, Dict, None]:
+        """
+        Combines a review of the changed hunks with results cached for the
+        unchanged ones (see utils.hunk_cache). `review` is None when every
+        hunk was cached.
+        """
+        if findings or isinstance(review, dict):
+            merged = dict(review) if isinstance(review, dict) else {}
+            for key, items in findings.items():
+                merged[key] = list(merged.get(key) or []) + items
+            return merged
+        sections = [review] if review else []
+        sections.extend(f"_Unchanged since an earlier review:_\n\n{cached}" for cached in reviews)
+        return "\n\n".join(sections) if sections else review
+
     def _validate_response(self, response: str) -> bool:
         """Validates if the response is meaningful."""
         if not response or not response.strip():
@@ -63,8 +240,12 @@ class BaseReviewAgent:
         """Handles empty or error responses."""
         return f"The {agent_type} review could not be completed. Please try again later."
 
-    def _format_review(self, review: str, agent_type: str) -> str:
-        """Formats the review response with proper headers and structure."""
+    def _format_review(self, review: str, agent_type: str, model: Optional[str] = None) -> str:
+        """
+        Formats the review response with proper headers and structure.
+        `model` is the one the review was routed to (ModelRoute.model);
+        it defaults to the client's model.
+        """
         if not self._validate_response(review):
             return self._handle_empty_response(agent_type)
             
@@ -74,6 +255,6 @@ class BaseReviewAgent:
 {review}
 
 ---
-_Review generated by {agent_type} using {self.llm.model}_
+_Review generated by {agent_type} using {model or self.llm.model}_
 """
         return formatted_review.strip()
\ No newline at end of file
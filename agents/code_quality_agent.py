@@ -1,20 +1,24 @@
 # agents/code_quality_agent.py
-from typing import Dict, List
+from typing import Dict, List, Union
 from agents.base_review_agent import BaseReviewAgent
+from utils.diff_parser import ParsedDiff
 from github.PullRequest import PullRequest
 from utils.github_helper import analyze_code_quality
-from prompts.prompt_templates import create_code_quality_prompt
+from prompts.prompt_templates import create_code_quality_instructions
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
 
 class CodeQualityAgent(BaseReviewAgent):
     """Agent for reviewing code quality and suggesting improvements."""
+
+    agent_type = "code_quality"
     
     def __init__(self):
         super().__init__()
         
-    async def review_code_quality(self, pr: PullRequest, diff: str, previous_comments: str) -> str:
+    async def review_code_quality(self, pr: PullRequest, diff: Union[str, ParsedDiff], previous_comments: str) -> str:
         """Reviews code quality in the pull request."""
         try:
             # Get relevant files for code quality review
@@ -25,13 +29,14 @@ class CodeQualityAgent(BaseReviewAgent):
             if not relevant_diffs:
                 return "No code files found to review."
                 
-            formatted_diff = await self.format_diff_for_review(relevant_diffs)
-            
             # Get code quality analysis
-            quality_analysis = analyze_code_quality(pr)
-            prompt = create_code_quality_prompt(formatted_diff, previous_comments, quality_analysis)
+            quality_analysis = await asyncio.to_thread(analyze_code_quality, pr)
             
-            return await self.llm.call(prompt)
+            return await self.review_with_budget(
+                relevant_diffs, previous_comments,
+                create_code_quality_instructions(quality_analysis),
+                shared_diff=diff
+            )
         except Exception as e:
             logger.error(f"Error generating code quality review: {e}")
             return f"Error generating code quality review: {str(e)}"
\ No newline at end of file
@@ -1,8 +1,11 @@
 # agents/dependency_review_agent.py
-from typing import Dict, List
+from typing import Dict, List, Union
 from agents.base_review_agent import BaseReviewAgent
+from utils.diff_parser import ParsedDiff
 from github.PullRequest import PullRequest
 from utils.github_helper import analyze_dependencies
+from prompts.prompt_templates import create_shared_review_prefix
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
@@ -10,10 +13,12 @@ logger = logging.getLogger(__name__)
 class DependencyReviewAgent(BaseReviewAgent):
     """Agent for reviewing dependency changes and security implications."""
 
+    agent_type = "dependencies"
+
     def __init__(self):
         super().__init__()
 
-    async def review_dependencies(self, pr: PullRequest, diff: str, previous_comments: str) -> str:
+    async def review_dependencies(self, pr: PullRequest, diff: Union[str, ParsedDiff], previous_comments: str) -> str:
         """
         Reviews dependency changes in the pull request.
         
@@ -38,13 +43,14 @@ class DependencyReviewAgent(BaseReviewAgent):
             if not relevant_diffs:
                 return "No dependency files found to review."
 
-            formatted_diff = await self.format_diff_for_review(relevant_diffs)
-            
             # Get dependency analysis
-            dependency_analysis = analyze_dependencies(pr)
-            prompt = self.create_dependency_prompt(formatted_diff, previous_comments, dependency_analysis)
+            dependency_analysis = await asyncio.to_thread(analyze_dependencies, pr)
             
-            response = await self.llm.call(prompt)
+            response = await self.review_with_budget(
+                relevant_diffs, previous_comments,
+                self.create_dependency_instructions(dependency_analysis),
+                shared_diff=diff
+            )
             if not response or not response.strip():
                 logger.error("Empty dependency review generated.")
                 return "Error: Dependency review returned an empty response."
@@ -55,19 +61,16 @@ class DependencyReviewAgent(BaseReviewAgent):
 
     def create_dependency_prompt(self, diff: str, previous_comments: str, analysis: Dict) -> str:
         """Creates a prompt for dependency review."""
+        return create_shared_review_prefix(diff, previous_comments) + self.create_dependency_instructions(analysis)
+
+    def create_dependency_instructions(self, analysis: Dict) -> str:
+        """Creates the dependency review instructions that follow the shared prefix."""
         prompt = f"""
         You are an expert dependency reviewer. Your task is to analyze dependency changes for security and compatibility issues.
 
         **Dependency Analysis:**
         {self._format_dependency_analysis(analysis)}
 
-        **Files Changed:**
-        {diff}
-
-        **Context:**
-        Previous comments on this pull request:
-        {previous_comments}
-
         **Instructions:**
         1. Review the dependency changes and analysis results
         2. Evaluate:
@@ -1,18 +1,21 @@
 # agents/documentation_review_agent.py
-from typing import Dict, List
+from typing import Dict, List, Union
 from agents.base_review_agent import BaseReviewAgent
-from prompts.prompt_templates import create_documentation_review_prompt
+from utils.diff_parser import ParsedDiff
+from prompts.prompt_templates import create_documentation_review_instructions
 import logging
 
 logger = logging.getLogger(__name__)
 
 class DocumentationReviewAgent(BaseReviewAgent):
     """Agent for reviewing documentation changes and standards."""
+
+    agent_type = "documentation"
     
     def __init__(self):
         super().__init__()
         
-    async def review_documentation(self, diff: str, previous_comments: str) -> str:
+    async def review_documentation(self, diff: Union[str, ParsedDiff], previous_comments: str) -> str:
         """
         Reviews documentation changes in the pull request.
         
@@ -33,7 +36,8 @@ class DocumentationReviewAgent(BaseReviewAgent):
         if not relevant_diffs:
             return "No documentation-related changes found to review."
             
-        formatted_diff = await self.format_diff_for_review(relevant_diffs)
-        prompt = create_documentation_review_prompt(formatted_diff, previous_comments)
-        
-        return await self.llm_call(prompt)
\ No newline at end of file
+        return await self.review_with_budget(
+            relevant_diffs, previous_comments,
+            create_documentation_review_instructions(),
+            shared_diff=diff
+        )
\ No newline at end of file
@@ -1,6 +1,6 @@
 # agents/review_orchestrator.py
 
-from typing import Dict, List, Union
+from typing import Callable, Dict, List, Optional, Union
 from agents.base_review_agent import BaseReviewAgent
 from agents.documentation_review_agent import DocumentationReviewAgent
 from agents.code_quality_agent import CodeQualityAgent
@@ -12,19 +12,73 @@ from agents.security_agent import SecurityAgent
 # from agents.best_practices_agent import BestPracticesAgent
 # from agents.cost_optimization_agent import CostOptimizationAgent
 from github.PullRequest import PullRequest
+from analytics.metrics_collector import Metric, MetricsCollector
+from llm.call_context import CallContext, use_call_context
+from utils.diff_parser import ParsedDiff
+from utils.file_triage import TriageDecision, triage_report
+from utils.hunk_cache import HunkResultCache, get_hunk_cache
+from utils.hunk_triage import HunkTriage
+from utils.pr_snapshot import PRSnapshot
+from utils.review_state import is_failed_review
+from config import (
+    REVIEW_MAX_CONCURRENT_AGENTS,
+    REVIEW_AGENT_TIMEOUT,
+    REVIEW_AGENT_TIMEOUTS,
+    CASCADE_ENABLED,
+    CASCADE_AGENTS,
+    OLLAMA_PREFIX_REUSE,
+    HUNK_CACHE_ENABLED
+)
+from datetime import datetime
+import asyncio
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
+# Agents that pattern-scan the diff without prompting a model, so file size costs them little;
+# they get summarized files in full and can anchor findings on real lines
+SCANNING_AGENTS = ('security',)
+
 class ReviewContext:
     """Maintains shared context between review agents."""
     
-    def __init__(self, pr: PullRequest, diff: str, previous_comments: str):
+    def __init__(self, pr: PullRequest, diff: Optional[str], previous_comments: str,
+                 snapshot: Optional[PRSnapshot] = None, parsed_diff: Optional[ParsedDiff] = None):
         self.pr = pr
+        # Pre-fetched PR data; agents read from it instead of the live PR
+        self.snapshot = snapshot
+        # Raw text is optional when the caller parsed the diff incrementally
         self.diff = diff
+        # Parsed once here and shared read-only by every agent
+        self.parsed_diff = parsed_diff if parsed_diff is not None else ParsedDiff.from_text(diff or "")
         self.previous_comments = previous_comments
+        # Per-file triage decisions made before the agents ran, if any
+        self.triage: Dict[str, TriageDecision] = {}
+        # The triaged diff with summarized files in full, for SCANNING_AGENTS; summaries have no hunks
+        self.scan_diff: Optional[ParsedDiff] = None
         self.reviews: Dict[str, Union[str, Dict]] = {}
         self.shared_insights: List[Dict] = []
+        self.agent_timings: Dict[str, float] = {}
+        # Per-agent counters recorded from the LLM call path (chunks, tokens, ...)
+        self.agent_metrics: Dict[str, Dict[str, float]] = {}
+        # Labelled per-call LLM timings, written out with the review's metrics
+        self.llm_metrics: List[Metric] = []
+        # Scheduling class for this review's LLM calls (see llm.scheduler)
+        self.priority: Optional[str] = None
+        # Model, num_ctx and num_predict each agent was routed to
+        self.agent_routes: Dict[str, Dict] = {}
+        # Cascade mode: the diff reduced to the hunks worth an expensive review,
+        # and the agents that get it instead of the full diff
+        self.cascade_diff: Optional[ParsedDiff] = None
+        self.cascade_agents: List[str] = []
+        self.cascade: Dict = {}
+        # Per agent: hunks looked up in the hunk result cache and hits
+        self.hunk_cache: Dict[str, Dict[str, int]] = {}
+        # Results saved by an interrupted earlier attempt of this review; those agents don't run again
+        self.completed_reviews: Dict[str, Union[str, Dict]] = {}
+        # Called with (agent_type, review) when an agent finishes without error, to checkpoint it
+        self.on_agent_review: Optional[Callable[[str, Union[str, Dict]], None]] = None
         
     def add_review(self, agent_type: str, review: Union[str, Dict]):
         """Adds a review from an agent to the shared context."""
@@ -37,6 +91,61 @@ class ReviewContext:
             "insight": insight
         })
         
+    @property
+    def review_target(self) -> Union[PullRequest, PRSnapshot]:
+        """The object agents should read PR data from."""
+        return self.snapshot if self.snapshot is not None else self.pr
+        
+    @property
+    def repo_name(self) -> Optional[str]:
+        if self.snapshot is not None:
+            return self.snapshot.repo_name
+        try:
+            return self.pr.base.repo.full_name
+        except Exception:
+            return None
+
+    @property
+    def pr_number(self) -> Optional[int]:
+        return getattr(self.review_target, 'number', None)
+
+    @property
+    def changed_lines(self) -> int:
+        return sum(d.added_lines + d.removed_lines for d in self.parsed_diff.values())
+
+    def diff_for(self, agent_type: str) -> ParsedDiff:
+        """
+        The diff `agent_type` reviews: summarized files in full for agents
+        that only pattern-scan, the cascade's reduced diff if it is cascaded.
+        """
+        if self.scan_diff is not None and agent_type in SCANNING_AGENTS:
+            return self.scan_diff
+        if self.cascade_diff is not None and agent_type in self.cascade_agents:
+            return self.cascade_diff
+        return self.parsed_diff
+
+    def record_metric(self, agent_type: str, name: str, value: float):
+        """Adds to a per-agent counter for this review."""
+        metrics = self.agent_metrics.setdefault(agent_type, {})
+        metrics[name] = metrics.get(name, 0) + value
+
+    def call_context(self, agent_type: str) -> CallContext:
+        """The LLM call context for work done on behalf of `agent_type`."""
+        return CallContext(
+            agent=agent_type,
+            repo=self.repo_name,
+            pr=self.pr_number,
+            priority=self.priority,
+            size=self.changed_lines,
+            metric_sink=lambda name, value: self.record_metric(agent_type, name, value),
+            call_metrics=self.llm_metrics,
+            route_sink=lambda route: self.agent_routes.__setitem__(agent_type, route)
+        )
+
+    def record_timing(self, agent_type: str, seconds: float):
+        """Records how long an agent's review took."""
+        self.agent_timings[agent_type] = round(seconds, 3)
+        
     def get_agent_review(self, agent_type: str) -> Union[str, Dict]:
         """Gets a specific agent's review."""
         return self.reviews.get(agent_type, {})
@@ -52,8 +161,25 @@ class ReviewContext:
 class ReviewOrchestrator:
     """Orchestrates the collaborative review process between agents."""
     
-    def __init__(self):
+    def __init__(self,
+                 max_concurrency: int = REVIEW_MAX_CONCURRENT_AGENTS,
+                 agent_timeout: float = REVIEW_AGENT_TIMEOUT,
+                 agent_timeouts: Optional[Dict[str, float]] = None,
+                 metrics_collector: Optional[MetricsCollector] = None,
+                 cascade: Optional[HunkTriage] = None,
+                 cascade_agents: Optional[List[str]] = None,
+                 hunk_cache: Optional[HunkResultCache] = None):
         self.agents = {}
+        self.metrics_collector = metrics_collector
+        self.max_concurrency = max(1, max_concurrency)
+        self.agent_timeout = agent_timeout
+        self.agent_timeouts = dict(REVIEW_AGENT_TIMEOUTS if agent_timeouts is None else agent_timeouts)
+        self._agent_stats: Dict[str, Dict] = {}
+        # Hunk triage run before the expensive agents; None disables cascade mode
+        self.cascade = cascade if cascade is not None or not CASCADE_ENABLED else HunkTriage()
+        self.cascade_agents = list(CASCADE_AGENTS if cascade_agents is None else cascade_agents)
+        # Results of unchanged hunks are reused from earlier reviews; None disables it
+        self.hunk_cache = hunk_cache if hunk_cache is not None or not HUNK_CACHE_ENABLED else get_hunk_cache()
         
     def register_agent(self, agent_type: str, agent: BaseReviewAgent):
         """Registers a review agent."""
@@ -62,15 +188,46 @@ class ReviewOrchestrator:
     async def conduct_review(self, context: ReviewContext) -> Dict:
         """Conducts the full review process."""
         try:
+            if self.cascade is not None:
+                await self._run_cascade(context)
+
             # Conduct initial reviews from all agents
             await self._conduct_initial_reviews(context)
             
             # Get all reviews and insights
+            # Agents finish in any order; report them in registration order
+            reviews = {
+                agent_type: context.get_agent_review(agent_type)
+                for agent_type in self.agents
+                if agent_type in context.get_all_reviews()
+            }
+            incomplete = [agent_type for agent_type, review in reviews.items() if is_failed_review(review)]
             results = {
-                "reviews": context.get_all_reviews(),
+                "reviews": reviews,
                 "insights": context.get_insights(),
-                "status": "success"
+                "agent_timings": context.agent_timings,
+                "status": "partial" if incomplete else "success"
             }
+            if incomplete:
+                results["incomplete_agents"] = incomplete
+            resumed = [agent_type for agent_type in self.agents if agent_type in context.completed_reviews]
+            if resumed:
+                results["resumed_agents"] = resumed
+            if context.triage:
+                results["triage"] = triage_report(context.triage)
+            if context.cascade:
+                results["cascade"] = self._cascade_report(context)
+            if context.hunk_cache:
+                results["hunk_cache"] = self._hunk_cache_report(context)
+            if context.agent_routes:
+                results["agent_routes"] = {
+                    agent_type: {**route, "seconds": context.agent_timings.get(agent_type)}
+                    for agent_type, route in context.agent_routes.items()
+                }
+            if context.agent_metrics:
+                results["agent_metrics"] = context.agent_metrics
+            if context.agent_metrics or context.agent_routes or context.cascade or context.hunk_cache:
+                self._emit_metrics(context)
             
             return results
             
@@ -81,33 +238,182 @@ class ReviewOrchestrator:
                 "message": str(e)
             }
             
+    async def _run_cascade(self, context: ReviewContext):
+        """
+        Triages the diff's hunks and gives the cascaded agents only those
+        scoring above the threshold. Any failure falls back to the full diff.
+        """
+        cascaded = [
+            agent_type for agent_type in self.agents
+            if agent_type in self.cascade_agents and agent_type not in context.completed_reviews
+        ]
+        if not cascaded:
+            return
+        start = time.perf_counter()
+        try:
+            with use_call_context(context.call_context("cascade")):
+                scores = await self.cascade.triage(context.parsed_diff)
+            context.cascade_diff = self.cascade.apply(context.parsed_diff, scores)
+            context.cascade_agents = cascaded
+            context.cascade = {
+                **self.cascade.report(scores, time.perf_counter() - start),
+                "agents": cascaded,
+                "files_skipped": len(context.parsed_diff) - len(context.cascade_diff)
+            }
+        except Exception as e:
+            logger.error(f"Error in cascade triage, reviewing the full diff: {e}", exc_info=True)
+            context.cascade_diff = None
+
+    def _cascade_report(self, context: ReviewContext) -> Dict:
+        """
+        The triage summary plus an estimate of the LLM time it saved: the
+        skipped prompt tokens at the prompt-eval rate this review observed,
+        once per cascaded agent unless they share a primed prefix.
+        """
+        report = dict(context.cascade)
+        agents = [m for agent_type, m in context.agent_metrics.items() if agent_type != "cascade"]
+        tokens = sum(m.get("llm_prompt_eval_tokens", 0) for m in agents)
+        seconds = sum(m.get("llm_prompt_eval_seconds", 0) for m in agents)
+        if tokens and seconds:
+            evaluations = 1 if OLLAMA_PREFIX_REUSE else len(context.cascade_agents)
+            saved = report["tokens_skipped"] * seconds / tokens * evaluations
+            report["seconds_saved_estimated"] = round(max(0.0, saved - report["triage_seconds"]), 3)
+        return report
+
     async def _conduct_initial_reviews(self, context: ReviewContext):
-        """Conducts initial reviews from all agents."""
-        for agent_type, agent in self.agents.items():
+        """Conducts initial reviews from all agents concurrently."""
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        await asyncio.gather(*(
+            self._run_agent(agent_type, agent, context, semaphore)
+            for agent_type, agent in self.agents.items()
+        ))
+
+    async def _run_agent(self, agent_type: str, agent: BaseReviewAgent,
+                         context: ReviewContext, semaphore: asyncio.Semaphore):
+        """Runs one agent under the concurrency limit and its own timeout."""
+        if agent_type in context.completed_reviews:
+            review = context.completed_reviews[agent_type]
+            context.add_review(agent_type, review)
+            if isinstance(review, dict):
+                self._share_agent_insights(agent_type, review, context)
+            logger.info(f"{agent_type} review restored from an earlier attempt")
+            return
+        async with semaphore:
+            timeout = self.agent_timeouts.get(agent_type, self.agent_timeout)
+            start = time.perf_counter()
             try:
-                review = None
-                if agent_type == 'documentation':
-                    review = await agent.review_documentation(context.diff, context.previous_comments)
-                elif agent_type == 'code_quality':
-                    review = await agent.review_code_quality(context.pr, context.diff, context.previous_comments)
-                elif agent_type == 'test_coverage':
-                    review = await agent.review_test_coverage(context.pr, context.diff, context.previous_comments)
-                elif agent_type == 'dependencies':
-                    review = await agent.review_dependencies(context.pr, context.diff, context.previous_comments)
-                elif agent_type == 'security':
-                    review = await agent.review_security(context.pr, context.diff, context.previous_comments)
+                # Labels every LLM call the agent makes; inherited by tasks it spawns
+                with use_call_context(context.call_context(agent_type)):
+                    review = await asyncio.wait_for(
+                        self._review_with_hunk_cache(agent_type, agent, context),
+                        timeout=timeout or None
+                    )
                 
                 if review is not None:
                     context.add_review(agent_type, review)
                     if isinstance(review, dict):
                         self._share_agent_insights(agent_type, review, context)
+                    if context.on_agent_review is not None and not is_failed_review(review):
+                        await asyncio.to_thread(context.on_agent_review, agent_type, review)
                     
+            except asyncio.TimeoutError:
+                logger.warning(f"{agent_type} review timed out after {timeout}s")
+                context.add_review(agent_type, {
+                    "status": "timeout",
+                    "message": f"Review did not finish within {timeout} seconds"
+                })
             except Exception as e:
                 logger.error(f"Error in {agent_type} review: {e}", exc_info=True)
                 context.add_review(agent_type, {
                     "status": "error",
                     "message": str(e)
                 })
+            finally:
+                elapsed = time.perf_counter() - start
+                context.record_timing(agent_type, elapsed)
+                self._record_agent_stats(agent_type, elapsed)
+
+    async def _review_with_hunk_cache(self, agent_type: str, agent: BaseReviewAgent, context: ReviewContext):
+        """
+        Runs the agent on the hunks without a cached result and merges in the
+        results cached for the others. When every hunk hits, the agent is
+        not called at all.
+        """
+        diff = context.diff_for(agent_type)
+        if self.hunk_cache is None:
+            return await self._dispatch_agent(agent_type, agent, context, diff)
+        lookup = await asyncio.to_thread(self.hunk_cache.lookup, agent_type, diff)
+        context.hunk_cache[agent_type] = lookup.stats()
+        if not lookup.hits:
+            review = await self._dispatch_agent(agent_type, agent, context, diff)
+            await asyncio.to_thread(self.hunk_cache.store, agent_type, diff, review)
+            return review
+        review = None
+        if lookup.diff:
+            review = await self._dispatch_agent(agent_type, agent, context, lookup.diff)
+            await asyncio.to_thread(self.hunk_cache.store, agent_type, lookup.diff, review)
+        return agent.merge_cached_results(review, lookup.findings, lookup.reviews)
+
+    def _hunk_cache_report(self, context: ReviewContext) -> Dict:
+        """Hunks looked up and hits for this review, overall and per agent."""
+        hunks = sum(s["hunks"] for s in context.hunk_cache.values())
+        hits = sum(s["hits"] for s in context.hunk_cache.values())
+        return {
+            "hunks": hunks,
+            "hits": hits,
+            "hit_ratio": round(hits / hunks, 3) if hunks else 0.0,
+            "agents": context.hunk_cache
+        }
+
+    async def _dispatch_agent(self, agent_type: str, agent: BaseReviewAgent, context: ReviewContext,
+                              diff: ParsedDiff):
+        """Calls the review entry point for an agent type."""
+        if agent_type == 'documentation':
+            return await agent.review_documentation(diff, context.previous_comments)
+        elif agent_type == 'code_quality':
+            return await agent.review_code_quality(context.review_target, diff, context.previous_comments)
+        elif agent_type == 'test_coverage':
+            return await agent.review_test_coverage(context.review_target, diff, context.previous_comments)
+        elif agent_type == 'dependencies':
+            return await agent.review_dependencies(context.review_target, diff, context.previous_comments)
+        elif agent_type == 'security':
+            return await agent.review_security(context.review_target, diff, context.previous_comments)
+        return None
+
+    def _emit_metrics(self, context: ReviewContext):
+        """
+        Writes the review's per-agent counters, their PR totals and the
+        per-call LLM timings to the metrics store.
+        """
+        if self.metrics_collector is None:
+            return
+        timestamp = datetime.utcnow()
+        labels = {"repo": context.repo_name or "", "pr": str(context.pr_number or "")}
+        metrics = list(context.llm_metrics)
+        totals: Dict[str, float] = {}
+        for agent_type, values in context.agent_metrics.items():
+            for name, value in values.items():
+                metrics.append(Metric(timestamp, name, value, {**labels, "agent": agent_type}))
+                totals[name] = totals.get(name, 0) + value
+        for name, value in totals.items():
+            metrics.append(Metric(timestamp, f"{name}_per_pr", value, labels))
+        if context.cascade:
+            for name in ("skipped_fraction", "tokens_skipped", "triage_seconds"):
+                metrics.append(Metric(timestamp, f"cascade_{name}", context.cascade[name], labels))
+        if context.hunk_cache:
+            metrics.append(Metric(timestamp, "hunk_cache_hit_ratio",
+                                  self._hunk_cache_report(context)["hit_ratio"], labels))
+        # Review latency per agent and routed model, for tuning the routing policy
+        for agent_type, route in context.agent_routes.items():
+            if agent_type in context.agent_timings:
+                metrics.append(Metric(timestamp, "agent_review_seconds", context.agent_timings[agent_type],
+                                      {**labels, "agent": agent_type, "model": route["model"]}))
+        self.metrics_collector.add_metrics(metrics)
+
+    def _record_agent_stats(self, agent_type: str, elapsed: float):
+        stats = self._agent_stats.setdefault(agent_type, {'reviews_completed': 0, 'total_time': 0.0})
+        stats['reviews_completed'] += 1
+        stats['total_time'] += elapsed
 
     def _share_agent_insights(self, agent_type: str, review: Dict, context: ReviewContext):
         """Extracts and shares key insights from an agent's review."""
@@ -304,7 +610,12 @@ class ReviewOrchestrator:
 
     def get_agent_statistics(self) -> Dict:
         """Gets statistics about agent performance."""
-        return {agent_type: {
-            'reviews_completed': 0,  # You can add actual tracking if needed
-            'average_response_time': 0
-        } for agent_type in self.agents.keys()}
\ No newline at end of file
+        statistics = {}
+        for agent_type in self.agents.keys():
+            stats = self._agent_stats.get(agent_type, {'reviews_completed': 0, 'total_time': 0.0})
+            completed = stats['reviews_completed']
+            statistics[agent_type] = {
+                'reviews_completed': completed,
+                'average_response_time': stats['total_time'] / completed if completed else 0
+            }
+        return statistics
\ No newline at end of file
@@ -0,0 +1,135 @@
+# agents/scanners/pattern_engine.py
+from dataclasses import dataclass
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+import logging
+import re
+from utils.diff_parser import FileDiff
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class ScanRule:
+    """A security rule: a verification regex plus the literals any match must contain."""
+    name: str
+    pattern: str
+    severity: str
+    keywords: Tuple[str, ...]
+
+@dataclass(frozen=True)
+class ScanMatch:
+    rule: ScanRule
+    start: int
+    end: int
+    snippet: str
+
+DEFAULT_RULES: Tuple[ScanRule, ...] = (
+    ScanRule(
+        "hardcoded_secrets",
+        r"(?i)(password|secret|key|token|api_key).*?['\"]([^'\"\n]+)['\"]",
+        "HIGH",
+        ("password", "secret", "key", "token")
+    ),
+    ScanRule(
+        "sql_injection",
+        r"(?i)(execute|raw|cursor\.execute).*?\+",
+        "MEDIUM",
+        ("execute", "raw")
+    ),
+    ScanRule(
+        "xss_vulnerable",
+        r"(?i)innerHTML|document\.write\(",
+        "MEDIUM",
+        ("innerhtml", "document.write(")
+    ),
+    ScanRule(
+        "insecure_crypto",
+        r"(?i)(md5|sha1)\(",
+        "MEDIUM",
+        ("md5(", "sha1(")
+    ),
+    ScanRule(
+        "command_injection",
+        r"(?i)(exec|eval|system|popen)\(",
+        "HIGH",
+        ("exec(", "eval(", "system(", "popen(")
+    ),
+)
+
+class PatternScanEngine:
+    """
+    Scans content for every rule at once instead of once per rule.
+
+    A literal prefilter finds the rule keywords in the lowercased content
+    with str.find, which is far cheaper than running any regex, and records
+    which rules can match on which lines. Each rule's full regex then runs
+    only on the lines its keywords hit, so a rule never matches across
+    lines. The default rules are written to be single-line: a quoted
+    secret that spanned several diff lines used to match
+    hardcoded_secrets and no longer does, since such a "literal" is
+    almost always two unrelated quotes.
+    """
+
+    def __init__(self, rules: Sequence[ScanRule] = DEFAULT_RULES):
+        self.rules = tuple(rules)
+        self._compiled = [re.compile(rule.pattern) for rule in self.rules]
+        self._order = {rule.name: i for i, rule in enumerate(self.rules)}
+        self._keyword_rules: Dict[str, List[int]] = {}
+        for index, rule in enumerate(self.rules):
+            for keyword in rule.keywords:
+                self._keyword_rules.setdefault(keyword.lower(), []).append(index)
+        # Regex form of the prefilter for text whose length changes when lowercased
+        self._prefilter = re.compile(
+            "(?=(" + "|".join(re.escape(k) for k in self._keyword_rules) + "))", re.IGNORECASE
+        )
+
+    def _keyword_hits(self, content: str):
+        """Yields (position, keyword) for every keyword occurrence."""
+        lowered = content.lower()
+        if len(lowered) != len(content):
+            for hit in self._prefilter.finditer(content):
+                yield hit.start(), hit.group(1).lower()
+            return
+        for keyword in self._keyword_rules:
+            position = lowered.find(keyword)
+            while position >= 0:
+                yield position, keyword
+                position = lowered.find(keyword, position + 1)
+
+    def scan(self, content: str) -> List[ScanMatch]:
+        """Returns all rule matches in `content`, ordered by rule then position."""
+        candidates: Dict[int, Tuple[int, set]] = {}
+        for position, keyword in self._keyword_hits(content):
+            line_start = content.rfind('\n', 0, position) + 1
+            entry = candidates.get(line_start)
+            if entry is None:
+                line_end = content.find('\n', position)
+                entry = candidates[line_start] = (len(content) if line_end < 0 else line_end, set())
+            entry[1].update(self._keyword_rules[keyword])
+
+        matches: List[ScanMatch] = []
+        for line_start, (line_end, rule_indexes) in candidates.items():
+            for index in rule_indexes:
+                for match in self._compiled[index].finditer(content, line_start, line_end):
+                    matches.append(ScanMatch(self.rules[index], match.start(), match.end(), match.group(0)))
+        matches.sort(key=lambda m: (self._order[m.rule.name], m.start))
+        return matches
+
+    def scan_files(self, diffs: Mapping[str, FileDiff]) -> Dict[str, List[ScanMatch]]:
+        """Scans every file's diff content once."""
+        results = {}
+        for filename, diff in diffs.items():
+            try:
+                results[filename] = self.scan(diff.content)
+            except Exception as e:
+                logger.error(f"Error scanning {filename}: {e}")
+                results[filename] = []
+        return results
+
+_default_engine: Optional[PatternScanEngine] = None
+
+def get_default_engine() -> PatternScanEngine:
+    """Returns the shared engine compiled from DEFAULT_RULES."""
+    global _default_engine
+    if _default_engine is None:
+        _default_engine = PatternScanEngine()
+    return _default_engine
@@ -1,50 +1,55 @@
-from typing import Dict, List
-import re
+from typing import Dict, List, Mapping, Optional
 import logging
 from utils.diff_parser import FileDiff
+from agents.scanners.pattern_engine import PatternScanEngine, ScanMatch, get_default_engine
 
 logger = logging.getLogger(__name__)
 
 class VulnerabilityScanner:
     """Scanner for detecting security vulnerabilities in code."""
     
-    def __init__(self):
+    def __init__(self, engine: Optional[PatternScanEngine] = None):
+        self.engine = engine or get_default_engine()
         self.vulnerability_patterns = self._load_vulnerability_patterns()
         
-    async def scan(self, diffs: Dict[str, FileDiff]) -> List[Dict]:
-        """Scans code diffs for security vulnerabilities."""
+    async def scan(self, diffs: Mapping[str, FileDiff],
+                   matches: Optional[Mapping[str, List[ScanMatch]]] = None) -> List[Dict]:
+        """
+        Scans code diffs for security vulnerabilities.
+
+        Args:
+            diffs: File diffs to scan
+            matches: Engine matches already computed for these diffs, so a
+                caller that also needs them scans each file only once
+        """
         vulnerabilities = []
+        if matches is None:
+            matches = self.engine.scan_files(diffs)
         
         for filename, content in diffs.items():
-            file_vulnerabilities = await self._scan_content(filename, content)
+            file_vulnerabilities = await self._scan_content(filename, content, matches.get(filename, []))
             vulnerabilities.extend(file_vulnerabilities)
             
         return vulnerabilities
         
     def _load_vulnerability_patterns(self) -> Dict:
         """Loads known vulnerability patterns."""
-        # Using the same patterns defined in SecurityAgent
-        return {
-            "hardcoded_secrets": r"(?i)(password|secret|key|token|api_key).*?['\"]([^'\"]+)['\"]",
-            "sql_injection": r"(?i)(execute|raw|cursor\.execute).*?\+",
-            "xss_vulnerable": r"(?i)innerHTML|document\.write\(",
-            "insecure_crypto": r"(?i)(md5|sha1)\(",
-            "command_injection": r"(?i)(exec|eval|system|popen)\("
-        }
+        # Shared with SecurityAgent through the scan engine's rules
+        return {rule.name: rule.pattern for rule in self.engine.rules}
         
-    async def _scan_content(self, filename: str, diff_content: FileDiff) -> List[Dict]:
-        """Scans a single file's content for vulnerabilities."""
+    async def _scan_content(self, filename: str, diff_content: FileDiff, matches: List[ScanMatch]) -> List[Dict]:
+        """Turns a single file's engine matches into vulnerability findings."""
         vulnerabilities = []
+        locator = diff_content.line_locator
         
-        for vuln_type, pattern in self.vulnerability_patterns.items():
-            matches = re.finditer(pattern, diff_content.content)
-            for match in matches:
-                vulnerabilities.append({
-                    'type': vuln_type,
-                    'file': filename,
-                    'line': diff_content.content[:match.start()].count('\n') + 1,
-                    'severity': 'HIGH' if vuln_type in ["hardcoded_secrets", "command_injection"] else "MEDIUM",
-                    'description': f'Potential {vuln_type.replace("_", " ")} vulnerability detected'
-                })
+        for match in matches:
+            vuln_type = match.rule.name
+            vulnerabilities.append({
+                'type': vuln_type,
+                'file': filename,
+                'line': locator.new_line(match.start),
+                'severity': match.rule.severity,
+                'description': f'Potential {vuln_type.replace("_", " ")} vulnerability detected'
+            })
                 
-        return vulnerabilities 
\ No newline at end of file
+        return vulnerabilities 
@@ -1,20 +1,23 @@
-from typing import Dict, List
+from typing import Dict, List, Optional, Union
 from agents.base_review_agent import BaseReviewAgent
 from github.PullRequest import PullRequest
 from agents.scanners.vulnerability_scanner import VulnerabilityScanner
-from utils.diff_parser import FileDiff
+from agents.scanners.pattern_engine import ScanMatch, get_default_engine
+from utils.diff_parser import FileDiff, ParsedDiff
 import logging
-import re
 
 logger = logging.getLogger(__name__)
 
 class SecurityAgent(BaseReviewAgent):
+    agent_type = "security"
+
     def __init__(self):
         super().__init__()
+        self.scan_engine = get_default_engine()
         self.security_patterns = self._load_security_patterns()
-        self.vulnerability_scanner = VulnerabilityScanner()
+        self.vulnerability_scanner = VulnerabilityScanner(self.scan_engine)
         
-    async def review_security(self, pr: PullRequest, diff: str, previous_comments: str) -> Dict:
+    async def review_security(self, pr: PullRequest, diff: Union[str, ParsedDiff], previous_comments: str) -> Dict:
         """Reviews code for security vulnerabilities and best practices."""
         try:
             # Get relevant files for security review
@@ -32,13 +35,16 @@ class SecurityAgent(BaseReviewAgent):
                 "severity_score": 0.0
             }
             
+            # Scan every file once; both checks below read from the same matches
+            matches = self.scan_engine.scan_files(relevant_diffs)
+            
             # Scan for known vulnerabilities
-            scan_results = await self.vulnerability_scanner.scan(relevant_diffs)
+            scan_results = await self.vulnerability_scanner.scan(relevant_diffs, matches)
             results["vulnerabilities"].extend(scan_results)
             
             # Check for security patterns
             for filename, diff_content in relevant_diffs.items():
-                pattern_matches = await self._check_security_patterns(filename, diff_content)
+                pattern_matches = await self._check_security_patterns(filename, diff_content, matches.get(filename))
                 results["security_smells"].extend(pattern_matches)
             
             # Calculate severity score
@@ -53,28 +59,36 @@ class SecurityAgent(BaseReviewAgent):
             logger.error(f"Error in security review: {e}", exc_info=True)
             return {"status": "error", "message": str(e)}
 
+    def merge_cached_results(self, review: Optional[Dict], findings: Dict[str, List[Dict]],
+                             reviews: List[str]) -> Optional[Dict]:
+        """Adds cached findings and recomputes the score and recommendations from the combined lists."""
+        if not findings and review is not None:
+            return review
+        if not isinstance(review, dict) or review.get('status') == 'no_files':
+            review = {"vulnerabilities": [], "security_smells": [], "recommendations": [], "severity_score": 0.0}
+        results = super().merge_cached_results(review, findings, reviews)
+        results["severity_score"] = self._calculate_severity_score(results)
+        results["recommendations"] = self._generate_security_recommendations(results)
+        return results
+
     def _load_security_patterns(self) -> Dict:
         """Loads security patterns and anti-patterns."""
-        return {
-            "hardcoded_secrets": r"(?i)(password|secret|key|token|api_key).*?['\"]([^'\"]+)['\"]",
-            "sql_injection": r"(?i)(execute|raw|cursor\.execute).*?\+",
-            "xss_vulnerable": r"(?i)innerHTML|document\.write\(",
-            "insecure_crypto": r"(?i)(md5|sha1)\(",
-            "command_injection": r"(?i)(exec|eval|system|popen)\("
-        }
+        return {rule.name: rule.pattern for rule in self.scan_engine.rules}
 
-    async def _check_security_patterns(self, filename: str, diff_content: FileDiff) -> List[Dict]:
+    async def _check_security_patterns(self, filename: str, diff_content: FileDiff,
+                                       scan_matches: Optional[List[ScanMatch]] = None) -> List[Dict]:
         """Checks for security anti-patterns in the code."""
+        if scan_matches is None:
+            scan_matches = self.scan_engine.scan(diff_content.content)
         matches = []
-        for pattern_name, pattern in self.security_patterns.items():
-            for match in re.finditer(pattern, diff_content.content):
-                matches.append({
-                    "type": pattern_name,
-                    "file": filename,
-                    "line": self._get_line_number(diff_content, match.start()),
-                    "snippet": match.group(0),
-                    "severity": "HIGH" if pattern_name in ["hardcoded_secrets", "command_injection"] else "MEDIUM"
-                })
+        for match in scan_matches:
+            matches.append({
+                "type": match.rule.name,
+                "file": filename,
+                "line": self._get_line_number(diff_content, match.start),
+                "snippet": match.snippet,
+                "severity": match.rule.severity
+            })
         return matches
 
     def _calculate_severity_score(self, results: Dict) -> float:
@@ -112,25 +126,10 @@ class SecurityAgent(BaseReviewAgent):
             
         return recommendations
 
-    def _get_line_number(self, diff_content: FileDiff, match_position: int) -> int:
-        """Calculate the actual line number in the file from a position in the diff."""
+    def _get_line_number(self, diff_content: FileDiff, match_position: int) -> Optional[int]:
+        """Calculate the actual line number in the file from a position in the diff; None on a removed line."""
         try:
-            # Split content up to the match position
-            content_before = diff_content.content[:match_position]
-            # Count the number of newlines
-            line_count = content_before.count('\n') + 1
-            
-            # Parse the @@ headers to get the starting line number
-            hunk_headers = re.finditer(r'@@ -\d+,\d+ \+(\d+),\d+ @@', diff_content.content)
-            start_line = 1
-            
-            for header in hunk_headers:
-                header_pos = header.start()
-                if header_pos > match_position:
-                    break
-                start_line = int(header.group(1))
-            
-            return start_line + line_count - 1
+            return diff_content.line_locator.new_line(match_position)
         except Exception as e:
             logger.error(f"Error calculating line number: {e}")
             return 0
\ No newline at end of file
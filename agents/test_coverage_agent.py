@@ -1,8 +1,11 @@
 # agents/test_coverage_agent.py
-from typing import Dict, List
+from typing import Dict, List, Union
 from agents.base_review_agent import BaseReviewAgent
+from utils.diff_parser import ParsedDiff
 from github.PullRequest import PullRequest
 from utils.github_helper import get_test_coverage
+from prompts.prompt_templates import create_shared_review_prefix
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
@@ -10,10 +13,12 @@ logger = logging.getLogger(__name__)
 class TestCoverageAgent(BaseReviewAgent):
     """Agent for reviewing test coverage and suggesting test improvements."""
 
+    agent_type = "test_coverage"
+
     def __init__(self):
         super().__init__()
 
-    async def review_test_coverage(self, pr: PullRequest, diff: str, previous_comments: str) -> str:
+    async def review_test_coverage(self, pr: PullRequest, diff: Union[str, ParsedDiff], previous_comments: str) -> str:
         """
         Reviews test coverage in the pull request.
         
@@ -36,13 +41,14 @@ class TestCoverageAgent(BaseReviewAgent):
             if not relevant_diffs:
                 return "No testable files found to review."
 
-            formatted_diff = await self.format_diff_for_review(relevant_diffs)
-            
             # Get test coverage analysis
-            coverage_analysis = get_test_coverage(pr)
-            prompt = self.create_test_coverage_prompt(formatted_diff, previous_comments, coverage_analysis)
+            coverage_analysis = await asyncio.to_thread(get_test_coverage, pr)
             
-            response = await self.llm.call(prompt)
+            response = await self.review_with_budget(
+                relevant_diffs, previous_comments,
+                self.create_test_coverage_instructions(coverage_analysis),
+                shared_diff=diff
+            )
             if not response or not response.strip():
                 logger.error("Empty test coverage review generated.")
                 return "Error: Test coverage review returned an empty response."
@@ -53,19 +59,16 @@ class TestCoverageAgent(BaseReviewAgent):
 
     def create_test_coverage_prompt(self, diff: str, previous_comments: str, analysis: Dict) -> str:
         """Creates a prompt for test coverage review."""
+        return create_shared_review_prefix(diff, previous_comments) + self.create_test_coverage_instructions(analysis)
+
+    def create_test_coverage_instructions(self, analysis: Dict) -> str:
+        """Creates the test coverage instructions that follow the shared prefix."""
         prompt = f"""
         You are an expert test coverage reviewer. Your task is to ensure adequate test coverage for code changes.
 
         **Coverage Analysis:**
         {self._format_coverage_summary(analysis.get('summary', {}))}
 
-        **Files Changed:**
-        {diff}
-
-        **Context:**
-        Previous comments on this pull request:
-        {previous_comments}
-
         **Instructions:**
         1. Review the test coverage analysis and changed files
         2. Identify areas requiring additional tests:
@@ -0,0 +1,87 @@
+# benchmarks/bench_backend_pool.py
+"""
+Runs the same batch of LLM calls against one mock Ollama server and then
+against a pool of several, and exercises failover: one server is stopped
+mid-batch, ejected after repeated failures, and re-admitted by the health
+checks once it is back.
+
+Servers run in realtime mode with --parallel slots each, so throughput
+scales only with the number of backends the pool spreads calls over.
+
+Usage: python benchmarks/bench_backend_pool.py [--servers 3] [--calls 60] [--parallel 1]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GITHUB_TOKEN", "benchmark")
+os.environ["LLM_CACHE_ENABLED"] = "false"
+
+from benchmarks.mock_ollama import MockOllamaServer
+from llm.backend_pool import BackendPool
+from llm.ollama_llm import OllamaLLM
+from llm.scheduler import LLMScheduler
+from llm.session_pool import close_session_pool
+
+def client(urls, parallel: int) -> OllamaLLM:
+    backends = BackendPool(urls, parallel=parallel, health_interval=0.2, health_timeout=1)
+    scheduler = LLMScheduler(max_in_flight=backends.capacity, max_queue=0, queue_timeout=0)
+    return OllamaLLM(scheduler=scheduler, backends=backends)
+
+async def batch(llm: OllamaLLM, calls: int, tag: str) -> tuple:
+    start = time.perf_counter()
+    results = await asyncio.gather(*(llm.call(f"{tag} {i} " + "x" * 4000) for i in range(calls)))
+    errors = sum(r.startswith("Error:") for r in results)
+    return time.perf_counter() - start, errors
+
+async def main(count: int, calls: int, parallel: int):
+    servers = [MockOllamaServer(response_text="Looks good overall.", num_parallel=parallel,
+                                prompt_eval_ns=50_000, eval_ns=20_000_000, realtime=True)
+               for _ in range(count)]
+    for server in servers:
+        await server.start()
+    urls = [s.url for s in servers]
+    try:
+        single = client(urls[:1], parallel)
+        seconds, _ = await batch(single, calls, "single")
+        print(f"  1 backend    {calls} calls in {seconds:5.2f}s")
+
+        pool = client(urls, parallel)
+        seconds, errors = await batch(pool, calls, "pool")
+        spread = Counter({b["url"]: b["requests"] for b in pool.backends.stats()})
+        print(f"  {count} backends   {calls} calls in {seconds:5.2f}s  errors={errors}  "
+              f"per backend={sorted(spread.values())}")
+
+        # Take one server down halfway through a batch
+        victim = servers[-1]
+        port = victim.port
+        task = asyncio.create_task(batch(pool, calls, "failover"))
+        await asyncio.sleep(seconds / 3)
+        await victim.stop()
+        seconds, errors = await task
+        down = pool.backends.stats()[-1]
+        print(f"  failover     {calls} calls in {seconds:5.2f}s  errors={errors}  "
+              f"stopped backend healthy={down['healthy']} ejections={down['ejections']}")
+
+        await victim.start(port)
+        for backend in pool.backends.backends:
+            backend.ejected_until = 0
+        await asyncio.sleep(0.5)
+        print(f"  restarted    stopped backend healthy={pool.backends.stats()[-1]['healthy']}")
+        await pool.backends.close()
+    finally:
+        await close_session_pool()
+        for server in servers:
+            await server.stop()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--servers", type=int, default=3)
+    parser.add_argument("--calls", type=int, default=60)
+    parser.add_argument("--parallel", type=int, default=1)
+    args = parser.parse_args()
+    asyncio.run(main(args.servers, args.calls, args.parallel))
@@ -0,0 +1,115 @@
+# benchmarks/bench_cascade.py
+"""
+Reviews one PR through the orchestrator with and without cascade mode and
+compares wall time and prompt tokens evaluated by the expensive agents.
+
+The synthetic PR mixes reformatted code, renames, import and comment
+changes with a few real logic changes, the way refactoring PRs usually
+look. The mock server runs in realtime mode, so requests take as long as
+their modelled prompt evaluation and generation.
+
+Usage: python benchmarks/bench_cascade.py [--files 30] [--prompt-eval-us 400]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GITHUB_TOKEN", "benchmark")
+os.environ["LLM_CACHE_ENABLED"] = "false"
+os.environ["OLLAMA_PREFIX_REUSE"] = "false"
+
+from benchmarks.mock_ollama import MockOllamaServer
+from agents.base_review_agent import BaseReviewAgent
+from agents.review_orchestrator import ReviewContext, ReviewOrchestrator
+from llm.session_pool import close_session_pool
+from utils.diff_parser import ParsedDiff
+from utils.hunk_triage import HunkTriage
+
+class BenchAgent(BaseReviewAgent):
+    """Stands in for the code quality and test coverage agents without their GitHub lookups."""
+
+    def __init__(self, agent_type: str, url: str):
+        self.agent_type = agent_type
+        super().__init__()
+        self.llm.base_url = url
+
+    async def _review(self, pr, diff: ParsedDiff, previous_comments: str) -> str:
+        if not diff:
+            return "No code files found to review."
+        return await self.review_with_budget(diff, previous_comments, f"Review the changes for {self.agent_type}.",
+                                             shared_diff=diff)
+
+    review_code_quality = review_test_coverage = _review
+
+def hunk(start: int, removed: list, added: list) -> str:
+    header = f"@@ -{start},{len(removed)} +{start},{len(added)} @@"
+    return "\n".join([header] + [f"-{l}" for l in removed] + [f"+{l}" for l in added])
+
+def synthetic_diff(files: int) -> ParsedDiff:
+    parts = []
+    for i in range(files):
+        body = [f"    total_{j} = compute(items, {j})" for j in range(12)]
+        hunks = [
+            hunk(1, ["import os", "import sys"], ["import os", "import re", "import sys"]),
+            hunk(20, body, [line.replace(" = ", " =  ").rstrip() + " " for line in body]),
+            hunk(60, [line for line in body[:8]], [line.replace("items", "records") for line in body[:8]]),
+            hunk(90, ["# Computes the totals"], ["# Computes the totals for every record"]),
+        ]
+        if i % 5 == 0:
+            hunks.append(hunk(120, ["    return total_0"], [
+                "    if not records:",
+                "        raise ValueError('no records')",
+                "    for record in records:",
+                "        if record.weight > limit:",
+                "            total_0 += record.weight",
+                "    return total_0",
+            ]))
+        parts.append(f"diff --git a/pkg/mod{i}.py b/pkg/mod{i}.py\n--- a/pkg/mod{i}.py\n+++ b/pkg/mod{i}.py\n"
+                     + "\n".join(hunks))
+    return ParsedDiff.from_text("\n".join(parts))
+
+async def review(url: str, diff: ParsedDiff, cascade) -> tuple:
+    orchestrator = ReviewOrchestrator(cascade=cascade)
+    if cascade is None:
+        orchestrator.cascade = None
+    for agent_type in ("code_quality", "test_coverage"):
+        orchestrator.register_agent(agent_type, BenchAgent(agent_type, url))
+    context = ReviewContext(None, None, "", parsed_diff=diff)
+    start = time.perf_counter()
+    results = await orchestrator.conduct_review(context)
+    seconds = time.perf_counter() - start
+    tokens = sum(m.get("llm_prompt_eval_tokens", 0) for m in context.agent_metrics.values())
+    return seconds, tokens, results
+
+async def main(files: int, prompt_eval_us: int):
+    server = MockOllamaServer(response_text="Looks good overall.", num_parallel=1,
+                              prompt_eval_ns=prompt_eval_us * 1000, eval_ns=5_000_000, realtime=True)
+    await server.start()
+    try:
+        diff = synthetic_diff(files)
+        hunks = sum(len(d.hunks) for d in diff.values())
+        print(f"Synthetic PR: {len(diff)} files, {hunks} hunks")
+        base_seconds, base_tokens, _ = await review(server.url, diff, None)
+        print(f"  full review     {base_seconds:6.2f}s  prompt tokens={base_tokens}")
+        seconds, tokens, results = await review(server.url, diff, HunkTriage())
+        report = results.get("cascade", {})
+        print(f"  cascade review  {seconds:6.2f}s  prompt tokens={tokens}  "
+              f"skipped {report.get('skipped')}/{report.get('hunks')} hunks "
+              f"({report.get('skipped_fraction', 0):.0%}), triage {report.get('triage_seconds', 0) * 1000:.1f}ms")
+        print(f"  estimated saving {report.get('seconds_saved_estimated')}s, "
+              f"measured {base_seconds - seconds:.2f}s ({base_seconds / seconds:.2f}x faster)")
+        for reason, count in sorted(report.get("skipped_reasons", {}).items()):
+            print(f"    {count:4d}  {reason}")
+    finally:
+        await close_session_pool()
+        await server.stop()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--files", type=int, default=30)
+    parser.add_argument("--prompt-eval-us", type=int, default=400)
+    args = parser.parse_args()
+    asyncio.run(main(args.files, args.prompt_eval_us))
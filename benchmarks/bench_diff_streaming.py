@@ -0,0 +1,153 @@
+# benchmarks/bench_diff_streaming.py
+"""
+Compares peak RSS and throughput of parsing a large diff held in memory as
+one string against parsing it incrementally, line by line from a file and
+chunk by chunk from an async byte stream.
+
+The synthetic diff mixes many small source files with a few lockfile-sized
+ones, like a vendoring PR. Each mode runs in a fresh subprocess so peak RSS
+is measured independently.
+
+Usage: python benchmarks/bench_diff_streaming.py [--mb 200]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GITHUB_TOKEN", "benchmark")
+
+from utils.diff_parser import DiffParser, ParsedDiff
+
+CHUNK_SIZE = 64 * 1024
+MAX_FILE_BYTES = 4 * 1024 * 1024
+MODES = ("text", "stream", "async")
+
+SOURCE_LINES = [
+    "+    total = compute_total(items, discount)",
+    "+    for item in items:",
+    "     return render(request, 'index.html', context)",
+    "-    logger.info(f'Processing {len(items)} items')",
+    "+    config = load_settings(path)",
+]
+
+def write_synthetic_diff(path: str, target_bytes: int):
+    """Writes a diff of roughly `target_bytes` without building it in memory."""
+    rng = random.Random(7)
+    written = 0
+    index = 0
+    with open(path, "w") as out:
+        while written < target_bytes:
+            index += 1
+            if index % 50 == 0:
+                # Lockfile-like file: one hunk of ~12 MB of added lines
+                lines = 120_000
+                header = f"diff --git a/vendor/lock{index}.json b/vendor/lock{index}.json\n" \
+                         f"new file mode 100644\n--- /dev/null\n+++ b/vendor/lock{index}.json\n" \
+                         f"@@ -0,0 +1,{lines} @@\n"
+                body = "".join(
+                    f'+    "package-{index}-{i}": {{"version": "1.{i % 97}.0", "integrity": "sha512-{i:032x}"}},\n'
+                    for i in range(lines)
+                )
+            else:
+                lines = rng.randint(20, 400)
+                header = f"diff --git a/src/mod{index}.py b/src/mod{index}.py\n" \
+                         f"--- a/src/mod{index}.py\n+++ b/src/mod{index}.py\n" \
+                         f"@@ -1,{lines} +1,{lines} @@\n"
+                body = "".join(line.replace('-', ' ', 1) + "\n" for line in rng.choices(SOURCE_LINES, k=lines))
+            out.write(header)
+            out.write(body)
+            written += len(header) + len(body)
+
+def summarize(files) -> dict:
+    count = added = removed = truncated = 0
+    for diff in files:
+        count += 1
+        added += diff.added_lines
+        removed += diff.removed_lines
+        truncated += diff.truncated
+    return {"files": count, "added": added, "removed": removed, "truncated": truncated}
+
+def peak_rss_mb() -> float:
+    """
+    Peak RSS of this process. Prefers VmHWM, which starts fresh at exec;
+    ru_maxrss on Linux carries over the parent's high-water mark.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+async def read_chunks(path: str):
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+async def async_summary(path: str) -> dict:
+    summaries = []
+    async for diff in DiffParser.aiter_files(read_chunks(path), MAX_FILE_BYTES):
+        summaries.append(summarize([diff]))
+    return {key: sum(s[key] for s in summaries) for key in ("files", "added", "removed", "truncated")}
+
+def run_mode(mode: str, path: str) -> dict:
+    baseline_mb = peak_rss_mb()
+    start = time.perf_counter()
+    if mode == "text":
+        # Previous behaviour: the whole diff as one string, every file kept
+        with open(path) as f:
+            text = f.read()
+        result = summarize(ParsedDiff.from_text(text).values())
+    elif mode == "stream":
+        with open(path) as f:
+            result = summarize(DiffParser.iter_files(f, MAX_FILE_BYTES))
+    else:
+        result = asyncio.run(async_summary(path))
+    elapsed = time.perf_counter() - start
+    result.update({
+        "mode": mode,
+        "seconds": elapsed,
+        "baseline_mb": baseline_mb,
+        "peak_mb": peak_rss_mb(),
+    })
+    return result
+
+def main(mb: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "synthetic.diff")
+        write_synthetic_diff(path, mb * 1024 * 1024)
+        size_mb = os.path.getsize(path) / 1e6
+        print(f"synthetic diff: {size_mb:.1f} MB")
+        for mode in MODES:
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--mode", mode, "--path", path],
+                capture_output=True, text=True, check=True
+            ).stdout
+            r = json.loads(out)
+            print(f"  {mode:6s}  peak RSS {r['peak_mb']:7.1f} MB (+{r['peak_mb'] - r['baseline_mb']:.1f} over baseline)"
+                  f"  {r['seconds']:6.2f}s  {size_mb / r['seconds']:6.1f} MB/s"
+                  f"  files={r['files']} added={r['added']} truncated={r['truncated']}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--mb", type=int, default=200)
+    parser.add_argument("--mode", choices=MODES)
+    parser.add_argument("--path")
+    args = parser.parse_args()
+    if args.mode:
+        print(json.dumps(run_mode(args.mode, args.path)))
+    else:
+        main(args.mb)
@@ -0,0 +1,72 @@
+# benchmarks/bench_llm_scheduler.py
+"""
+Measures how long a small interactive review waits when it arrives just
+after a backfill of large prompts from several repositories, with every
+call sent straight to Ollama (which queues them in arrival order) and with
+the LLM scheduler admitting only OLLAMA_NUM_PARALLEL requests at a time.
+
+The mock server runs in realtime mode: requests take their modelled prompt
+evaluation and generation time and at most --parallel run at once.
+
+Usage: python benchmarks/bench_llm_scheduler.py [--parallel 2] [--backfill 30]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GITHUB_TOKEN", "benchmark")
+os.environ["LLM_CACHE_ENABLED"] = "false"
+
+from benchmarks.mock_ollama import MockOllamaServer
+from llm.call_context import CallContext, use_call_context
+from llm.ollama_llm import OllamaLLM
+from llm.scheduler import BACKFILL, INTERACTIVE, LLMScheduler
+from llm.session_pool import close_session_pool
+
+AGENT_CALLS = 4
+
+async def review(llm: OllamaLLM, repo: str, priority: str, size: int, prompt_chars: int) -> float:
+    """One review's agent calls, issued concurrently; returns its wall time."""
+    start = time.perf_counter()
+    with use_call_context(CallContext(agent="bench", repo=repo, priority=priority, size=size)):
+        await asyncio.gather(*(
+            llm.call(f"{repo} agent {i} " + "x" * prompt_chars) for i in range(AGENT_CALLS)
+        ))
+    return time.perf_counter() - start
+
+async def run(url: str, max_in_flight: int, backfill: int) -> dict:
+    llm = OllamaLLM(scheduler=LLMScheduler(max_in_flight=max_in_flight, max_queue=0, queue_timeout=0))
+    llm.base_url = url
+    start = time.perf_counter()
+    backfills = [
+        asyncio.create_task(review(llm, f"org/repo{i % 3}", BACKFILL, 20_000, 40_000))
+        for i in range(backfill)
+    ]
+    await asyncio.sleep(0.05)
+    interactive = await review(llm, "org/app", INTERACTIVE, 40, 2_000)
+    await asyncio.gather(*backfills)
+    return {"interactive": interactive, "makespan": time.perf_counter() - start}
+
+async def main(parallel: int, backfill: int):
+    server = MockOllamaServer(response_text="Looks good overall.", num_parallel=parallel,
+                              prompt_eval_ns=20_000, eval_ns=20_000_000, realtime=True)
+    await server.start()
+    print(f"{backfill} backfill reviews x {AGENT_CALLS} calls, then 1 interactive review; "
+          f"server runs {parallel} requests at once")
+    try:
+        for label, limit in (("direct", 1_000_000), ("scheduled", parallel)):
+            r = await run(server.url, limit, backfill)
+            print(f"  {label:9s}  interactive review {r['interactive']:6.2f}s  all reviews {r['makespan']:6.2f}s")
+    finally:
+        await close_session_pool()
+        await server.stop()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--parallel", type=int, default=2)
+    parser.add_argument("--backfill", type=int, default=30)
+    args = parser.parse_args()
+    asyncio.run(main(args.parallel, args.backfill))
@@ -0,0 +1,132 @@
+# benchmarks/bench_prompt_prefix.py
+"""
+Compares Ollama prompt evaluation for one PR reviewed by the four LLM
+agents, using the previous per-agent prompt layouts (instructions first,
+each agent's own file subset) and the shared diff-first prefix that is
+primed once and reused through Ollama's `context`.
+
+Priming is what OllamaLLM does with OLLAMA_PREFIX_REUSE=true (off by
+default); with it off, the shared prefix is sent inline and the server's
+own prefix cache provides the reuse.
+
+Totals come from Ollama's own response timings (prompt_eval_count and
+prompt_eval_duration), including the priming request. Runs against a real
+server with --url, otherwise against the mock server, which models
+Ollama's per-slot prefix cache.
+
+Usage: python benchmarks/bench_prompt_prefix.py [--url http://localhost:11434] [--model llama3:latest] [--files 20]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GITHUB_TOKEN", "benchmark")
+os.environ["LLM_CACHE_ENABLED"] = "false"
+
+from benchmarks.mock_ollama import MockOllamaServer
+from agents.base_review_agent import BaseReviewAgent
+from llm.ollama_llm import OllamaLLM
+from llm.session_pool import close_session_pool, get_session_pool
+from prompts.prompt_templates import (
+    create_shared_review_prefix,
+    create_code_quality_instructions,
+    create_documentation_review_instructions
+)
+from utils.diff_parser import ParsedDiff
+
+COMMENTS = "Please keep the public API backwards compatible.\nConsider adding tests for the parser."
+OPTIONS = {"temperature": 0.2, "num_ctx": 8192}
+
+def synthetic_diff(files: int) -> ParsedDiff:
+    rng = random.Random(3)
+    words = ["total", "items", "config", "parse", "render", "result", "value", "cache", "index", "path"]
+    parts = []
+    for i in range(files):
+        lines = [f"+    {rng.choice(words)}_{j} = {rng.choice(words)}({rng.choice(words)}, {j})" for j in range(40)]
+        parts.append(f"diff --git a/pkg/mod{i}.py b/pkg/mod{i}.py\n@@ -1,0 +1,40 @@\n" + "\n".join(lines))
+    parts.append("diff --git a/README.md b/README.md\n@@ -1,0 +1,2 @@\n+# Usage\n+Run the parser.")
+    parts.append("diff --git a/requirements.txt b/requirements.txt\n@@ -1 +1 @@\n-requests==2.30.0\n+requests==2.31.0")
+    return ParsedDiff.from_text("\n".join(parts))
+
+def legacy_prompts(formatted) -> list:
+    """The layouts agents used before: instructions or analysis ahead of their own file subset."""
+    code = formatted(["*.py"])
+    return [
+        f"\n    You are an expert code reviewer. Your task is to analyze code changes for quality and suggest improvements."
+        f"\n\n    **Code Analysis:**\n    Files Changed: 20\n\n    **Files Changed:**\n    {code}\n\n    **Context:**\n"
+        f"    Previous comments on this pull request:\n    {COMMENTS}\n\n    Please provide your review below:\n",
+        f"\n    You are an expert documentation reviewer.\n\n    **Context:**\n    Previous comments on this pull request:\n"
+        f"    {COMMENTS}\n\n    **Code Diff for Documentation Review:**\n    {formatted(['*.py', '*.md'])}\n\n"
+        f"    Please provide your review below:\n",
+        f"\n        You are an expert test coverage reviewer.\n\n        **Coverage Analysis:**\n        - Total Source Files: 20\n\n"
+        f"        **Files Changed:**\n        {code}\n\n        **Context:**\n        {COMMENTS}\n\n        Please provide your review below:\n",
+        f"\n        You are an expert dependency reviewer.\n\n        **Dependency Analysis:**\n        Changes Summary:\n\n"
+        f"        **Files Changed:**\n        {formatted(['requirements.txt'])}\n\n        **Context:**\n        {COMMENTS}\n\n"
+        f"        Please provide your review below:\n",
+    ]
+
+async def generate(llm: OllamaLLM, prompt: str, options: dict, context=None) -> dict:
+    session = get_session_pool().get_session()
+    async with session.post(f"{llm.base_url}/api/generate",
+                            json=llm._payload(prompt, options, stream=False, context=context)) as response:
+        response.raise_for_status()
+        return await response.json()
+
+def total(results: list) -> tuple:
+    return (sum(r.get("prompt_eval_count", 0) for r in results),
+            sum(r.get("prompt_eval_duration", 0) for r in results) / 1e9)
+
+async def run(llm: OllamaLLM, files: int):
+    diff = synthetic_diff(files)
+    agent = BaseReviewAgent()
+    subsets = {tuple(p): await agent.format_diff_for_review(diff.select(p))
+               for p in (["*.py"], ["*.py", "*.md"], ["requirements.txt"])}
+    before = [await generate(llm, prompt, OPTIONS) for prompt in legacy_prompts(lambda p: subsets[tuple(p)])]
+
+    prefix = create_shared_review_prefix(await agent.format_diff_for_review(diff), COMMENTS)
+    # Same request OllamaLLM sends to prime a prefix
+    primed = await generate(llm, prefix, {**OPTIONS, "num_predict": 1})
+    suffixes = [
+        create_code_quality_instructions({"summary": {"files_changed": files}}),
+        create_documentation_review_instructions(),
+        "\n        You are an expert test coverage reviewer.\n\n        Please provide your review below:\n",
+        "\n        You are an expert dependency reviewer.\n\n        Please provide your review below:\n",
+    ]
+    after = [primed] + [await generate(llm, suffix, OPTIONS, context=primed["context"]) for suffix in suffixes]
+
+    for label, results in (("before", before), ("after", after)):
+        tokens, seconds = total(results)
+        print(f"  {label:6s}  {len(results)} requests  prompt_eval_count={tokens:6d}  prompt_eval_duration={seconds:7.3f}s")
+    (bt, bs), (at, as_) = total(before), total(after)
+    if at and as_:
+        print(f"  prompt tokens evaluated: {bt / at:.2f}x fewer, prompt eval time: {bs / as_:.2f}x less")
+
+async def main(url: str, model: str, files: int):
+    server = None
+    llm = OllamaLLM()
+    llm.model = model
+    if url:
+        llm.base_url = url
+        print(f"Ollama at {url}, model {model}")
+    else:
+        server = MockOllamaServer(response_text="Looks good overall.")
+        await server.start()
+        llm.base_url = server.url
+        print("Mock Ollama (1 slot, simulated prefix cache)")
+    try:
+        await run(llm, files)
+    finally:
+        await close_session_pool()
+        if server is not None:
+            await server.stop()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", default="")
+    parser.add_argument("--model", default="llama3:latest")
+    parser.add_argument("--files", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main(args.url, args.model, args.files))
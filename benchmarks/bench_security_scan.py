@@ -0,0 +1,74 @@
+# benchmarks/bench_security_scan.py
+"""
+Compares the shared single-pass scan engine with the previous approach of
+running each security regex separately in both SecurityAgent and
+VulnerabilityScanner, over a large synthetic diff.
+
+Usage: python benchmarks/bench_security_scan.py [--files 200] [--lines 2000]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GITHUB_TOKEN", "benchmark")
+
+from agents.scanners.pattern_engine import DEFAULT_RULES, PatternScanEngine
+
+LINES = [
+    "+    total = compute_total(items, discount)",
+    "+    for item in items:",
+    "     return render(request, 'index.html', context)",
+    "-    logger.info(f'Processing {len(items)} items')",
+    "+    config = load_settings(path)",
+    "+    password = 'hunter2'",
+    "+    cursor.execute('SELECT * FROM t WHERE id=' + user_id)",
+    "+    el.innerHTML = html",
+    "+    digest = md5(data).hexdigest()",
+    "+    os.system(cmd)",
+]
+# Mostly benign lines with an occasional finding, like real diffs
+WEIGHTS = [30, 30, 30, 30, 30, 1, 1, 1, 1, 1]
+
+def synthetic_file(lines: int, rng: random.Random) -> str:
+    body = [f"diff --git a/f.py b/f.py", "@@ -1,{0} +1,{0} @@".format(lines)]
+    body.extend(rng.choices(LINES, weights=WEIGHTS, k=lines))
+    return "\n".join(body)
+
+def legacy_scan(content: str) -> int:
+    """Both consumers each ran every pattern over the whole content."""
+    found = 0
+    for _consumer in range(2):
+        for rule in DEFAULT_RULES:
+            for _ in re.finditer(rule.pattern, content):
+                found += 1
+    return found // 2
+
+def main(files: int, lines: int):
+    rng = random.Random(42)
+    contents = [synthetic_file(lines, rng) for _ in range(files)]
+    size_mb = sum(len(c) for c in contents) / 1e6
+    engine = PatternScanEngine()
+
+    start = time.perf_counter()
+    legacy_found = sum(legacy_scan(c) for c in contents)
+    legacy = time.perf_counter() - start
+
+    start = time.perf_counter()
+    engine_found = sum(len(engine.scan(c)) for c in contents)
+    single = time.perf_counter() - start
+
+    print(f"{files} files, {files * lines} lines, {size_mb:.1f} MB")
+    print(f"   legacy (10 passes): {legacy:.3f}s  {size_mb / legacy:.1f} MB/s  {legacy_found} matches")
+    print(f"   engine (1 pass):    {single:.3f}s  {size_mb / single:.1f} MB/s  {engine_found} matches")
+    print(f"   speedup: {legacy / single:.1f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--lines", type=int, default=2000)
+    args = parser.parse_args()
+    main(args.files, args.lines)
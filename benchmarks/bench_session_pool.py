@@ -0,0 +1,67 @@
+# benchmarks/bench_session_pool.py
+"""
+Measures per-call HTTP overhead of OllamaLLM with a shared connection pool
+versus opening a fresh aiohttp.ClientSession for every call.
+
+Usage: python benchmarks/bench_session_pool.py [--calls 500] [--concurrency 5]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GITHUB_TOKEN", "benchmark")
+# Every call must reach the server for the comparison to be meaningful
+os.environ["LLM_CACHE_ENABLED"] = "false"
+
+import aiohttp
+from benchmarks.mock_ollama import MockOllamaServer
+from llm.ollama_llm import OllamaLLM
+from llm.session_pool import close_session_pool
+
+async def _unpooled_call(base_url: str, prompt: str) -> str:
+    """The pre-pool behaviour: one ClientSession per prompt."""
+    async with aiohttp.ClientSession() as session:
+        async with session.post(
+            f"{base_url}/api/generate",
+            json={"model": "llama3:latest", "prompt": prompt, "stream": False}
+        ) as response:
+            result = await response.json()
+            return result["response"]
+
+async def _run(calls: int, concurrency: int, call) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        async with semaphore:
+            await call(f"prompt {i}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(calls)))
+    return time.perf_counter() - start
+
+async def main(calls: int, concurrency: int):
+    for label in ("unpooled", "pooled"):
+        server = MockOllamaServer()
+        await server.start()
+        try:
+            if label == "pooled":
+                llm = OllamaLLM()
+                llm.base_url = server.url
+                elapsed = await _run(calls, concurrency, llm.call)
+                await close_session_pool()
+            else:
+                elapsed = await _run(calls, concurrency, lambda p: _unpooled_call(server.url, p))
+            print(f"{label:>9}: {calls} calls in {elapsed:.3f}s "
+                  f"({elapsed / calls * 1000:.3f} ms/call, {server.connections} TCP connections)")
+        finally:
+            await server.stop()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(main(args.calls, args.concurrency))
@@ -0,0 +1,177 @@
+# benchmarks/mock_ollama.py
+from typing import Dict, List, Optional
+import asyncio
+import json
+import logging
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+class MockOllamaServer:
+    """
+    Minimal local stand-in for the Ollama HTTP API used by benchmarks.
+
+    Non-streaming responses carry Ollama's timing fields and a `context`.
+    Prompt evaluation is modelled like Ollama's runner: each of `num_parallel`
+    slots keeps the tokens it last processed, a request is placed in the slot
+    sharing the longest token prefix, and only the tokens after that prefix
+    count toward prompt_eval_count (at `prompt_eval_ns` per token). Tokens
+    are fixed 4-character pieces.
+
+    With `realtime`, requests take as long as their modelled durations and
+    at most `num_parallel` run at once; the rest wait in arrival order, as
+    in Ollama's own queue.
+    """
+
+    def __init__(self, response_text: str = "LGTM", latency: float = 0.0, model: str = "llama3:latest",
+                 token_delay: float = 0.0, num_parallel: int = 1, prompt_eval_ns: int = 200_000,
+                 eval_ns: int = 20_000_000, realtime: bool = False):
+        self.response_text = response_text
+        self.num_parallel = num_parallel
+        self.prompt_eval_ns = prompt_eval_ns
+        self.eval_ns = eval_ns
+        self._slots: List[List[int]] = [[] for _ in range(num_parallel)]
+        self._vocab: Dict[str, int] = {}
+        self.latency = latency
+        self.realtime = realtime
+        self._workers: Optional[asyncio.Semaphore] = None
+        self.token_delay = token_delay
+        self.aborted = False
+        self.model = model
+        self.requests = 0
+        # When set, generate requests fail with a server error
+        self.failing = False
+        # Models reported as loaded by /api/ps
+        self.loaded_models: List[str] = [model]
+        self._transports = set()
+        self._runner: Optional[web.AppRunner] = None
+        self.port: Optional[int] = None
+
+    @property
+    def connections(self) -> int:
+        """Number of distinct TCP connections that carried requests."""
+        return len(self._transports)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def _track(self, request: web.Request):
+        self.requests += 1
+        self._transports.add(request.transport)
+
+    def _tokenize(self, text: str) -> List[int]:
+        return [self._vocab.setdefault(text[i:i + 4], len(self._vocab)) for i in range(0, len(text), 4)]
+
+    def _evaluate(self, payload: dict) -> dict:
+        """Runs the prompt through the slot model and returns Ollama-style timings."""
+        tokens = list(payload.get("context") or []) + self._tokenize(payload.get("prompt", ""))
+
+        def shared(slot: List[int]) -> int:
+            n = 0
+            for a, b in zip(slot, tokens):
+                if a != b:
+                    break
+                n += 1
+            return n
+
+        index = max(range(self.num_parallel), key=lambda i: shared(self._slots[i]))
+        cached = shared(self._slots[index])
+        response_tokens = self._tokenize(self.response_text)
+        num_predict = (payload.get("options") or {}).get("num_predict")
+        if num_predict and num_predict > 0:
+            response_tokens = response_tokens[:num_predict]
+        context = tokens + response_tokens
+        self._slots[index] = context
+        prompt_eval_count = len(tokens) - cached
+        prompt_eval_duration = prompt_eval_count * self.prompt_eval_ns
+        eval_duration = len(response_tokens) * self.eval_ns
+        return {
+            "response": self.response_text,
+            "context": context,
+            "total_duration": prompt_eval_duration + eval_duration,
+            "load_duration": 0,
+            "prompt_eval_count": prompt_eval_count,
+            "prompt_eval_duration": prompt_eval_duration,
+            "eval_count": len(response_tokens),
+            "eval_duration": eval_duration
+        }
+
+    async def _generate(self, request: web.Request) -> web.StreamResponse:
+        self._track(request)
+        payload = await request.json()
+        if self.failing:
+            return web.json_response({"error": "mock failure"}, status=500)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if payload.get("stream", True):
+            return await self._stream(request, payload)
+        if not self.realtime:
+            return web.json_response({
+                "model": payload.get("model", self.model),
+                "done": True,
+                **self._evaluate(payload)
+            })
+        if self._workers is None:
+            self._workers = asyncio.Semaphore(self.num_parallel)
+        async with self._workers:
+            result = self._evaluate(payload)
+            await asyncio.sleep(result["total_duration"] / 1e9)
+        return web.json_response({"model": payload.get("model", self.model), "done": True, **result})
+
+    async def _stream(self, request: web.Request, payload: dict) -> web.StreamResponse:
+        """Emits the response one word at a time as NDJSON, like Ollama does."""
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+        self.aborted = False
+        if self.realtime and self._workers is None:
+            self._workers = asyncio.Semaphore(self.num_parallel)
+        try:
+            if self.realtime:
+                async with self._workers:
+                    await self._write_stream(response, payload)
+            else:
+                await self._write_stream(response, payload)
+        except (ConnectionResetError, asyncio.CancelledError):
+            # The client hung up mid-generation (early termination)
+            self.aborted = True
+        return response
+
+    async def _write_stream(self, response: web.StreamResponse, payload: dict):
+        timings = self._evaluate(payload)
+        timings.pop("response", None)
+        words = self.response_text.split(" ")
+        if self.realtime:
+            await asyncio.sleep(timings["prompt_eval_duration"] / 1e9)
+        for i, word in enumerate(words):
+            chunk = word if i == len(words) - 1 else word + " "
+            await response.write((json.dumps({"response": chunk, "done": False}) + "\n").encode())
+            if self.token_delay:
+                await asyncio.sleep(self.token_delay)
+            elif self.realtime:
+                await asyncio.sleep(timings["eval_duration"] / 1e9 / len(words))
+        await response.write((json.dumps({"response": "", "done": True, **timings}) + "\n").encode())
+
+    async def _tags(self, request: web.Request) -> web.Response:
+        self._track(request)
+        return web.json_response({"models": [{"name": self.model}]})
+
+    async def _ps(self, request: web.Request) -> web.Response:
+        return web.json_response({"models": [{"name": m, "model": m} for m in self.loaded_models]})
+
+    async def start(self, port: int = 0):
+        app = web.Application()
+        app.router.add_post("/api/generate", self._generate)
+        app.router.add_get("/api/tags", self._tags)
+        app.router.add_get("/api/ps", self._ps)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        logger.info(f"Mock Ollama listening on {self.url}")
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
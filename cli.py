@@ -3,9 +3,24 @@ import click
 import json
 import asyncio
 import logging
+import signal
 from pathlib import Path
-from typing import Dict
+from typing import Dict, List, Optional, Tuple
 from main import ReviewManager
+from llm.scheduler import BACKFILL, PRIORITIES
+from llm.backend_pool import close_backend_pool
+from llm.session_pool import close_session_pool
+from jobs.job_queue import JobQueue, STATES
+from jobs.worker import ReviewWorker
+from config import (
+    REVIEW_BATCH_CONCURRENCY,
+    REVIEW_BATCH_PER_REPO,
+    JOB_WORKER_CONCURRENCY,
+    JOB_LEASE_SECONDS,
+    WEBHOOK_HOST,
+    WEBHOOK_PORT,
+    WEBHOOK_WORKERS
+)
 
 # Setup logging
 logging.basicConfig(
@@ -14,6 +29,24 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+class _LineStreamPrinter:
+    """Echoes streamed agent output to stderr one complete line at a time."""
+
+    def __init__(self):
+        self._buffers: Dict[str, str] = {}
+
+    def __call__(self, agent_type: str, chunk: str):
+        lines = (self._buffers.get(agent_type, "") + chunk).split("\n")
+        self._buffers[agent_type] = lines.pop()
+        for line in lines:
+            click.echo(f"[{agent_type}] {line}", err=True)
+
+    def flush(self):
+        for agent_type, line in self._buffers.items():
+            if line:
+                click.echo(f"[{agent_type}] {line}", err=True)
+        self._buffers.clear()
+
 @click.group()
 def cli():
     """RBRDCK - Advanced Code Review Tool"""
@@ -23,12 +56,18 @@ def cli():
 @click.argument('repo', type=str)
 @click.argument('pr_number', type=int)
 @click.option('-o', '--output', type=click.Path(), help='Save review to file')
-def review(repo: str, pr_number: int, output: str = None):
+@click.option('--stream', is_flag=True, help='Show agent output live as it is generated')
+@click.option('--full', is_flag=True, help='Review the whole PR, not only the commits pushed since the last review')
+def review(repo: str, pr_number: int, output: str = None, stream: bool = False, full: bool = False):
     """Review a specific pull request"""
     async def _review():
         try:
             review_manager = await ReviewManager.create()
-            results = await review_manager.review_pr(repo, pr_number)
+            printer = _LineStreamPrinter() if stream else None
+            review_manager.set_stream_handler(printer)
+            results = await review_manager.review_pr(repo, pr_number, {'full_review': full})
+            if printer is not None:
+                printer.flush()
             
             if output:
                 Path(output).write_text(json.dumps(results, indent=2))
@@ -40,9 +79,196 @@ def review(repo: str, pr_number: int, output: str = None):
             logger.error(f"Error reviewing PR: {e}")
             click.echo(f"Error: {str(e)}", err=True)
             raise click.Abort()
+        finally:
+            await close_backend_pool()
+            await close_session_pool()
     
     asyncio.run(_review())
 
+def _parse_target(target: str) -> Tuple[str, Optional[int]]:
+    """Splits "owner/repo#123" into its repo and PR number; a bare repo means all its open PRs."""
+    repo, _, number = target.strip().partition('#')
+    if repo.count('/') != 1 or (number and not number.isdigit()):
+        raise click.BadParameter(f"expected owner/repo or owner/repo#123, got {target!r}")
+    return repo, int(number) if number else None
+
+def _read_targets(targets: Tuple[str, ...], targets_file: Optional[str]) -> List[Tuple[str, Optional[int]]]:
+    """Parses targets given as arguments and, one per line, in `targets_file`."""
+    lines = list(targets)
+    if targets_file:
+        lines += [line for line in Path(targets_file).read_text().splitlines()
+                  if line.strip() and not line.lstrip().startswith('#')]
+    if not lines:
+        raise click.UsageError("No targets given")
+    return [_parse_target(line) for line in lines]
+
+@cli.command('review-batch')
+@click.argument('targets', nargs=-1)
+@click.option('-f', '--file', 'targets_file', type=click.Path(exists=True),
+              help='Read targets from a file, one per line')
+@click.option('-c', '--concurrency', type=int, default=REVIEW_BATCH_CONCURRENCY, show_default=True,
+              help='Reviews running at once')
+@click.option('--per-repo', type=int, default=REVIEW_BATCH_PER_REPO, show_default=True,
+              help='Reviews running at once per repository')
+@click.option('--priority', type=click.Choice(PRIORITIES), default=BACKFILL, show_default=True,
+              help='Scheduling class of the LLM calls')
+@click.option('--full', is_flag=True, help='Review whole PRs, not only the commits pushed since the last review')
+@click.option('-o', '--output', type=click.Path(), help='Write each review result as a JSON line to this file')
+def review_batch(targets: Tuple[str, ...], targets_file: str, concurrency: int, per_repo: int,
+                 priority: str, full: bool, output: str):
+    """Review many pull requests in one process.
+
+    TARGETS are owner/repo#123 for one PR or owner/repo for all of its open PRs.
+    """
+    parsed = _read_targets(targets, targets_file)
+
+    async def _review_batch():
+        sink = open(output, 'w') if output else None
+        try:
+            review_manager = await ReviewManager.create()
+            prs: List[Tuple[str, int]] = []
+            for repo, number in parsed:
+                if number is not None:
+                    prs.append((repo, number))
+                else:
+                    numbers = await review_manager.list_open_pull_requests(repo)
+                    click.echo(f"{repo}: {len(numbers)} open pull requests", err=True)
+                    prs.extend((repo, n) for n in numbers)
+            click.echo(f"Reviewing {len(prs)} pull requests "
+                       f"({concurrency} at once, {per_repo} per repository)", err=True)
+
+            done = 0
+            def report(outcome: Dict):
+                nonlocal done
+                done += 1
+                click.echo(f"[{done}/{len(prs)}] {outcome['repo']}#{outcome['pr']}: "
+                           f"{outcome['status']} in {outcome['seconds']:.1f}s", err=True)
+                if sink is not None:
+                    sink.write(json.dumps(outcome, default=str) + "\n")
+                    sink.flush()
+
+            batch = await review_manager.review_batch(
+                prs, {'priority': priority, 'full_review': full},
+                max_concurrent=concurrency, max_per_repo=per_repo, on_result=report
+            )
+            summary = batch['summary']
+            click.echo(json.dumps(summary, indent=2))
+            if summary['statuses'].get('failed'):
+                for outcome in batch['reviews']:
+                    if outcome['status'] == 'failed':
+                        click.echo(f"Failed: {outcome['repo']}#{outcome['pr']}: {outcome['error']}", err=True)
+        except Exception as e:
+            logger.error(f"Error in batch review: {e}")
+            click.echo(f"Error: {str(e)}", err=True)
+            raise click.Abort()
+        finally:
+            if sink is not None:
+                sink.close()
+            await close_backend_pool()
+            await close_session_pool()
+
+    asyncio.run(_review_batch())
+
+@cli.command()
+@click.argument('targets', nargs=-1)
+@click.option('-f', '--file', 'targets_file', type=click.Path(exists=True),
+              help='Read targets from a file, one per line')
+@click.option('--priority', type=click.Choice(PRIORITIES), default=BACKFILL, show_default=True,
+              help='Scheduling class of the jobs and their LLM calls')
+@click.option('--full', is_flag=True, help='Review whole PRs, not only the commits pushed since the last review')
+def enqueue(targets: Tuple[str, ...], targets_file: str, priority: str, full: bool):
+    """Queue pull requests for review by `worker` processes.
+
+    TARGETS are owner/repo#123 for one PR or owner/repo for all of its open PRs.
+    """
+    parsed = _read_targets(targets, targets_file)
+
+    async def _enqueue():
+        queue = JobQueue()
+        review_manager = None
+        try:
+            for repo, number in parsed:
+                if number is not None:
+                    numbers = [number]
+                else:
+                    review_manager = review_manager or await ReviewManager.create()
+                    numbers = await review_manager.list_open_pull_requests(repo)
+                for n in numbers:
+                    job = await asyncio.to_thread(queue.enqueue, repo, n, {'full_review': full}, priority)
+                    click.echo(f"{job.id}  {repo}#{n}  {job.priority}")
+        except Exception as e:
+            logger.error(f"Error queueing reviews: {e}")
+            click.echo(f"Error: {str(e)}", err=True)
+            raise click.Abort()
+        finally:
+            await close_backend_pool()
+            await close_session_pool()
+
+    asyncio.run(_enqueue())
+
+@cli.command()
+@click.option('-c', '--concurrency', type=int, default=JOB_WORKER_CONCURRENCY, show_default=True,
+              help='Reviews running at once')
+@click.option('--worker-id', help='Name of this worker in job leases (default: host:pid)')
+@click.option('--lease', type=float, default=JOB_LEASE_SECONDS, show_default=True,
+              help='Seconds a job stays leased without a renewal')
+@click.option('--drain', is_flag=True, help='Exit once the queue has no runnable jobs')
+def worker(concurrency: int, worker_id: str, lease: float, drain: bool):
+    """Run queued reviews until interrupted.
+
+    Start as many workers as needed, on any host that shares the queue file.
+    """
+    async def _work():
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except NotImplementedError:
+                pass
+        try:
+            review_manager = await ReviewManager.create()
+            review_worker = ReviewWorker(review_manager, JobQueue(lease_seconds=lease), worker_id, concurrency)
+            await review_worker.run(stop, drain=drain)
+            click.echo(json.dumps(review_worker.stats()))
+        except Exception as e:
+            logger.error(f"Error in worker: {e}")
+            click.echo(f"Error: {str(e)}", err=True)
+            raise click.Abort()
+        finally:
+            await close_backend_pool()
+            await close_session_pool()
+
+    asyncio.run(_work())
+
+@cli.command()
+@click.option('--host', default=WEBHOOK_HOST, show_default=True)
+@click.option('--port', type=int, default=WEBHOOK_PORT, show_default=True)
+@click.option('-w', '--workers', type=int, default=WEBHOOK_WORKERS, show_default=True,
+              help='Reviews run at once in the server process; 0 leaves them to `worker` processes')
+def serve(host: str, port: int, workers: int):
+    """Serve GitHub webhooks and queue reviews for pull request events"""
+    # The server's dependencies are only needed here
+    from integrations.webhook_server import serve as serve_webhooks
+    try:
+        serve_webhooks(host, port, workers)
+    except ValueError as e:
+        click.echo(f"Error: {str(e)}", err=True)
+        raise click.Abort()
+
+@cli.command('queue-status')
+@click.option('--state', type=click.Choice(STATES), help='List the jobs in this state')
+@click.option('--limit', type=int, default=20, show_default=True)
+def queue_status(state: Optional[str], limit: int):
+    """Show the review job queue"""
+    queue = JobQueue()
+    click.echo(json.dumps(queue.stats(), indent=2))
+    if state:
+        for job in queue.list_jobs(state, limit):
+            click.echo(f"{job.id}  {job.repo}#{job.pr}  {job.priority}  attempts={job.attempts}"
+                       + (f"  owner={job.lease_owner}" if job.lease_owner else "")
+                       + (f"  error={job.error}" if job.error else ""))
+
 @cli.command()
 @click.argument('repo')
 @click.option('--days', default=7, help='Number of days to analyze')
@@ -89,6 +315,9 @@ def setup(repo: str, webhook_url: str):
             logger.error(f"Error setting up repository: {e}")
             click.echo(f"Error: {str(e)}", err=True)
             raise click.Abort()
+        finally:
+            await close_backend_pool()
+            await close_session_pool()
     
     asyncio.run(_setup())
 
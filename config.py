@@ -5,6 +5,15 @@ from dotenv import load_dotenv
 # Load environment variables
 load_dotenv()
 
+def _env_mapping(name: str) -> dict:
+    """Parses a 'key=value,key=value' environment variable into a dict."""
+    mapping = {}
+    for item in os.getenv(name, '').split(','):
+        if '=' in item:
+            key, value = item.split('=', 1)
+            mapping[key.strip()] = value.strip()
+    return mapping
+
 # GitHub Configuration
 GITHUB_TOKEN = os.getenv('GITHUB_TOKEN')
 if not GITHUB_TOKEN:
@@ -22,5 +31,129 @@ JIRA_API_TOKEN = os.getenv('JIRA_API_TOKEN')
 
 # LLM Configuration
 OLLAMA_BASE_URL = os.getenv('OLLAMA_BASE_URL', 'http://localhost:11434')
+# Several inference servers, comma-separated; requests go to the least-loaded healthy one
+OLLAMA_BASE_URLS = [u.strip() for u in os.getenv('OLLAMA_BASE_URLS', OLLAMA_BASE_URL).split(',') if u.strip()]
 OLLAMA_MODEL = os.getenv('OLLAMA_MODEL', 'llama3:latest')
-OLLAMA_TEMPERATURE = float(os.getenv('OLLAMA_TEMPERATURE', '0.2'))
\ No newline at end of file
+OLLAMA_TEMPERATURE = float(os.getenv('OLLAMA_TEMPERATURE', '0.2'))
+# How long Ollama keeps the model loaded after a request, so agent calls never hit a cold load
+OLLAMA_KEEP_ALIVE = os.getenv('OLLAMA_KEEP_ALIVE', '30m')
+# Prime shared prompt prefixes once and pass the returned context to later calls. Off by
+# default: the continuation is templated as a new turn after the primed one, which changes the
+# prompt the model sees. Ollama already reuses its KV cache for a prefix sent inline.
+OLLAMA_PREFIX_REUSE = os.getenv('OLLAMA_PREFIX_REUSE', 'false').lower() == 'true'
+
+# LLM Request Scheduling: requests in flight match OLLAMA_NUM_PARALLEL on each server
+OLLAMA_NUM_PARALLEL = int(os.getenv('OLLAMA_NUM_PARALLEL', '4'))
+# Requests allowed to wait for a slot before new ones are rejected (0 disables the limit)
+LLM_QUEUE_MAX = int(os.getenv('LLM_QUEUE_MAX', '256'))
+# Seconds a request may wait for a slot (0 waits indefinitely)
+LLM_QUEUE_TIMEOUT = float(os.getenv('LLM_QUEUE_TIMEOUT', '900'))
+# Queue delay per 1000 changed lines of the PR, so small PRs go first, and its cap
+LLM_QUEUE_SIZE_DELAY = float(os.getenv('LLM_QUEUE_SIZE_DELAY', '30'))
+LLM_QUEUE_SIZE_MAX_DELAY = float(os.getenv('LLM_QUEUE_SIZE_MAX_DELAY', '300'))
+
+# Ollama backend health: probe interval and timeout, consecutive failures before
+# a backend is ejected, and its ejection time (doubling per ejection, up to the max)
+OLLAMA_HEALTH_INTERVAL = float(os.getenv('OLLAMA_HEALTH_INTERVAL', '15'))
+OLLAMA_HEALTH_TIMEOUT = float(os.getenv('OLLAMA_HEALTH_TIMEOUT', '5'))
+OLLAMA_BACKEND_MAX_FAILURES = int(os.getenv('OLLAMA_BACKEND_MAX_FAILURES', '3'))
+OLLAMA_BACKEND_EJECT_SECONDS = float(os.getenv('OLLAMA_BACKEND_EJECT_SECONDS', '30'))
+OLLAMA_BACKEND_MAX_EJECT_SECONDS = float(os.getenv('OLLAMA_BACKEND_MAX_EJECT_SECONDS', '300'))
+
+# LLM HTTP Connection Pool
+OLLAMA_POOL_LIMIT = int(os.getenv('OLLAMA_POOL_LIMIT', '32'))
+OLLAMA_POOL_LIMIT_PER_HOST = int(os.getenv('OLLAMA_POOL_LIMIT_PER_HOST', '8'))
+OLLAMA_DNS_CACHE_TTL = int(os.getenv('OLLAMA_DNS_CACHE_TTL', '300'))
+OLLAMA_KEEPALIVE_TIMEOUT = float(os.getenv('OLLAMA_KEEPALIVE_TIMEOUT', '60'))
+OLLAMA_REQUEST_TIMEOUT = float(os.getenv('OLLAMA_REQUEST_TIMEOUT', '600'))
+
+# LLM Streaming (0 disables a limit)
+OLLAMA_STREAM_MAX_CHARS = int(os.getenv('OLLAMA_STREAM_MAX_CHARS', '0'))
+OLLAMA_STREAM_MAX_REPEATED_LINES = int(os.getenv('OLLAMA_STREAM_MAX_REPEATED_LINES', '8'))
+
+# LLM Response Cache
+LLM_CACHE_ENABLED = os.getenv('LLM_CACHE_ENABLED', 'true').lower() == 'true'
+LLM_CACHE_PATH = os.getenv('LLM_CACHE_PATH', '.rbrdck/llm_cache.sqlite3')
+LLM_CACHE_MAX_BYTES = int(os.getenv('LLM_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+LLM_CACHE_TTL = float(os.getenv('LLM_CACHE_TTL', str(7 * 24 * 3600)))
+
+# Review Orchestration
+REVIEW_MAX_CONCURRENT_AGENTS = int(os.getenv('REVIEW_MAX_CONCURRENT_AGENTS', '5'))
+REVIEW_AGENT_TIMEOUT = float(os.getenv('REVIEW_AGENT_TIMEOUT', '300'))
+# Per-agent overrides, e.g. "security=600,documentation=120"
+REVIEW_AGENT_TIMEOUTS = {k: float(v) for k, v in _env_mapping('REVIEW_AGENT_TIMEOUTS').items()}
+
+# Prompt budgets: context window per agent (e.g. "security=16384,documentation=4096")
+OLLAMA_NUM_CTX = int(os.getenv('OLLAMA_NUM_CTX', '8192'))
+OLLAMA_NUM_CTX_PER_AGENT = {k: int(v) for k, v in _env_mapping('OLLAMA_NUM_CTX_PER_AGENT').items()}
+PROMPT_RESERVED_OUTPUT_TOKENS = int(os.getenv('PROMPT_RESERVED_OUTPUT_TOKENS', '1024'))
+PROMPT_CHARS_PER_TOKEN = float(os.getenv('PROMPT_CHARS_PER_TOKEN', '3.0'))
+PROMPT_COMMENTS_SHARE = float(os.getenv('PROMPT_COMMENTS_SHARE', '0.2'))
+
+# Model routing: per-agent models (e.g. "security=llama3:70b") and a small-model fast path
+# for the listed agents on PRs of at most OLLAMA_SMALL_MODEL_MAX_LINES changed lines (0: any size)
+OLLAMA_MODEL_PER_AGENT = _env_mapping('OLLAMA_MODEL_PER_AGENT')
+OLLAMA_SMALL_MODEL = os.getenv('OLLAMA_SMALL_MODEL', '')
+OLLAMA_SMALL_MODEL_AGENTS = [a.strip() for a in os.getenv('OLLAMA_SMALL_MODEL_AGENTS', 'documentation,dependencies').split(',') if a.strip()]
+OLLAMA_SMALL_MODEL_MAX_LINES = int(os.getenv('OLLAMA_SMALL_MODEL_MAX_LINES', '400'))
+# Context window cap per model (e.g. "llama3.2:3b=4096") and output cap per agent
+OLLAMA_NUM_CTX_PER_MODEL = {k: int(v) for k, v in _env_mapping('OLLAMA_NUM_CTX_PER_MODEL').items()}
+OLLAMA_NUM_PREDICT_PER_AGENT = {k: int(v) for k, v in _env_mapping('OLLAMA_NUM_PREDICT_PER_AGENT').items()}
+
+# Batch reviews: reviews running at once in one process, overall and per repository
+REVIEW_BATCH_CONCURRENCY = int(os.getenv('REVIEW_BATCH_CONCURRENCY', '4'))
+REVIEW_BATCH_PER_REPO = int(os.getenv('REVIEW_BATCH_PER_REPO', '2'))
+
+# Incremental re-review: the last reviewed head SHA and results per PR
+REVIEW_STATE_ENABLED = os.getenv('REVIEW_STATE_ENABLED', 'true').lower() == 'true'
+REVIEW_STATE_PATH = os.getenv('REVIEW_STATE_PATH', '.rbrdck/review_state.sqlite3')
+
+# Agent results cached per hunk fingerprint, reused across rebases and force-pushes
+HUNK_CACHE_ENABLED = os.getenv('HUNK_CACHE_ENABLED', 'true').lower() == 'true'
+HUNK_CACHE_PATH = os.getenv('HUNK_CACHE_PATH', '.rbrdck/hunk_cache.sqlite3')
+HUNK_CACHE_TTL = float(os.getenv('HUNK_CACHE_TTL', str(30 * 24 * 3600)))
+
+# Metrics
+METRICS_PATH = os.getenv('METRICS_PATH', '.rbrdck/metrics')
+
+# Diff parsing; content of a single file beyond this many bytes is dropped (0 disables)
+DIFF_MAX_FILE_BYTES = int(os.getenv('DIFF_MAX_FILE_BYTES', str(4 * 1024 * 1024)))
+
+# File triage: generated, vendored and oversized files are skipped or summarized
+TRIAGE_ENABLED = os.getenv('TRIAGE_ENABLED', 'true').lower() == 'true'
+TRIAGE_MAX_FILE_BYTES = int(os.getenv('TRIAGE_MAX_FILE_BYTES', str(256 * 1024)))
+TRIAGE_MAX_LINE_LENGTH = int(os.getenv('TRIAGE_MAX_LINE_LENGTH', '300'))
+TRIAGE_ENTROPY_THRESHOLD = float(os.getenv('TRIAGE_ENTROPY_THRESHOLD', '5.5'))
+TRIAGE_SUMMARY_LINES = int(os.getenv('TRIAGE_SUMMARY_LINES', '40'))
+
+# Cascade review: hunks scoring below the threshold are kept from the listed agents;
+# set CASCADE_LLM_MODEL to let a small model promote hunks the static checks would skip
+CASCADE_ENABLED = os.getenv('CASCADE_ENABLED', 'false').lower() == 'true'
+CASCADE_THRESHOLD = float(os.getenv('CASCADE_THRESHOLD', '0.3'))
+CASCADE_AGENTS = [a.strip() for a in os.getenv('CASCADE_AGENTS', 'code_quality,test_coverage').split(',') if a.strip()]
+CASCADE_LLM_MODEL = os.getenv('CASCADE_LLM_MODEL', '')
+CASCADE_LLM_MAX_HUNKS = int(os.getenv('CASCADE_LLM_MAX_HUNKS', '40'))
+
+# Durable review job queue, drained by `python cli.py worker` processes sharing the file;
+# a job whose lease is not renewed in JOB_LEASE_SECONDS is taken over by another worker
+JOB_QUEUE_PATH = os.getenv('JOB_QUEUE_PATH', '.rbrdck/jobs.sqlite3')
+JOB_LEASE_SECONDS = float(os.getenv('JOB_LEASE_SECONDS', '300'))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+JOB_RETRY_BASE_SECONDS = float(os.getenv('JOB_RETRY_BASE_SECONDS', '30'))
+JOB_RETRY_MAX_SECONDS = float(os.getenv('JOB_RETRY_MAX_SECONDS', '1800'))
+JOB_WORKER_CONCURRENCY = int(os.getenv('JOB_WORKER_CONCURRENCY', '2'))
+JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', '5'))
+# Finished jobs are kept this long for queue-status, then purged by the workers
+JOB_RETENTION_SECONDS = float(os.getenv('JOB_RETENTION_SECONDS', str(7 * 24 * 3600)))
+
+# Webhook server: pushes to a PR within the debounce window coalesce into one review,
+# which waits at most WEBHOOK_DEBOUNCE_MAX_SECONDS after the first of them
+GITHUB_WEBHOOK_SECRET = os.getenv('GITHUB_WEBHOOK_SECRET')
+# Without a secret the server refuses to start, unless unsigned deliveries are allowed (local testing only)
+WEBHOOK_ALLOW_UNSIGNED = os.getenv('WEBHOOK_ALLOW_UNSIGNED', 'false').lower() == 'true'
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8080'))
+WEBHOOK_DEBOUNCE_SECONDS = float(os.getenv('WEBHOOK_DEBOUNCE_SECONDS', '20'))
+WEBHOOK_DEBOUNCE_MAX_SECONDS = float(os.getenv('WEBHOOK_DEBOUNCE_MAX_SECONDS', '120'))
+# Reviews the server process runs at once; 0 leaves the queue to separate `worker` processes
+WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', '1'))
@@ -1,5 +1,7 @@
-from typing import Dict
+from typing import Dict, Optional
 from .hub import BaseIntegration
+import hashlib
+import hmac
 import logging
 from github import Github
 from github.PullRequest import PullRequest
@@ -42,15 +44,26 @@ class GitHubIntegration(BaseIntegration):
             
             return {
                 "event": event_type,
+                "repo": payload.get("repository", {}).get("full_name"),
                 "pr_number": pr_data.get("number"),
                 "title": pr_data.get("title"),
                 "author": pr_data.get("user", {}).get("login"),
-                "status": pr_data.get("state")
+                "status": pr_data.get("state"),
+                "head_sha": pr_data.get("head", {}).get("sha"),
+                "draft": pr_data.get("draft", False)
             }
         except Exception as e:
             logger.error(f"Error handling GitHub webhook: {e}")
             raise
             
+    @staticmethod
+    def verify_signature(secret: str, body: bytes, signature: Optional[str]) -> bool:
+        """Checks the X-Hub-Signature-256 header GitHub sends with a webhook body."""
+        if not signature or not signature.startswith("sha256="):
+            return False
+        expected = hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+        return hmac.compare_digest(expected, signature[len("sha256="):])
+            
     def send_notification(self, message: str, context: Dict) -> bool:
         """Send notification as GitHub comment."""
         try:
@@ -0,0 +1,151 @@
+# integrations/webhook_server.py
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+import asyncio
+import json
+import logging
+from fastapi import FastAPI, Header, HTTPException, Request
+import uvicorn
+from main import ReviewManager
+from integrations.github_integration import GitHubIntegration
+from jobs.job_queue import JobQueue
+from jobs.worker import ReviewWorker
+from llm.scheduler import WEBHOOK
+from llm.backend_pool import close_backend_pool
+from llm.session_pool import close_session_pool
+from config import (
+    GITHUB_WEBHOOK_SECRET,
+    WEBHOOK_ALLOW_UNSIGNED,
+    WEBHOOK_HOST,
+    WEBHOOK_PORT,
+    WEBHOOK_DEBOUNCE_SECONDS,
+    WEBHOOK_DEBOUNCE_MAX_SECONDS,
+    WEBHOOK_WORKERS
+)
+
+logger = logging.getLogger(__name__)
+
+# pull_request actions that call for a review; synchronize is a push to the PR branch
+REVIEW_ACTIONS = ("opened", "reopened", "synchronize", "ready_for_review")
+DEBOUNCED_ACTIONS = ("synchronize",)
+# Draft PRs are reviewed once marked ready_for_review, not on every push before that
+DRAFT_SKIPPED_ACTIONS = ("opened", "reopened", "synchronize")
+
+class WebhookHandler:
+    """
+    Turns GitHub webhook deliveries into review jobs.
+
+    Reviews are queued at the webhook priority. A push (`synchronize`)
+    starts its review only after `debounce` seconds without another push
+    to the PR, and at most `debounce_max` seconds after the first one, so
+    a burst of fixups coalesces into one queued job. A push also cancels
+    a review already running for an older head. Closing a PR cancels its
+    jobs. Draft PRs are not reviewed until they are marked ready.
+
+    Deliveries must be signed with `secret`; without one the handler
+    refuses to start unless `allow_unsigned` is set, since anyone who can
+    reach the server could otherwise queue or cancel reviews.
+    """
+
+    def __init__(self, queue: Optional[JobQueue] = None, secret: Optional[str] = GITHUB_WEBHOOK_SECRET,
+                 debounce: float = WEBHOOK_DEBOUNCE_SECONDS, debounce_max: float = WEBHOOK_DEBOUNCE_MAX_SECONDS,
+                 allow_unsigned: bool = WEBHOOK_ALLOW_UNSIGNED):
+        if not secret and not allow_unsigned:
+            raise ValueError("GITHUB_WEBHOOK_SECRET is not set; refusing unsigned webhooks "
+                             "(set WEBHOOK_ALLOW_UNSIGNED=true to accept them for local testing)")
+        self.queue = queue or JobQueue()
+        self.secret = secret
+        self.allow_unsigned = allow_unsigned
+        self.debounce = debounce
+        self.debounce_max = debounce_max
+        self.github = GitHubIntegration()
+        if not secret:
+            logger.warning("WEBHOOK_ALLOW_UNSIGNED is set; webhook signatures are not checked")
+
+    def handle(self, event: str, body: bytes, signature: Optional[str] = None) -> Dict:
+        """
+        Handles one delivery.
+
+        Raises:
+            PermissionError: The signature does not match the secret, or
+                there is no secret and unsigned deliveries are not allowed
+            ValueError: The body is not a pull request payload
+        """
+        if self.secret:
+            if not self.github.verify_signature(self.secret, body, signature):
+                raise PermissionError("Invalid webhook signature")
+        elif not self.allow_unsigned:
+            raise PermissionError("No webhook secret configured")
+        if event == "ping":
+            return {"status": "pong"}
+        if event != "pull_request":
+            return {"status": "ignored", "event": event}
+        try:
+            info = self.github.handle_webhook(json.loads(body))
+        except Exception as e:
+            raise ValueError(f"Invalid pull_request payload: {e}")
+        repo, pr_number, action = info["repo"], info["pr_number"], info["event"]
+        if not repo or not pr_number:
+            raise ValueError("Payload has no repository or pull request number")
+
+        if action == "closed":
+            cancelled = self.queue.cancel_pr(repo, pr_number, "pull request closed")
+            return {"status": "cancelled", "jobs": cancelled}
+        if action not in REVIEW_ACTIONS:
+            return {"status": "ignored", "action": action}
+        if info["draft"] and action in DRAFT_SKIPPED_ACTIONS:
+            return {"status": "ignored", "action": action, "reason": "draft"}
+
+        delay = self.debounce if action in DEBOUNCED_ACTIONS else 0.0
+        job = self.queue.enqueue(repo, pr_number, {'head_sha': info["head_sha"]}, priority=WEBHOOK,
+                                 delay=delay, max_delay=self.debounce_max, supersede=True)
+        logger.info(f"{action} on {repo}#{pr_number} at {(info['head_sha'] or '')[:7]}: job {job.id} {job.state}")
+        return {"status": job.state, "job": job.id, "run_after": job.run_after}
+
+def create_app(handler: Optional[WebhookHandler] = None, workers: int = WEBHOOK_WORKERS) -> FastAPI:
+    """
+    The webhook app. With `workers` > 0 the app also drains the queue,
+    running that many reviews at once; otherwise separate `worker`
+    processes sharing the queue file do.
+    """
+    handler = handler or WebhookHandler()
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        stop = asyncio.Event()
+        task = None
+        if workers > 0:
+            review_manager = await ReviewManager.create()
+            task = asyncio.create_task(ReviewWorker(review_manager, handler.queue, concurrency=workers).run(stop))
+        try:
+            yield
+        finally:
+            stop.set()
+            if task is not None:
+                await task
+            await close_backend_pool()
+            await close_session_pool()
+
+    app = FastAPI(title="RBRDCK webhooks", lifespan=lifespan)
+
+    @app.post("/webhooks/github")
+    async def github_webhook(request: Request,
+                             x_github_event: str = Header(""),
+                             x_hub_signature_256: Optional[str] = Header(None)):
+        body = await request.body()
+        try:
+            return await asyncio.to_thread(handler.handle, x_github_event, body, x_hub_signature_256)
+        except PermissionError as e:
+            raise HTTPException(status_code=401, detail=str(e))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    @app.get("/healthz")
+    async def healthz():
+        return {"status": "ok", "queue": await asyncio.to_thread(handler.queue.stats)}
+
+    return app
+
+def serve(host: str = WEBHOOK_HOST, port: int = WEBHOOK_PORT, workers: int = WEBHOOK_WORKERS):
+    """Runs the webhook server until interrupted."""
+    uvicorn.run(create_app(workers=workers), host=host, port=port)
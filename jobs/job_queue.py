@@ -0,0 +1,432 @@
+# jobs/job_queue.py
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Union
+from contextlib import closing
+import json
+import logging
+import os
+import sqlite3
+import time
+import uuid
+from llm.scheduler import PRIORITIES, BACKFILL
+from config import (
+    JOB_QUEUE_PATH,
+    JOB_LEASE_SECONDS,
+    JOB_MAX_ATTEMPTS,
+    JOB_RETRY_BASE_SECONDS,
+    JOB_RETRY_MAX_SECONDS
+)
+
+logger = logging.getLogger(__name__)
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+STATES = (QUEUED, RUNNING, DONE, FAILED, CANCELLED)
+
+class JobLost(Exception):
+    """The job was cancelled, superseded or taken over by another worker while it ran."""
+
+@dataclass
+class Job:
+    """A review of one pull request, as stored in the queue."""
+    id: str
+    repo: str
+    pr: int
+    options: Dict = field(default_factory=dict)
+    state: str = QUEUED
+    priority: str = BACKFILL
+    attempts: int = 0
+    max_attempts: int = JOB_MAX_ATTEMPTS
+    created_at: float = 0.0
+    run_after: float = 0.0
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    lease_owner: Optional[str] = None
+    lease_expires: Optional[float] = None
+    error: Optional[str] = None
+    result: Optional[Dict] = None
+
+_COLUMNS = ("id", "repo", "pr", "options", "state", "priority", "attempts", "max_attempts", "created_at",
+            "run_after", "started_at", "finished_at", "lease_owner", "lease_expires", "error", "result")
+
+def _job_from_row(row) -> Job:
+    values = dict(zip(_COLUMNS, row))
+    values["options"] = json.loads(values["options"] or "{}")
+    values["result"] = json.loads(values["result"]) if values["result"] else None
+    return Job(**values)
+
+class JobCheckpoint:
+    """
+    Agent results of one job, saved as each agent finishes so that a job
+    resumed after a crash does not run those agents again. Results only
+    apply to the head SHA they were computed for.
+    """
+
+    def __init__(self, queue: "JobQueue", job_id: str, worker_id: str):
+        self.queue = queue
+        self.job_id = job_id
+        self.worker_id = worker_id
+
+    def load(self, head_sha: str) -> Dict[str, Union[str, Dict]]:
+        return self.queue.agent_results(self.job_id, head_sha)
+
+    def save(self, head_sha: str, agent_type: str, review: Union[str, Dict]):
+        self.queue.save_agent_result(self.job_id, head_sha, agent_type, review)
+
+    def ensure_current(self):
+        """Renews the lease, raising JobLost if the worker no longer holds the job."""
+        if not self.queue.renew(self.job_id, self.worker_id):
+            raise JobLost(f"Job {self.job_id} is no longer leased to {self.worker_id}")
+
+class JobQueue:
+    """
+    Durable queue of review jobs in a SQLite database (WAL mode), so any
+    number of worker processes on hosts sharing the file can drain it.
+
+    A worker claims a job by taking a lease on it and renews the lease
+    while it runs. A job whose lease expires, because its worker crashed
+    or hung, is claimed again by another worker. Failed attempts are
+    retried with exponential backoff up to `max_attempts`. Jobs are
+    claimed by priority class (see llm.scheduler), then oldest first.
+    """
+
+    def __init__(self,
+                 path: str = JOB_QUEUE_PATH,
+                 lease_seconds: float = JOB_LEASE_SECONDS,
+                 max_attempts: int = JOB_MAX_ATTEMPTS,
+                 retry_base: float = JOB_RETRY_BASE_SECONDS,
+                 retry_max: float = JOB_RETRY_MAX_SECONDS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA busy_timeout = 30000")
+        return conn
+
+    def _init_db(self):
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    repo TEXT NOT NULL,
+                    pr INTEGER NOT NULL,
+                    options TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    priority TEXT NOT NULL,
+                    attempts INTEGER NOT NULL,
+                    max_attempts INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    run_after REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    lease_owner TEXT,
+                    lease_expires REAL,
+                    error TEXT,
+                    result TEXT
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs (state, run_after)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_pr ON jobs (repo, pr, state)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS job_agents (
+                    job_id TEXT NOT NULL,
+                    agent TEXT NOT NULL,
+                    head_sha TEXT NOT NULL,
+                    review TEXT NOT NULL,
+                    saved_at REAL NOT NULL,
+                    PRIMARY KEY (job_id, agent)
+                )
+            """)
+
+    @staticmethod
+    def _priority_rank() -> str:
+        """SQL ordering expression for the priority classes."""
+        cases = " ".join(f"WHEN '{p}' THEN {i}" for i, p in enumerate(PRIORITIES))
+        return f"CASE priority {cases} ELSE {len(PRIORITIES)} END"
+
+    def enqueue(self, repo: str, pr: int, options: Optional[Dict] = None,
+                priority: Optional[str] = None, delay: float = 0.0,
+                max_delay: Optional[float] = None, supersede: bool = False) -> Job:
+        """
+        Adds a review job. If the PR already has a queued job, that job is
+        updated instead (new options, the more urgent priority, the later
+        start time), so repeated requests collapse into one review.
+
+        Args:
+            delay: Seconds before the job may run; each repeat pushes the
+                start back again, debouncing bursts of requests
+            max_delay: Caps that push-back at this many seconds after the
+                job was first queued, so a steady stream can't starve it
+            supersede: Cancel running jobs of the PR for another head SHA
+                (`options['head_sha']`). If one already runs for the same
+                head, no job is added and that one is returned.
+        """
+        options = dict(options or {})
+        priority = priority or options.get('priority') or BACKFILL
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority {priority!r}; expected one of {', '.join(PRIORITIES)}")
+        options['priority'] = priority
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE repo = ? AND pr = ? AND state = ? "
+                f"ORDER BY created_at LIMIT 1", (repo, pr, QUEUED)
+            ).fetchone()
+            if supersede:
+                current = self._supersede(conn, repo, pr, options.get('head_sha'))
+                if current is not None and row is None:
+                    conn.execute("COMMIT")
+                    return current
+            if row is not None:
+                job = _job_from_row(row)
+                priority = min(priority, job.priority, key=PRIORITIES.index)
+                options['priority'] = priority
+                run_after = now + delay
+                if max_delay is not None:
+                    run_after = min(run_after, job.created_at + max_delay)
+                run_after = max(job.run_after, run_after)
+                conn.execute(
+                    "UPDATE jobs SET options = ?, priority = ?, run_after = ? WHERE id = ?",
+                    (json.dumps(options), priority, run_after, job.id)
+                )
+                job_id = job.id
+            else:
+                job_id = uuid.uuid4().hex
+                conn.execute(
+                    f"INSERT INTO jobs ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})",
+                    (job_id, repo, pr, json.dumps(options), QUEUED, priority, 0, self.max_attempts,
+                     now, now + delay, None, None, None, None, None, None)
+                )
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        return self.get(job_id)
+
+    @staticmethod
+    def _supersede(conn: sqlite3.Connection, repo: str, pr: int, head_sha: Optional[str]) -> Optional[Job]:
+        """
+        Cancels the PR's running jobs for heads other than `head_sha`; their
+        workers notice at the next lease renewal. Returns a running job
+        that is already reviewing `head_sha`, if any.
+        """
+        current = None
+        for row in conn.execute(
+            f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE repo = ? AND pr = ? AND state = ?", (repo, pr, RUNNING)
+        ).fetchall():
+            job = _job_from_row(row)
+            if head_sha and job.options.get('head_sha') == head_sha:
+                current = job
+                continue
+            logger.info(f"Job {job.id} ({repo}#{pr}) superseded by a push of {(head_sha or 'a new head')[:7]}")
+            conn.execute(
+                "UPDATE jobs SET state = ?, finished_at = ?, lease_owner = NULL, lease_expires = NULL, "
+                "error = ? WHERE id = ?",
+                (CANCELLED, time.time(), f"superseded by {head_sha or 'a new head'}", job.id)
+            )
+        return current
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with closing(self._connect()) as conn:
+            row = conn.execute(f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _job_from_row(row) if row is not None else None
+
+    def claim(self, worker_id: str) -> Optional[Job]:
+        """
+        Leases the next runnable job to `worker_id`: a queued job that is
+        due, or a running one whose lease expired. Returns None if none is.
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            while True:
+                row = conn.execute(
+                    f"SELECT {', '.join(_COLUMNS)} FROM jobs "
+                    f"WHERE (state = ? AND run_after <= ?) OR (state = ? AND lease_expires < ?) "
+                    f"ORDER BY {self._priority_rank()}, created_at LIMIT 1",
+                    (QUEUED, now, RUNNING, now)
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                job = _job_from_row(row)
+                if job.state == QUEUED:
+                    break
+                # A job that keeps taking its worker down must not be retried forever
+                if job.attempts >= job.max_attempts:
+                    logger.error(f"Lease of job {job.id} ({job.repo}#{job.pr}) expired on its last attempt")
+                    conn.execute(
+                        "UPDATE jobs SET state = ?, finished_at = ?, lease_owner = NULL, lease_expires = NULL, "
+                        "error = ? WHERE id = ?",
+                        (FAILED, now, f"lease held by {job.lease_owner} expired", job.id)
+                    )
+                    continue
+                logger.warning(f"Lease of job {job.id} ({job.repo}#{job.pr}) held by {job.lease_owner} "
+                               f"expired; resuming it")
+                break
+            conn.execute(
+                "UPDATE jobs SET state = ?, attempts = attempts + 1, lease_owner = ?, lease_expires = ?, "
+                "started_at = COALESCE(started_at, ?) WHERE id = ?",
+                (RUNNING, worker_id, now + self.lease_seconds, now, job.id)
+            )
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        return self.get(job.id)
+
+    def renew(self, job_id: str, worker_id: str) -> bool:
+        """Extends the lease; False means the worker lost the job to another one."""
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE id = ? AND state = ? AND lease_owner = ?",
+                (time.time() + self.lease_seconds, job_id, RUNNING, worker_id)
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, job_id: str, worker_id: str, result: Optional[Dict] = None) -> bool:
+        """Marks a job done and drops its agent checkpoints."""
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            cursor = conn.execute(
+                "UPDATE jobs SET state = ?, finished_at = ?, lease_owner = NULL, lease_expires = NULL, "
+                "error = NULL, result = ? WHERE id = ? AND state = ? AND lease_owner = ?",
+                (DONE, time.time(), json.dumps(result, default=str) if result is not None else None,
+                 job_id, RUNNING, worker_id)
+            )
+            if cursor.rowcount == 1:
+                conn.execute("DELETE FROM job_agents WHERE job_id = ?", (job_id,))
+            conn.execute("COMMIT")
+            return cursor.rowcount == 1
+
+    def fail(self, job_id: str, worker_id: str, error: str, retry: bool = True) -> Optional[str]:
+        """
+        Records a failed attempt. The job is queued again after an
+        exponential backoff, or marked failed once out of attempts.
+        Returns the job's new state, or None if the worker lost the lease.
+        """
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT attempts, max_attempts FROM jobs WHERE id = ? AND state = ? AND lease_owner = ?",
+                (job_id, RUNNING, worker_id)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            attempts, max_attempts = row
+            if retry and attempts < max_attempts:
+                delay = min(self.retry_max, self.retry_base * 2 ** (attempts - 1))
+                conn.execute(
+                    "UPDATE jobs SET state = ?, run_after = ?, lease_owner = NULL, lease_expires = NULL, "
+                    "error = ? WHERE id = ?", (QUEUED, now + delay, error, job_id)
+                )
+                state = QUEUED
+            else:
+                conn.execute(
+                    "UPDATE jobs SET state = ?, finished_at = ?, lease_owner = NULL, lease_expires = NULL, "
+                    "error = ? WHERE id = ?", (FAILED, now, error, job_id)
+                )
+                state = FAILED
+            conn.execute("COMMIT")
+            return state
+
+    def cancel(self, job_id: str, reason: str = "cancelled") -> bool:
+        """Cancels a queued or running job; a running one stops at its next lease renewal."""
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET state = ?, finished_at = ?, lease_owner = NULL, lease_expires = NULL, error = ? "
+                "WHERE id = ? AND state IN (?, ?)", (CANCELLED, time.time(), reason, job_id, QUEUED, RUNNING)
+            )
+            return cursor.rowcount == 1
+
+    def cancel_pr(self, repo: str, pr: int, reason: str = "cancelled") -> int:
+        """Cancels every queued or running job of a PR."""
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET state = ?, finished_at = ?, lease_owner = NULL, lease_expires = NULL, error = ? "
+                "WHERE repo = ? AND pr = ? AND state IN (?, ?)",
+                (CANCELLED, time.time(), reason, repo, pr, QUEUED, RUNNING)
+            )
+            return cursor.rowcount
+
+    def checkpoint(self, job_id: str, worker_id: str) -> JobCheckpoint:
+        return JobCheckpoint(self, job_id, worker_id)
+
+    def save_agent_result(self, job_id: str, head_sha: str, agent_type: str, review: Union[str, Dict]):
+        try:
+            with closing(self._connect()) as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO job_agents (job_id, agent, head_sha, review, saved_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (job_id, agent_type, head_sha, json.dumps(review, ensure_ascii=False, default=str), time.time())
+                )
+        except Exception as e:
+            logger.error(f"Error saving {agent_type} result of job {job_id}: {e}")
+
+    def agent_results(self, job_id: str, head_sha: str) -> Dict[str, Union[str, Dict]]:
+        """Agent results saved by earlier attempts of a job at `head_sha`."""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT agent, review FROM job_agents WHERE job_id = ? AND head_sha = ?", (job_id, head_sha)
+            ).fetchall()
+        return {agent: json.loads(review) for agent, review in rows}
+
+    def list_jobs(self, state: Optional[str] = None, limit: int = 100) -> List[Job]:
+        query = f"SELECT {', '.join(_COLUMNS)} FROM jobs"
+        params: tuple = ()
+        if state:
+            query += " WHERE state = ?"
+            params = (state,)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        with closing(self._connect()) as conn:
+            rows = conn.execute(query, params + (limit,)).fetchall()
+        return [_job_from_row(row) for row in rows]
+
+    def stats(self) -> Dict:
+        """Jobs per state, runnable depth and the age of the oldest runnable job."""
+        now = time.time()
+        with closing(self._connect()) as conn:
+            counts = dict(conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+            ready, oldest = conn.execute(
+                "SELECT COUNT(*), MIN(created_at) FROM jobs WHERE state = ? AND run_after <= ?", (QUEUED, now)
+            ).fetchone()
+            expired = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE state = ? AND lease_expires < ?", (RUNNING, now)
+            ).fetchone()[0]
+        return {
+            "states": {state: counts.get(state, 0) for state in STATES},
+            "ready": ready,
+            "expired_leases": expired,
+            "oldest_ready_seconds": round(now - oldest, 3) if oldest else 0.0
+        }
+
+    def purge(self, older_than: float) -> int:
+        """
+        Deletes finished jobs older than `older_than` seconds, and the agent
+        checkpoints of jobs that are gone or finished. Checkpoints of queued
+        jobs, such as ones waiting out a retry backoff, are kept.
+        """
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "DELETE FROM jobs WHERE state IN (?, ?, ?) AND finished_at < ?",
+                (DONE, FAILED, CANCELLED, time.time() - older_than)
+            )
+            conn.execute("DELETE FROM job_agents WHERE job_id NOT IN (SELECT id FROM jobs WHERE state IN (?, ?))",
+                         (QUEUED, RUNNING))
+            return cursor.rowcount
@@ -0,0 +1,184 @@
+# jobs/worker.py
+from typing import Dict, List, Optional, Set
+from datetime import datetime
+from github import UnknownObjectException
+import asyncio
+import logging
+import os
+import socket
+import time
+from analytics.metrics_collector import Metric
+from jobs.job_queue import Job, JobLost, JobQueue, CANCELLED
+from config import JOB_WORKER_CONCURRENCY, JOB_POLL_INTERVAL, JOB_RETENTION_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Seconds between purges of finished jobs
+_PURGE_INTERVAL = 3600
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+class ReviewWorker:
+    """
+    Drains a JobQueue with a ReviewManager, running up to `concurrency`
+    reviews at once. Any number of workers, in one process or many, can
+    share a queue.
+
+    While a review runs its lease is renewed every poll interval (at most
+    a third of the lease period); if the lease is lost, because the worker
+    stalled and another one took the job over or because the job was
+    cancelled or superseded by a newer push, the review is cancelled. The
+    lease is checked once more right before the review is posted. Each
+    agent's result is checkpointed as it finishes, so a job taken over
+    after a crash only runs the agents that had not finished.
+    """
+
+    def __init__(self, manager, queue: Optional[JobQueue] = None, worker_id: Optional[str] = None,
+                 concurrency: int = JOB_WORKER_CONCURRENCY, poll_interval: float = JOB_POLL_INTERVAL):
+        self.manager = manager
+        self.queue = queue or JobQueue()
+        self.worker_id = worker_id or default_worker_id()
+        self.concurrency = max(1, concurrency)
+        self.poll_interval = poll_interval
+        self.completed = 0
+        self.failed = 0
+        self._last_depth_report = 0.0
+        self._last_purge = 0.0
+
+    async def run(self, stop: Optional[asyncio.Event] = None, drain: bool = False):
+        """
+        Claims and runs jobs until `stop` is set, then waits for the running
+        ones. With `drain`, returns once no job is runnable or running.
+        """
+        stop = stop or asyncio.Event()
+        running: Set[asyncio.Task] = set()
+        logger.info(f"Worker {self.worker_id} started, {self.concurrency} concurrent reviews")
+        while not stop.is_set():
+            while len(running) < self.concurrency:
+                job = await asyncio.to_thread(self.queue.claim, self.worker_id)
+                if job is None:
+                    break
+                running.add(asyncio.create_task(self._run_job(job)))
+            await self._report_depth()
+            await self._purge_finished()
+            if drain and not running:
+                break
+            waiters = set(running) | {asyncio.create_task(stop.wait())}
+            done, _ = await asyncio.wait(waiters, timeout=self.poll_interval, return_when=asyncio.FIRST_COMPLETED)
+            running -= done
+            for task in waiters - running - done:
+                task.cancel()
+        if running:
+            logger.info(f"Worker {self.worker_id} stopping, waiting for {len(running)} running reviews")
+            await asyncio.gather(*running, return_exceptions=True)
+        await self._report_depth(force=True)
+        logger.info(f"Worker {self.worker_id} stopped: {self.completed} completed, {self.failed} failed")
+
+    async def _run_job(self, job: Job):
+        """Runs one claimed job and records its outcome in the queue."""
+        claimed_at = time.time()
+        labels = {"repo": job.repo, "pr": str(job.pr), "worker": self.worker_id}
+        metrics = [Metric(datetime.utcnow(), "job_wait_seconds",
+                          max(0.0, claimed_at - max(job.created_at, job.run_after)),
+                          {**labels, "attempt": str(job.attempts)})]
+        logger.info(f"Job {job.id}: reviewing {job.repo}#{job.pr} (attempt {job.attempts}/{job.max_attempts})")
+        review = asyncio.create_task(self.manager.review_pr(job.repo, job.pr, job.options,
+                                                            checkpoint=self.queue.checkpoint(job.id, self.worker_id)))
+        heartbeat = asyncio.create_task(self._heartbeat(job, review))
+        try:
+            results = await review
+        except asyncio.CancelledError:
+            if not heartbeat.done():
+                raise
+            await self._record_lost(job, metrics, labels)
+            return
+        except JobLost:
+            await self._record_lost(job, metrics, labels)
+            return
+        except Exception as e:
+            # A PR that is gone or has nothing to review won't get better on a retry
+            retry = not isinstance(e, (ValueError, UnknownObjectException))
+            state = await asyncio.to_thread(self.queue.fail, job.id, self.worker_id, str(e), retry)
+            self.failed += 1
+            logger.error(f"Job {job.id}: {job.repo}#{job.pr} failed ({e}); now {state}")
+            metrics.append(Metric(datetime.utcnow(), "job_failures", 1, {**labels, "state": str(state)}))
+            return
+        finally:
+            heartbeat.cancel()
+            metrics.append(Metric(datetime.utcnow(), "job_run_seconds", time.time() - claimed_at, labels))
+            self.manager.metrics.add_metrics(metrics)
+
+        summary = {
+            key: results[key] for key in ("status", "head_sha", "incomplete_agents", "resumed_agents", "incremental")
+            if key in results
+        }
+        if await asyncio.to_thread(self.queue.complete, job.id, self.worker_id, summary):
+            self.completed += 1
+            logger.info(f"Job {job.id}: {job.repo}#{job.pr} done ({results.get('status')})")
+            self.manager.metrics.add_metrics([
+                Metric(datetime.utcnow(), "job_latency_seconds", time.time() - job.created_at,
+                       {**labels, "attempts": str(job.attempts)})
+            ])
+        else:
+            logger.warning(f"Job {job.id}: finished after its lease was taken over; result not recorded")
+
+    async def _record_lost(self, job: Job, metrics: List[Metric], labels: Dict[str, str]):
+        """Logs why a review stopped after its job was taken away from this worker."""
+        current = await asyncio.to_thread(self.queue.get, job.id)
+        if current is not None and current.state == CANCELLED:
+            logger.info(f"Job {job.id}: stopped reviewing {job.repo}#{job.pr}: {current.error}")
+            metrics.append(Metric(datetime.utcnow(), "job_cancelled", 1, labels))
+        else:
+            logger.warning(f"Job {job.id}: lease lost, abandoned {job.repo}#{job.pr} to its new owner")
+
+    async def _heartbeat(self, job: Job, review: asyncio.Task):
+        """Renews the job's lease while it runs and cancels the review if the lease is lost."""
+        interval = max(0.5, min(self.poll_interval, self.queue.lease_seconds / 3))
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                renewed = await asyncio.to_thread(self.queue.renew, job.id, self.worker_id)
+            except Exception as e:
+                # Keep going; the lease only lapses if renewals fail for a whole period
+                logger.warning(f"Job {job.id}: error renewing lease: {e}")
+                continue
+            if not renewed:
+                review.cancel()
+                return
+
+    async def _purge_finished(self):
+        """Drops jobs finished more than JOB_RETENTION_SECONDS ago, at most once per _PURGE_INTERVAL."""
+        now = time.time()
+        if now - self._last_purge < _PURGE_INTERVAL:
+            return
+        self._last_purge = now
+        try:
+            purged = await asyncio.to_thread(self.queue.purge, JOB_RETENTION_SECONDS)
+            if purged:
+                logger.info(f"Purged {purged} finished jobs")
+        except Exception as e:
+            logger.error(f"Error purging finished jobs: {e}")
+
+    async def _report_depth(self, force: bool = False):
+        """Exports jobs per state and the oldest runnable job's age, at most once per poll interval."""
+        now = time.time()
+        if not force and now - self._last_depth_report < self.poll_interval:
+            return
+        self._last_depth_report = now
+        try:
+            stats = await asyncio.to_thread(self.queue.stats)
+        except Exception as e:
+            logger.error(f"Error reading job queue stats: {e}")
+            return
+        timestamp = datetime.utcnow()
+        metrics = [
+            Metric(timestamp, "job_queue_depth", count, {"state": state})
+            for state, count in stats["states"].items()
+        ]
+        metrics.append(Metric(timestamp, "job_queue_ready", stats["ready"], {}))
+        metrics.append(Metric(timestamp, "job_queue_oldest_ready_seconds", stats["oldest_ready_seconds"], {}))
+        self.manager.metrics.add_metrics(metrics)
+
+    def stats(self) -> Dict:
+        return {"worker": self.worker_id, "completed": self.completed, "failed": self.failed}
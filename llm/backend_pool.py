@@ -0,0 +1,230 @@
+# llm/backend_pool.py
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Collection, Dict, List, Optional, Sequence, Set
+import asyncio
+import logging
+import time
+import aiohttp
+from llm.session_pool import get_session_pool
+from config import (
+    OLLAMA_BASE_URLS,
+    OLLAMA_NUM_PARALLEL,
+    OLLAMA_HEALTH_INTERVAL,
+    OLLAMA_HEALTH_TIMEOUT,
+    OLLAMA_BACKEND_MAX_FAILURES,
+    OLLAMA_BACKEND_EJECT_SECONDS,
+    OLLAMA_BACKEND_MAX_EJECT_SECONDS
+)
+
+logger = logging.getLogger(__name__)
+
+# Weight of the newest health-check round trip in the latency average
+_LATENCY_ALPHA = 0.3
+
+class BackendError(Exception):
+    """A backend answered with a server error; counts as a failure of that backend."""
+
+class Backend:
+    """One Ollama server and what the pool knows about it."""
+
+    def __init__(self, url: str, parallel: int = OLLAMA_NUM_PARALLEL):
+        self.url = url.rstrip('/')
+        self.parallel = max(1, parallel)
+        self.in_flight = 0
+        self.latency: Optional[float] = None
+        self.loaded_models: Set[str] = set()
+        self.failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+        self.requests = 0
+
+    @property
+    def ejected(self) -> bool:
+        return self.ejections > 0 and self.failures >= OLLAMA_BACKEND_MAX_FAILURES
+
+    def record_latency(self, seconds: float):
+        self.latency = seconds if self.latency is None else \
+            _LATENCY_ALPHA * seconds + (1 - _LATENCY_ALPHA) * self.latency
+
+    def stats(self) -> Dict:
+        return {
+            "url": self.url,
+            "healthy": not self.ejected,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "latency": round(self.latency, 4) if self.latency is not None else None,
+            "loaded_models": sorted(self.loaded_models),
+            "failures": self.failures,
+            "ejections": self.ejections
+        }
+
+class BackendPool:
+    """
+    Routes LLM requests across several Ollama servers.
+
+    A request goes to the healthy backend that already has the model
+    loaded, then has the fewest requests in flight relative to its
+    parallelism, then answers health checks fastest. A backend whose
+    requests or checks fail OLLAMA_BACKEND_MAX_FAILURES times in a row is
+    ejected; background health checks probe it again after an exponential
+    backoff and re-admit it once it answers. When every backend is ejected
+    the one due back soonest is still tried rather than failing outright.
+    """
+
+    def __init__(self, urls: Sequence[str] = OLLAMA_BASE_URLS, parallel: int = OLLAMA_NUM_PARALLEL,
+                 health_interval: float = OLLAMA_HEALTH_INTERVAL,
+                 health_timeout: float = OLLAMA_HEALTH_TIMEOUT):
+        if not urls:
+            raise ValueError("BackendPool needs at least one Ollama URL")
+        self.backends: List[Backend] = [Backend(url, parallel) for url in urls]
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self._health_task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self.backends)
+
+    @property
+    def capacity(self) -> int:
+        """Requests the pool's backends can work on at once."""
+        return sum(b.parallel for b in self.backends)
+
+    def select(self, model: Optional[str] = None, prefer: Optional[str] = None,
+               exclude: Collection[str] = ()) -> Backend:
+        """
+        Picks the backend for a request. `prefer` names a backend to use
+        when it is healthy and not busier than the best alternative, e.g.
+        the one holding a primed prompt prefix in its cache; backends in
+        `exclude` (by URL) are only used when nothing else is left.
+        """
+        candidates = [b for b in self.backends if b.url not in exclude] or self.backends
+        healthy = [b for b in candidates if not b.ejected]
+        if not healthy:
+            return min(candidates, key=lambda b: b.ejected_until)
+
+        def score(b: Backend):
+            return (model not in b.loaded_models if model else False,
+                    b.in_flight / b.parallel,
+                    b.latency if b.latency is not None else float('inf'))
+
+        best = min(healthy, key=score)
+        if prefer:
+            for backend in healthy:
+                if backend.url == prefer and backend.in_flight / backend.parallel <= best.in_flight / best.parallel:
+                    return backend
+        return best
+
+    @asynccontextmanager
+    async def acquire(self, model: Optional[str] = None, prefer: Optional[str] = None,
+                      exclude: Collection[str] = ()) -> AsyncIterator[Backend]:
+        """
+        Holds a backend for one request. Connection errors, timeouts and
+        server errors raised inside count as failures of that backend.
+        """
+        self._ensure_health_checks()
+        backend = self.select(model, prefer, exclude)
+        backend.in_flight += 1
+        backend.requests += 1
+        try:
+            yield backend
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError, BackendError):
+            self.record_failure(backend)
+            raise
+        else:
+            self.record_success(backend, model)
+        finally:
+            backend.in_flight -= 1
+
+    def record_success(self, backend: Backend, model: Optional[str] = None):
+        if backend.ejected:
+            logger.info(f"Re-admitting Ollama backend {backend.url}")
+        backend.failures = 0
+        if model:
+            # Serving a request leaves the model loaded
+            backend.loaded_models.add(model)
+
+    def record_failure(self, backend: Backend):
+        backend.failures += 1
+        if backend.failures == OLLAMA_BACKEND_MAX_FAILURES:
+            backend.ejections += 1
+            backoff = min(OLLAMA_BACKEND_MAX_EJECT_SECONDS,
+                          OLLAMA_BACKEND_EJECT_SECONDS * 2 ** (backend.ejections - 1))
+            backend.ejected_until = time.monotonic() + backoff
+            logger.warning(f"Ejecting Ollama backend {backend.url} for {backoff:.0f}s "
+                           f"after {backend.failures} consecutive failures")
+        elif backend.ejected:
+            # Still failing probes: push the next probe further out
+            backend.ejected_until = time.monotonic() + min(
+                OLLAMA_BACKEND_MAX_EJECT_SECONDS,
+                OLLAMA_BACKEND_EJECT_SECONDS * 2 ** (backend.ejections - 1))
+
+    async def check(self, backend: Backend) -> bool:
+        """Probes one backend: /api/tags for liveness and latency, /api/ps for loaded models."""
+        session = get_session_pool().get_session()
+        timeout = aiohttp.ClientTimeout(total=self.health_timeout)
+        start = time.perf_counter()
+        try:
+            async with session.get(f"{backend.url}/api/tags", timeout=timeout) as response:
+                if response.status != 200:
+                    raise BackendError(f"status {response.status}")
+                await response.read()
+            backend.record_latency(time.perf_counter() - start)
+            async with session.get(f"{backend.url}/api/ps", timeout=timeout) as response:
+                if response.status == 200:
+                    running = await response.json()
+                    backend.loaded_models = {m.get("name") or m.get("model") for m in running.get("models", [])}
+        except (aiohttp.ClientError, asyncio.TimeoutError, BackendError, ValueError) as e:
+            logger.debug(f"Health check of {backend.url} failed: {e}")
+            self.record_failure(backend)
+            return False
+        self.record_success(backend)
+        return True
+
+    async def check_all(self, due_only: bool = False) -> bool:
+        """Probes every backend (or only those due) and returns whether any of them answered."""
+        now = time.monotonic()
+        backends = [b for b in self.backends if not due_only or not b.ejected or b.ejected_until <= now]
+        return any(await asyncio.gather(*(self.check(b) for b in backends)))
+
+    def _ensure_health_checks(self):
+        """Starts the background checks on first use; a single backend relies on request outcomes alone."""
+        if len(self.backends) < 2 or not self.health_interval:
+            return
+        loop = asyncio.get_running_loop()
+        if self._health_task is None or self._health_task.done() or self._health_task.get_loop() is not loop:
+            self._health_task = loop.create_task(self._health_loop())
+
+    async def _health_loop(self):
+        while True:
+            try:
+                await self.check_all(due_only=True)
+            except Exception as e:
+                logger.error(f"Error checking Ollama backends: {e}")
+            await asyncio.sleep(self.health_interval)
+
+    async def close(self):
+        """Stops the background health checks."""
+        task, self._health_task = self._health_task, None
+        if task is not None and not task.done() and task.get_loop() is asyncio.get_running_loop():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    def stats(self) -> List[Dict]:
+        return [b.stats() for b in self.backends]
+
+_backend_pool: Optional[BackendPool] = None
+
+def get_backend_pool() -> BackendPool:
+    """Returns the process-wide pool of the configured Ollama servers."""
+    global _backend_pool
+    if _backend_pool is None:
+        _backend_pool = BackendPool()
+    return _backend_pool
+
+async def close_backend_pool():
+    """Stops the process-wide pool's health checks, if it was created."""
+    if _backend_pool is not None:
+        await _backend_pool.close()
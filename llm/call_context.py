@@ -0,0 +1,99 @@
+# llm/call_context.py
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional
+import logging
+from analytics.metrics_collector import Metric
+from llm.llm_result import LLMResult
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class CallContext:
+    """
+    Who an LLM call is made for. Set by the orchestrator around each agent
+    task so that code deep in the call path can label what it records
+    without every signature carrying the review along.
+    """
+    agent: Optional[str] = None
+    repo: Optional[str] = None
+    pr: Optional[int] = None
+    # Scheduling class of the review (interactive, webhook, backfill) and its changed lines
+    priority: Optional[str] = None
+    size: int = 0
+    # Receives (metric name, value) for the review in progress
+    metric_sink: Optional[Callable[[str, float], None]] = None
+    # Collects labelled per-call metrics until the review writes them out
+    call_metrics: Optional[List[Metric]] = None
+    # Receives the model route the agent chose (see llm.model_router)
+    route_sink: Optional[Callable[[Dict], None]] = None
+
+_current: ContextVar[CallContext] = ContextVar("llm_call_context", default=CallContext())
+
+def current_call_context() -> CallContext:
+    return _current.get()
+
+@contextmanager
+def use_call_context(context: CallContext) -> Iterator[CallContext]:
+    """Makes `context` current for the enclosed code and tasks it creates."""
+    token = _current.set(context)
+    try:
+        yield context
+    finally:
+        _current.reset(token)
+
+def record_metric(name: str, value: float):
+    """Adds `value` to the named metric of the current review, if any."""
+    sink = _current.get().metric_sink
+    if sink is None:
+        return
+    try:
+        sink(name, value)
+    except Exception as e:
+        logger.warning(f"Failed to record metric {name}: {e}")
+
+def record_route(route: Dict):
+    """Reports the model and limits the current agent reviews with."""
+    sink = _current.get().route_sink
+    if sink is not None:
+        sink(route)
+
+# Per-call values that add up meaningfully into the review's per-agent counters
+_COUNTERS = ("llm_total_seconds", "llm_load_seconds", "llm_prompt_eval_tokens", "llm_prompt_eval_seconds",
+             "llm_eval_tokens")
+
+def record_llm_call(result: LLMResult, kind: str = "generate"):
+    """
+    Records one LLM call for the current review: a labelled metric per
+    Ollama timing, plus call, cache-hit and error counts and token and time
+    totals on the agent's counters.
+    """
+    values = result.metrics()
+    record_metric("llm_calls", 1)
+    if result.cached:
+        record_metric("llm_cache_hits", 1)
+    if not result.ok:
+        record_metric("llm_errors", 1)
+    for name in _COUNTERS:
+        if name in values:
+            record_metric(name, values[name])
+    record_call_metrics(values, model=result.model, kind=kind)
+
+def record_call_metrics(values: Dict[str, float], **labels: str):
+    """
+    Buffers labelled metrics for the current review, tagged with its agent,
+    repo and PR on top of `labels`. Does nothing outside a review.
+    """
+    context = _current.get()
+    if context.call_metrics is None or not values:
+        return
+    labels = {
+        "agent": context.agent or "",
+        "repo": context.repo or "",
+        "pr": str(context.pr or ""),
+        **labels
+    }
+    timestamp = datetime.utcnow()
+    context.call_metrics.extend(Metric(timestamp, name, value, labels) for name, value in values.items())
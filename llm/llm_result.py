@@ -0,0 +1,75 @@
+# llm/llm_result.py
+from dataclasses import dataclass
+from typing import Dict, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Ollama reports durations in nanoseconds
+_NS = 1e9
+
+@dataclass(frozen=True)
+class LLMResult:
+    """
+    A completion together with Ollama's accounting for it.
+
+    Durations are in nanoseconds as Ollama reports them; counts are tokens.
+    Cached and failed results carry no timings.
+    """
+    text: str
+    model: str
+    total_duration: int = 0
+    load_duration: int = 0
+    prompt_eval_count: int = 0
+    prompt_eval_duration: int = 0
+    eval_count: int = 0
+    eval_duration: int = 0
+    cached: bool = False
+    error: Optional[str] = None
+
+    @classmethod
+    def from_response(cls, result: Dict, model: str, text: Optional[str] = None) -> "LLMResult":
+        """Builds a result from an /api/generate response or a stream's final event."""
+        return cls(
+            text=result.get("response", "") if text is None else text,
+            model=result.get("model") or model,
+            total_duration=int(result.get("total_duration") or 0),
+            load_duration=int(result.get("load_duration") or 0),
+            prompt_eval_count=int(result.get("prompt_eval_count") or 0),
+            prompt_eval_duration=int(result.get("prompt_eval_duration") or 0),
+            eval_count=int(result.get("eval_count") or 0),
+            eval_duration=int(result.get("eval_duration") or 0)
+        )
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    @property
+    def tokens_per_second(self) -> float:
+        """Generation speed, excluding prompt evaluation and model load."""
+        return self.eval_count / (self.eval_duration / _NS) if self.eval_duration else 0.0
+
+    @property
+    def prompt_tokens_per_second(self) -> float:
+        return self.prompt_eval_count / (self.prompt_eval_duration / _NS) if self.prompt_eval_duration else 0.0
+
+    @property
+    def prompt_eval_share(self) -> float:
+        """Fraction of the request's total time spent evaluating the prompt."""
+        return self.prompt_eval_duration / self.total_duration if self.total_duration else 0.0
+
+    def metrics(self) -> Dict[str, float]:
+        """Metric values for this call, with durations in seconds."""
+        if self.cached or not self.ok or not self.total_duration:
+            return {}
+        return {
+            "llm_total_seconds": self.total_duration / _NS,
+            "llm_load_seconds": self.load_duration / _NS,
+            "llm_prompt_eval_tokens": self.prompt_eval_count,
+            "llm_prompt_eval_seconds": self.prompt_eval_duration / _NS,
+            "llm_eval_tokens": self.eval_count,
+            "llm_eval_seconds": self.eval_duration / _NS,
+            "llm_tokens_per_second": self.tokens_per_second,
+            "llm_prompt_eval_share": self.prompt_eval_share
+        }
@@ -0,0 +1,102 @@
+# llm/model_router.py
+from dataclasses import asdict, dataclass
+from typing import Dict, Mapping, Optional, Sequence
+import logging
+from llm.prompt_budget import PromptBudget
+from config import (
+    OLLAMA_MODEL,
+    OLLAMA_MODEL_PER_AGENT,
+    OLLAMA_SMALL_MODEL,
+    OLLAMA_SMALL_MODEL_AGENTS,
+    OLLAMA_SMALL_MODEL_MAX_LINES,
+    OLLAMA_NUM_CTX,
+    OLLAMA_NUM_CTX_PER_AGENT,
+    OLLAMA_NUM_CTX_PER_MODEL,
+    OLLAMA_NUM_PREDICT_PER_AGENT,
+    PROMPT_RESERVED_OUTPUT_TOKENS
+)
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class ModelRoute:
+    """The model and generation limits chosen for one agent's review."""
+    agent: str
+    model: str
+    num_ctx: int
+    num_predict: int
+    reason: str
+
+    @property
+    def budget(self) -> PromptBudget:
+        """Prompt budget of the route; the output share is the num_predict cap."""
+        return PromptBudget(self.num_ctx, reserved_output=self.num_predict)
+
+    @property
+    def options(self) -> Dict:
+        """Ollama options for calls on this route."""
+        return {"num_ctx": self.num_ctx, "num_predict": self.num_predict}
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+class ModelRouter:
+    """
+    Chooses the model, context window and output cap for each agent.
+
+    The small model serves the agents listed for it (documentation and
+    dependencies by default) when the PR changes at most `small_max_lines`
+    lines; otherwise an agent's own model is used, falling back to the
+    default. num_ctx comes from the agent's setting, capped by the model's
+    window. It does not vary with diff size: Ollama reloads a model when
+    num_ctx changes, and agents sharing a prompt prefix need equal windows.
+    """
+
+    def __init__(self,
+                 default_model: str = OLLAMA_MODEL,
+                 agent_models: Mapping[str, str] = OLLAMA_MODEL_PER_AGENT,
+                 small_model: str = OLLAMA_SMALL_MODEL,
+                 small_agents: Sequence[str] = OLLAMA_SMALL_MODEL_AGENTS,
+                 small_max_lines: int = OLLAMA_SMALL_MODEL_MAX_LINES,
+                 num_ctx: int = OLLAMA_NUM_CTX,
+                 agent_num_ctx: Mapping[str, int] = OLLAMA_NUM_CTX_PER_AGENT,
+                 model_num_ctx: Mapping[str, int] = OLLAMA_NUM_CTX_PER_MODEL,
+                 agent_num_predict: Mapping[str, int] = OLLAMA_NUM_PREDICT_PER_AGENT,
+                 num_predict: int = PROMPT_RESERVED_OUTPUT_TOKENS):
+        self.default_model = default_model
+        self.agent_models = dict(agent_models)
+        self.small_model = small_model
+        self.small_agents = frozenset(small_agents)
+        self.small_max_lines = small_max_lines
+        self.num_ctx = num_ctx
+        self.agent_num_ctx = dict(agent_num_ctx)
+        self.model_num_ctx = dict(model_num_ctx)
+        self.agent_num_predict = dict(agent_num_predict)
+        self.num_predict = num_predict
+
+    def route(self, agent_type: str, changed_lines: int) -> ModelRoute:
+        """Picks the route for `agent_type` reviewing a PR of `changed_lines` lines."""
+        if self.small_model and agent_type in self.small_agents and \
+                (not self.small_max_lines or changed_lines <= self.small_max_lines):
+            model, reason = self.small_model, f"small model: {changed_lines} changed lines"
+        elif agent_type in self.agent_models:
+            model, reason = self.agent_models[agent_type], "agent model"
+        else:
+            model, reason = self.default_model, "default model"
+
+        num_ctx = self.agent_num_ctx.get(agent_type, self.num_ctx)
+        if model in self.model_num_ctx:
+            num_ctx = min(num_ctx, self.model_num_ctx[model])
+        num_predict = self.agent_num_predict.get(agent_type, self.num_predict)
+        # Leave at least a quarter of the window for the prompt
+        num_predict = max(1, min(num_predict, num_ctx * 3 // 4))
+        return ModelRoute(agent_type, model, num_ctx, num_predict, reason)
+
+_model_router: Optional[ModelRouter] = None
+
+def get_model_router() -> ModelRouter:
+    """Returns the process-wide router built from configuration."""
+    global _model_router
+    if _model_router is None:
+        _model_router = ModelRouter()
+    return _model_router
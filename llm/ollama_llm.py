@@ -1,48 +1,341 @@
 # llm/ollama_llm.py
-import requests
-from typing import Optional, List
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, Optional, List, Tuple
+import asyncio
+import hashlib
 import logging
 import json
-from config import OLLAMA_BASE_URL, OLLAMA_MODEL, OLLAMA_TEMPERATURE
 import aiohttp
+from config import (
+    OLLAMA_MODEL,
+    OLLAMA_TEMPERATURE,
+    OLLAMA_KEEP_ALIVE,
+    OLLAMA_PREFIX_REUSE,
+    LLM_CACHE_ENABLED
+)
+from llm.backend_pool import BackendError, BackendPool, get_backend_pool
+from llm.call_context import record_llm_call
+from llm.llm_result import LLMResult
+from llm.scheduler import LLMScheduler, get_llm_scheduler
+from llm.session_pool import get_session_pool
+from llm.streaming import StopCondition, StreamState
+from llm.response_cache import ResponseCache, get_response_cache
 
 logger = logging.getLogger(__name__)
 
+# Primed prefix contexts and the backend that evaluated them, shared by every
+# client since each agent has its own
+_PREFIX_CACHE_SIZE = 32
+_prefix_contexts: "OrderedDict[Tuple[str, str, str], Tuple[List[int], str]]" = OrderedDict()
+_prefix_pending: Dict[Tuple[str, str, str], asyncio.Future] = {}
+
+def _prefix_hash(prefix: str) -> str:
+    return hashlib.sha256(prefix.encode("utf-8")).hexdigest()
+
 class OllamaLLM:
-    def __init__(self):
-        self.base_url = "http://localhost:11434"
-        self.model = "llama3:latest"
+    def __init__(self, cache: Optional[ResponseCache] = None, scheduler: Optional[LLMScheduler] = None,
+                 backends: Optional[BackendPool] = None):
+        # The Ollama servers requests are routed across
+        self.backends = backends or get_backend_pool()
+        self.model = OLLAMA_MODEL
         self.temperature = OLLAMA_TEMPERATURE
+        self.keep_alive = OLLAMA_KEEP_ALIVE
+        self.prefix_reuse = OLLAMA_PREFIX_REUSE
+        # Extra Ollama generation options (num_ctx, num_predict, ...)
+        self.options: Dict = {}
+        if cache is None and LLM_CACHE_ENABLED:
+            cache = get_response_cache()
+        self.cache = cache
+        # Every request to Ollama waits for a slot here
+        self.scheduler = scheduler or get_llm_scheduler()
+
+    @property
+    def base_url(self) -> str:
+        """URL of the first backend."""
+        return self.backends.backends[0].url
+
+    @base_url.setter
+    def base_url(self, url: str):
+        """Sends this client's requests to a single server."""
+        self.backends = BackendPool([url])
+
+    def _request_options(self, extra: Optional[Dict] = None) -> Dict:
+        options = {"temperature": self.temperature, **self.options}
+        if extra:
+            options.update(extra)
+        return options
+
+    async def _cache_get(self, key: str) -> Optional[Dict]:
+        if self.cache is None:
+            return None
+        return await asyncio.to_thread(self.cache.get, key)
+
+    async def _cache_put(self, key: str, value: Dict):
+        if self.cache is not None:
+            await asyncio.to_thread(self.cache.put, key, value)
+
+    def _payload(self, prompt: str, options: Dict, stream: bool, context: Optional[List[int]] = None,
+                 model: Optional[str] = None) -> Dict:
+        payload = {
+            "model": model or self.model,
+            "prompt": prompt,
+            "stream": stream,
+            "options": options
+        }
+        if self.keep_alive:
+            payload["keep_alive"] = self.keep_alive
+        if context:
+            payload["context"] = context
+        return payload
+
+    async def _request(self, payload: Dict, prefer: Optional[str] = None) -> Tuple[Dict, str]:
+        """
+        Sends a non-streaming generate request and returns the response and
+        the URL of the backend that served it. When a backend cannot be
+        reached, times out or answers with a server error, the request is
+        retried on each other backend once.
+        """
+        session = get_session_pool().get_session()
+        tried = set()
+        while True:
+            backend = None
+            try:
+                async with self.backends.acquire(payload["model"], prefer, exclude=tried) as backend:
+                    async with session.post(f"{backend.url}/api/generate", json=payload) as response:
+                        if response.status >= 500:
+                            raise BackendError(f"Ollama API error: {await response.text()}")
+                        if response.status != 200:
+                            raise Exception(f"Ollama API error: {await response.text()}")
+                        return await response.json(), backend.url
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError, BackendError) as e:
+                if backend is None:
+                    raise
+                tried.add(backend.url)
+                if len(tried) >= len(self.backends):
+                    raise
+                logger.warning(f"Ollama backend {backend.url} failed, retrying on another: {e}")
+                prefer = None
+
+    async def _prefix_context(self, prefix: str, options: Dict, model: str) -> Optional[Tuple[List[int], str]]:
+        """
+        Returns Ollama's context for `prefix`, evaluating it at most once,
+        with the URL of the backend holding it in its cache.
+
+        The prefix is sent alone with a one-token generation budget; the
+        `context` Ollama returns encodes the evaluated tokens, and passing it
+        with later prompts lets the server reuse its KV cache for the prefix.
+        The generated token is cut from the context, so the model never sees
+        a truncated reply to the prefix. The prompt sent with the context is
+        still templated as a turn of its own after the prefix's turn, which
+        is not identical to sending the prefix inline as one message, so
+        this is opt-in (OLLAMA_PREFIX_REUSE).
+
+        Concurrent callers with the same prefix wait for a single priming
+        request. Returns None when priming fails, so callers fall back to
+        sending the prefix inline.
+        """
+        # The output cap does not change how the prefix is evaluated
+        options = {k: v for k, v in options.items() if k != "num_predict"}
+        key = (model, json.dumps(options, sort_keys=True), _prefix_hash(prefix))
+        primed = _prefix_contexts.get(key)
+        if primed is not None:
+            _prefix_contexts.move_to_end(key)
+            return primed
+
+        loop = asyncio.get_running_loop()
+        pending = _prefix_pending.get(key)
+        if pending is not None and pending.get_loop() is loop:
+            return await asyncio.shield(pending)
+
+        future = loop.create_future()
+        _prefix_pending[key] = future
+        primed = None
+        try:
+            payload = self._payload(prefix, {**options, "num_predict": 1}, stream=False, model=model)
+            async with self.scheduler.slot():
+                result, url = await self._request(payload)
+            record_llm_call(LLMResult.from_response(result, model), kind="prefix")
+            context = result.get("context") or []
+            generated = result.get("eval_count") or 0
+            if 0 < generated < len(context):
+                context = context[:-generated]
+            if context:
+                primed = (context, url)
+                _prefix_contexts[key] = primed
+                while len(_prefix_contexts) > _PREFIX_CACHE_SIZE:
+                    _prefix_contexts.popitem(last=False)
+                logger.debug(f"Primed prompt prefix: {result.get('prompt_eval_count')} tokens "
+                             f"in {result.get('prompt_eval_duration', 0) / 1e9:.2f}s")
+        except Exception as e:
+            logger.warning(f"Could not prime prompt prefix, sending it inline: {e}")
+        finally:
+            future.set_result(primed)
+            if _prefix_pending.get(key) is future:
+                del _prefix_pending[key]
+        return primed
+
+    async def _resolve_prefix(self, prompt: str, prefix: Optional[str], options: Dict,
+                              model: str) -> Tuple[str, Optional[List[int]], Optional[str]]:
+        """
+        Returns the prompt to send, the context to send it with and the
+        backend that has that context cached.
+        """
+        if not prefix:
+            return prompt, None, None
+        if self.prefix_reuse:
+            primed = await self._prefix_context(prefix, options, model)
+            if primed is not None:
+                return prompt, primed[0], primed[1]
+        return prefix + prompt, None, None
 
     async def check_connection(self) -> bool:
+        """Probes every backend and returns whether at least one is up."""
         try:
-            response = requests.get(f"{OLLAMA_BASE_URL}/api/tags", timeout=5)
-            return response.status_code == 200
+            return await self.backends.check_all()
         except Exception as e:
             logger.error(f"Ollama connection check failed: {e}")
             return False
 
-    async def call(self, prompt: str) -> str:
+    async def call(self, prompt: str, options: Optional[Dict] = None, prefix: Optional[str] = None,
+                   model: Optional[str] = None) -> str:
+        """
+        Generates a completion and returns its text, or "Error: ..." on failure.
+
+        Args:
+            prompt: The prompt, or the part after `prefix` when one is given
+            options: Per-call Ollama options (e.g. num_ctx) on top of the defaults
+            prefix: Prompt opening shared with other calls; evaluated once and
+                reused through Ollama's context
+            model: Model to use instead of the client's default
+        """
+        result = await self.generate(prompt, options, prefix, model)
+        return result.text if result.ok else f"Error: {result.error}"
+
+    async def generate(self, prompt: str, options: Optional[Dict] = None, prefix: Optional[str] = None,
+                       model: Optional[str] = None) -> LLMResult:
+        """
+        Generates a completion with Ollama's timings and token counts.
+
+        Takes the same arguments as `call`. Every call is recorded for the
+        current review (see `record_llm_call`); failures are returned as a
+        result with `error` set rather than raised.
+        """
+        model = model or self.model
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    f"{self.base_url}/api/generate",
-                    json={
-                        "model": self.model,
-                        "prompt": prompt,
-                        "stream": False
-                    }
-                ) as response:
-                    if response.status != 200:
-                        error_text = await response.text()
-                        raise Exception(f"Ollama API error: {error_text}")
-                        
-                    result = await response.json()
-                    if "response" in result:
-                        return result["response"]
-                    else:
-                        raise Exception("Invalid response format from Ollama")
-                        
+            options = self._request_options(options)
+            cache_options = {**options, "prefix": _prefix_hash(prefix)} if prefix else options
+            cache_key = ResponseCache.make_key(model, self.temperature, cache_options, prompt)
+            cached = await self._cache_get(cache_key)
+            if cached is not None:
+                result = LLMResult(text=cached["response"], model=model, cached=True)
+                record_llm_call(result)
+                return result
+
+            prompt, context, prefer = await self._resolve_prefix(prompt, prefix, options, model)
+            payload = self._payload(prompt, options, stream=False, context=context, model=model)
+            async with self.scheduler.slot():
+                result, _ = await self._request(payload, prefer)
+            if "response" not in result:
+                raise Exception("Invalid response format from Ollama")
+            await self._cache_put(cache_key, {"response": result["response"]})
+            result = LLMResult.from_response(result, model)
+            record_llm_call(result)
+            return result
+                    
         except Exception as e:
             logger.error(f"Error communicating with Ollama: {e}")
-            return f"Error: {str(e)}"
\ No newline at end of file
+            result = LLMResult(text="", model=model, error=str(e))
+            record_llm_call(result)
+            return result
+
+    async def stream(self, prompt: str, stop: Optional[StopCondition] = None,
+                     options: Optional[Dict] = None, prefix: Optional[str] = None,
+                     model: Optional[str] = None) -> AsyncIterator[str]:
+        """
+        Streams a completion from Ollama as it is generated.
+
+        Args:
+            prompt: The prompt to complete
+            stop: Optional conditions that end generation early
+            options: Per-call Ollama options (e.g. num_ctx) on top of the defaults
+            prefix: Prompt opening shared with other calls (see `call`)
+            model: Model to use instead of the client's default
+
+        Yields:
+            Text chunks in generation order. When a stop condition triggers,
+            the last chunk is truncated and the request is aborted so Ollama
+            stops generating. Like `call`, a request that fails on a backend
+            before any text arrives is retried on each other backend once.
+        """
+        model = model or self.model
+        state = StreamState(stop)
+        base_options = self._request_options(options)
+        options = dict(base_options)
+        if state.condition.stop_sequences:
+            options["stop"] = list(state.condition.stop_sequences)
+        stop_key = state.condition.cache_key()
+        cache_key = None
+        if stop_key is not None:
+            cache_options = {**options, "stream_stop": stop_key}
+            if prefix:
+                cache_options["prefix"] = _prefix_hash(prefix)
+            cache_key = ResponseCache.make_key(model, self.temperature, cache_options, prompt)
+        cached = await self._cache_get(cache_key) if cache_key is not None else None
+        if cached is not None:
+            record_llm_call(LLMResult(text=cached["response"], model=model, cached=True), kind="stream")
+            yield cached["response"]
+            return
+
+        # Prime with the generation options, without the stream's stop sequences
+        prompt, context, prefer = await self._resolve_prefix(prompt, prefix, base_options, model)
+        payload = self._payload(prompt, options, stream=True, context=context, model=model)
+        session = get_session_pool().get_session()
+        tried = set()
+        async with self.scheduler.slot():
+            while True:
+                backend = None
+                try:
+                    async with self.backends.acquire(model, prefer, exclude=tried) as backend, \
+                            session.post(f"{backend.url}/api/generate", json=payload) as response:
+                        if response.status != 200:
+                            error_text = await response.text()
+                            raise (BackendError if response.status >= 500 else Exception)(
+                                f"Ollama API error: {error_text}")
+
+                        async for line in response.content:
+                            if not line.strip():
+                                continue
+                            event = json.loads(line)
+                            if "error" in event:
+                                raise Exception(f"Ollama API error: {event['error']}")
+
+                            chunk = state.feed(event.get("response", ""))
+                            if chunk:
+                                yield chunk
+                            if state.stop_reason:
+                                logger.debug(f"Stopping generation early ({state.stop_reason}) "
+                                             f"after {state.length} chars")
+                                # Dropping the connection is what makes Ollama abandon the request
+                                response.close()
+                                record_llm_call(LLMResult(text=state.text, model=model), kind="stream")
+                                break
+                            if event.get("done"):
+                                # The final event carries the request's timings
+                                record_llm_call(LLMResult.from_response(event, model, text=state.text),
+                                                kind="stream")
+                                break
+                        else:
+                            raise Exception("Ollama stream ended before generation finished")
+                    break
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError, BackendError) as e:
+                    # Once generated text has come in, a retry would repeat it
+                    if backend is None or state.length:
+                        raise
+                    tried.add(backend.url)
+                    if len(tried) >= len(self.backends):
+                        raise
+                    logger.warning(f"Ollama backend {backend.url} failed, retrying stream on another: {e}")
+                    prefer = None
+
+        if cache_key is not None:
+            await self._cache_put(cache_key, {"response": state.text})
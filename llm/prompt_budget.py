@@ -0,0 +1,160 @@
+# llm/prompt_budget.py
+from dataclasses import dataclass
+from typing import Dict, List, Mapping
+import logging
+import math
+from utils.diff_parser import FileDiff
+from config import (
+    OLLAMA_NUM_CTX,
+    OLLAMA_NUM_CTX_PER_AGENT,
+    PROMPT_RESERVED_OUTPUT_TOKENS,
+    PROMPT_CHARS_PER_TOKEN,
+    PROMPT_COMMENTS_SHARE
+)
+
+logger = logging.getLogger(__name__)
+
+# Tokens taken by the "File:" line, fences and line counts around each file
+FILE_OVERHEAD_TOKENS = 32
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimates the token count of `text`. Deliberately conservative: code
+    and diffs tokenize denser than prose, so a low chars-per-token ratio
+    keeps prompts from overflowing the context window.
+    """
+    return math.ceil(len(text) / PROMPT_CHARS_PER_TOKEN)
+
+@dataclass(frozen=True)
+class PromptBudget:
+    """The context window of one agent's LLM calls, split into prompt and output."""
+    num_ctx: int
+    reserved_output: int = PROMPT_RESERVED_OUTPUT_TOKENS
+    comments_share: float = PROMPT_COMMENTS_SHARE
+
+    @classmethod
+    def for_agent(cls, agent_type: str) -> "PromptBudget":
+        return cls(OLLAMA_NUM_CTX_PER_AGENT.get(agent_type, OLLAMA_NUM_CTX))
+
+    @property
+    def input_tokens(self) -> int:
+        return max(256, self.num_ctx - self.reserved_output)
+
+    @property
+    def options(self) -> Dict:
+        """Ollama options that give the model this context window."""
+        return {"num_ctx": self.num_ctx}
+
+    def fits(self, prompt: str) -> bool:
+        return estimate_tokens(prompt) <= self.input_tokens
+
+    def trim_comments(self, comments: str) -> str:
+        """Keeps the most recent previous comments within their share of the prompt."""
+        limit = int(self.input_tokens * self.comments_share * PROMPT_CHARS_PER_TOKEN)
+        if len(comments) <= limit:
+            return comments
+        return "[earlier comments omitted]\n" + comments[len(comments) - limit:]
+
+    def trim(self, text: str, tokens: int) -> str:
+        """Cuts `text` to roughly `tokens` tokens."""
+        limit = max(0, int(tokens * PROMPT_CHARS_PER_TOKEN))
+        if len(text) <= limit:
+            return text
+        return text[:limit] + "\n[truncated]"
+
+def _piece(diff: FileDiff, header: str, body: str) -> FileDiff:
+    added = removed = 0
+    for line in body.split('\n'):
+        if line.startswith('+'):
+            added += 1
+        elif line.startswith('-'):
+            removed += 1
+    return FileDiff(
+        content=f"{header}\n{body}" if header else body,
+        added_lines=added,
+        removed_lines=removed,
+        modified_lines=body.count('\n@@') + body.startswith('@@'),
+        old_path=diff.old_path,
+        new_path=diff.new_path,
+        status=diff.status
+    )
+
+def _split_file(diff: FileDiff, max_tokens: int) -> List[FileDiff]:
+    """Splits one file's diff at hunk boundaries, and inside hunks only when a hunk alone is too big."""
+    if not diff.hunks:
+        return [_piece(diff, "", text) for text in _split_lines(diff.content, max_tokens)]
+    header = diff.content[:diff.hunks[0].header_offset].rstrip('\n')
+    body_tokens = max(1, max_tokens - estimate_tokens(header))
+    pieces: List[FileDiff] = []
+    current: List[str] = []
+    current_tokens = 0
+    for index in range(len(diff.hunks)):
+        text = diff.hunk_text(index)
+        tokens = estimate_tokens(text) + 1
+        if current and current_tokens + tokens > body_tokens:
+            pieces.append(_piece(diff, header, "\n".join(current)))
+            current, current_tokens = [], 0
+        if tokens > body_tokens:
+            hunk_header, _, hunk_body = text.partition('\n')
+            for part in _split_lines(hunk_body, body_tokens - estimate_tokens(hunk_header) - 1):
+                pieces.append(_piece(diff, header, f"{hunk_header}\n{part}"))
+            continue
+        current.append(text)
+        current_tokens += tokens
+    if current:
+        pieces.append(_piece(diff, header, "\n".join(current)))
+    return pieces
+
+def _split_lines(text: str, max_tokens: int) -> List[str]:
+    """Splits text at line boundaries into parts of at most `max_tokens`."""
+    limit = max(1, int(max_tokens * PROMPT_CHARS_PER_TOKEN))
+    parts: List[str] = []
+    current: List[str] = []
+    size = 0
+    for line in text.split('\n'):
+        while len(line) > limit:
+            if current:
+                parts.append("\n".join(current))
+                current, size = [], 0
+            parts.append(line[:limit])
+            line = line[limit:]
+        if current and size + len(line) + 1 > limit:
+            parts.append("\n".join(current))
+            current, size = [], 0
+        current.append(line)
+        size += len(line) + 1
+    if current:
+        parts.append("\n".join(current))
+    return parts
+
+def split_diffs(diffs: Mapping[str, FileDiff], max_tokens: int) -> List[Dict[str, FileDiff]]:
+    """
+    Packs files into chunks whose formatted size stays within `max_tokens`.
+
+    Files are kept whole and packed in order when they fit; larger files
+    are split by hunk, and their parts are labelled "path (part i/n)".
+    """
+    max_tokens = max(64, max_tokens)
+    chunks: List[Dict[str, FileDiff]] = []
+    current: Dict[str, FileDiff] = {}
+    current_tokens = 0
+
+    def add(name: str, diff: FileDiff, tokens: int):
+        nonlocal current, current_tokens
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append(current)
+            current, current_tokens = {}, 0
+        current[name] = diff
+        current_tokens += tokens
+
+    for filename, diff in diffs.items():
+        tokens = estimate_tokens(diff.content) + FILE_OVERHEAD_TOKENS
+        if tokens <= max_tokens:
+            add(filename, diff, tokens)
+            continue
+        pieces = _split_file(diff, max_tokens - FILE_OVERHEAD_TOKENS)
+        for i, piece in enumerate(pieces, start=1):
+            add(f"{filename} (part {i}/{len(pieces)})", piece, estimate_tokens(piece.content) + FILE_OVERHEAD_TOKENS)
+    if current:
+        chunks.append(current)
+    return chunks
@@ -0,0 +1,186 @@
+# llm/response_cache.py
+from typing import Dict, Optional
+from contextlib import closing
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+from config import LLM_CACHE_PATH, LLM_CACHE_MAX_BYTES, LLM_CACHE_TTL
+
+logger = logging.getLogger(__name__)
+
+class ResponseCache:
+    """
+    Content-addressed on-disk cache of LLM responses.
+
+    Entries live in a SQLite database in WAL mode so several worker processes
+    can share one cache file. The store is bounded by total payload size and
+    evicts least-recently-used entries first; entries older than the TTL are
+    treated as misses and purged.
+    """
+
+    def __init__(self, path: str = LLM_CACHE_PATH, max_bytes: int = LLM_CACHE_MAX_BYTES, ttl: float = LLM_CACHE_TTL):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._ensure_storage_path()
+        self._init_db()
+
+    def _ensure_storage_path(self):
+        """Ensure cache storage directory exists."""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA busy_timeout = 30000")
+        return conn
+
+    def _init_db(self):
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses (last_access)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS counters (
+                    name TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
+                )
+            """)
+
+    @staticmethod
+    def make_key(model: str, temperature: float, options: Optional[Dict], prompt: str) -> str:
+        """Hashes everything that determines the model's output into a cache key."""
+        material = json.dumps({
+            "model": model,
+            "temperature": temperature,
+            "options": options or {},
+            "prompt": prompt
+        }, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Returns the cached result for `key`, or None on a miss."""
+        try:
+            now = time.time()
+            conn = self._connect()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                row = conn.execute(
+                    "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and self.ttl and now - row[1] > self.ttl:
+                    conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    row = None
+                if row is not None:
+                    conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+                self._bump_counter(conn, "hits" if row is not None else "misses")
+                conn.execute("COMMIT")
+            finally:
+                conn.close()
+        except Exception as e:
+            logger.error(f"Error reading LLM response cache: {e}")
+            row = None
+
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, value: Dict):
+        """Stores a result and evicts old entries to stay within the size bound."""
+        try:
+            payload = json.dumps(value, ensure_ascii=False)
+            size = len(payload.encode("utf-8"))
+            if self.max_bytes and size > self.max_bytes:
+                return
+            now = time.time()
+            conn = self._connect()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, size, created_at, last_access) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, payload, size, now, now)
+                )
+                self._evict(conn, now)
+                conn.execute("COMMIT")
+            finally:
+                conn.close()
+        except Exception as e:
+            logger.error(f"Error writing LLM response cache: {e}")
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        """Drops expired entries, then least-recently-used ones until under max_bytes."""
+        if self.ttl:
+            conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+        if not self.max_bytes:
+            return
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_access").fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        logger.debug(f"Evicted {evicted} LLM cache entries")
+
+    def _bump_counter(self, conn: sqlite3.Connection, name: str):
+        conn.execute(
+            "INSERT INTO counters (name, value) VALUES (?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + 1",
+            (name,)
+        )
+
+    def stats(self) -> Dict:
+        """Returns hit/miss counters for this process and for the shared store."""
+        try:
+            with closing(self._connect()) as conn:
+                entries, total_bytes = conn.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+                ).fetchone()
+                counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+        except Exception as e:
+            logger.error(f"Error reading LLM cache stats: {e}")
+            entries, total_bytes, counters = 0, 0, {}
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "total_hits": counters.get("hits", 0),
+            "total_misses": counters.get("misses", 0),
+            "entries": entries,
+            "bytes": total_bytes
+        }
+
+    def clear(self):
+        """Removes every cached entry."""
+        with closing(self._connect()) as conn:
+            conn.execute("DELETE FROM responses")
+
+_response_cache: Optional[ResponseCache] = None
+
+def get_response_cache() -> ResponseCache:
+    """Returns the process-wide response cache."""
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = ResponseCache()
+    return _response_cache
@@ -0,0 +1,226 @@
+# llm/scheduler.py
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from llm.backend_pool import get_backend_pool
+from llm.call_context import current_call_context, record_call_metrics, record_metric
+from config import (
+    OLLAMA_NUM_PARALLEL,
+    LLM_QUEUE_MAX,
+    LLM_QUEUE_TIMEOUT,
+    LLM_QUEUE_SIZE_DELAY,
+    LLM_QUEUE_SIZE_MAX_DELAY
+)
+
+logger = logging.getLogger(__name__)
+
+# Priority classes, most urgent first
+INTERACTIVE = "interactive"
+WEBHOOK = "webhook"
+BACKFILL = "backfill"
+PRIORITIES = (INTERACTIVE, WEBHOOK, BACKFILL)
+
+class LLMQueueFull(Exception):
+    """Raised when a request is rejected because the LLM queue is full or too slow."""
+
+class LLMScheduler:
+    """
+    Admits LLM requests to Ollama at most `max_in_flight` at a time.
+
+    Ollama only works on OLLAMA_NUM_PARALLEL requests at once and queues
+    the rest in arrival order, so without coordination a small interactive
+    review waits behind a backfill of huge prompts. Requests beyond the
+    limit wait here instead:
+
+    - Priority classes are strict: interactive before webhook before backfill.
+    - Within a class, repositories take turns, so one busy repo cannot
+      monopolize the backend.
+    - Within a repository, requests are ordered by a deadline of arrival
+      time plus a delay that grows with the PR's size, so small PRs go
+      first without large ones starving.
+
+    When `max_queue` requests are already waiting, new ones are rejected
+    with LLMQueueFull instead of piling up; so are requests that wait
+    longer than `queue_timeout`.
+    """
+
+    def __init__(self,
+                 max_in_flight: int = OLLAMA_NUM_PARALLEL,
+                 max_queue: int = LLM_QUEUE_MAX,
+                 queue_timeout: float = LLM_QUEUE_TIMEOUT,
+                 size_delay: float = LLM_QUEUE_SIZE_DELAY,
+                 size_max_delay: float = LLM_QUEUE_SIZE_MAX_DELAY):
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.size_delay = size_delay
+        self.size_max_delay = size_max_delay
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._reset()
+
+    def _reset(self):
+        # Per priority class: repo -> heap of (deadline, seq, future)
+        self._queues: List["OrderedDict[str, List[Tuple[float, int, asyncio.Future]]]"] = [
+            OrderedDict() for _ in PRIORITIES
+        ]
+        self._seq = itertools.count()
+        self._in_flight = 0
+        self._queued = 0
+        self._queued_by_priority = [0] * len(PRIORITIES)
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.peak_queued = 0
+
+    def _bind_loop(self):
+        """Futures belong to one event loop; start over when called from another (e.g. a second asyncio.run)."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            if self._loop is not None and (self._in_flight or self._queued):
+                logger.warning("Discarding LLM scheduler state bound to a previous event loop")
+            self._reset()
+            self._loop = loop
+
+    def _deadline(self, now: float, size: int) -> float:
+        delay = min(self.size_max_delay, size / 1000 * self.size_delay) if size > 0 else 0.0
+        return now + delay
+
+    @staticmethod
+    def _priority_index(priority: Optional[str]) -> int:
+        try:
+            return PRIORITIES.index(priority or INTERACTIVE)
+        except ValueError:
+            logger.warning(f"Unknown LLM priority {priority!r}, using {BACKFILL}")
+            return PRIORITIES.index(BACKFILL)
+
+    async def acquire(self, priority: Optional[str] = None, repo: Optional[str] = None, size: int = 0) -> float:
+        """
+        Waits for an in-flight slot and returns the seconds spent queued.
+        Every successful acquire must be paired with `release`.
+        """
+        self._bind_loop()
+        if self._in_flight < self.max_in_flight and not self._queued:
+            self._in_flight += 1
+            self.admitted += 1
+            return 0.0
+        if self.max_queue and self._queued >= self.max_queue:
+            self.rejected += 1
+            raise LLMQueueFull(f"LLM queue is full ({self._queued} requests waiting)")
+
+        index = self._priority_index(priority)
+        now = time.monotonic()
+        future = self._loop.create_future()
+        heapq.heappush(self._queues[index].setdefault(repo or "", []),
+                       (self._deadline(now, size), next(self._seq), future))
+        self._queued += 1
+        self._queued_by_priority[index] += 1
+        self.peak_queued = max(self.peak_queued, self._queued)
+        try:
+            if self.queue_timeout:
+                await asyncio.wait_for(future, self.queue_timeout)
+            else:
+                await future
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled():
+                # Granted as the timeout fired; the slot is already counted in flight
+                self.release()
+            else:
+                future.cancel()
+                self._abandon(index)
+            self.timed_out += 1
+            raise LLMQueueFull(f"No LLM slot became free within {self.queue_timeout}s")
+        except BaseException:
+            if future.done() and not future.cancelled():
+                # Granted just as the caller gave up; hand the slot on
+                self.release()
+            else:
+                future.cancel()
+                self._abandon(index)
+            raise
+        return time.monotonic() - now
+
+    def _abandon(self, index: int):
+        """Accounts for a waiter that left the queue; its heap entry is skipped lazily."""
+        self._queued -= 1
+        self._queued_by_priority[index] -= 1
+
+    def release(self):
+        self._in_flight -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        while self._in_flight < self.max_in_flight:
+            picked = self._next_waiter()
+            if picked is None:
+                return
+            index, future = picked
+            self._queued -= 1
+            self._queued_by_priority[index] -= 1
+            self._in_flight += 1
+            self.admitted += 1
+            future.set_result(None)
+
+    def _next_waiter(self) -> Optional[Tuple[int, asyncio.Future]]:
+        for index, queues in enumerate(self._queues):
+            while queues:
+                repo, heap = next(iter(queues.items()))
+                while heap and heap[0][2].done():
+                    heapq.heappop(heap)
+                if not heap:
+                    del queues[repo]
+                    continue
+                future = heapq.heappop(heap)[2]
+                # Round robin: this repo goes to the back of its class
+                if heap:
+                    queues.move_to_end(repo)
+                else:
+                    del queues[repo]
+                return index, future
+        return None
+
+    @asynccontextmanager
+    async def slot(self, priority: Optional[str] = None, repo: Optional[str] = None,
+                   size: int = 0) -> AsyncIterator[None]:
+        """
+        Holds an in-flight slot for the enclosed request. Priority, repo and
+        size default to those of the current call context.
+        """
+        context = current_call_context()
+        priority = priority or context.priority
+        repo = repo if repo is not None else context.repo
+        size = size or context.size
+        depth = self._queued if self._loop is asyncio.get_running_loop() else 0
+        wait = await self.acquire(priority, repo, size)
+        record_metric("llm_queue_wait_seconds", wait)
+        record_call_metrics({"llm_queue_wait_seconds": wait, "llm_queue_depth": depth},
+                            priority=priority or INTERACTIVE)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> Dict:
+        return {
+            "in_flight": self._in_flight,
+            "max_in_flight": self.max_in_flight,
+            "queued": self._queued,
+            "queued_by_priority": dict(zip(PRIORITIES, self._queued_by_priority)),
+            "peak_queued": self.peak_queued,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out
+        }
+
+_scheduler: Optional[LLMScheduler] = None
+
+def get_llm_scheduler() -> LLMScheduler:
+    """Returns the process-wide LLM scheduler, sized to the configured backends."""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = LLMScheduler(max_in_flight=get_backend_pool().capacity)
+    return _scheduler
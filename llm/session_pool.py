@@ -0,0 +1,81 @@
+# llm/session_pool.py
+from typing import Optional
+import asyncio
+import logging
+import aiohttp
+from config import (
+    OLLAMA_POOL_LIMIT,
+    OLLAMA_POOL_LIMIT_PER_HOST,
+    OLLAMA_DNS_CACHE_TTL,
+    OLLAMA_KEEPALIVE_TIMEOUT,
+    OLLAMA_REQUEST_TIMEOUT
+)
+
+logger = logging.getLogger(__name__)
+
+class SessionPool:
+    """Process-wide keep-alive HTTP connection pool shared by all LLM clients."""
+
+    def __init__(self,
+                 limit: int = OLLAMA_POOL_LIMIT,
+                 limit_per_host: int = OLLAMA_POOL_LIMIT_PER_HOST,
+                 dns_cache_ttl: int = OLLAMA_DNS_CACHE_TTL,
+                 keepalive_timeout: float = OLLAMA_KEEPALIVE_TIMEOUT,
+                 request_timeout: float = OLLAMA_REQUEST_TIMEOUT):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.request_timeout = request_timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def get_session(self) -> aiohttp.ClientSession:
+        """
+        Returns the shared session, creating it on first use.
+
+        A session is bound to the event loop it was created on, so a new one is
+        opened when called from a different loop (e.g. a second asyncio.run).
+        """
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            if self._session is not None and not self._session.closed:
+                logger.warning("Discarding HTTP session bound to a previous event loop")
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                use_dns_cache=True,
+                ttl_dns_cache=self.dns_cache_ttl,
+                keepalive_timeout=self.keepalive_timeout
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.request_timeout)
+            )
+            self._loop = loop
+            logger.debug(f"Opened pooled HTTP session (limit={self.limit}, per_host={self.limit_per_host})")
+        return self._session
+
+    async def close(self):
+        """Closes the shared session and all pooled connections."""
+        session, self._session = self._session, None
+        self._loop = None
+        if session is not None and not session.closed:
+            await session.close()
+            # Give the transports a tick to finish closing before the loop stops
+            await asyncio.sleep(0)
+            logger.debug("Closed pooled HTTP session")
+
+_session_pool: Optional[SessionPool] = None
+
+def get_session_pool() -> SessionPool:
+    """Returns the process-wide session pool."""
+    global _session_pool
+    if _session_pool is None:
+        _session_pool = SessionPool()
+    return _session_pool
+
+async def close_session_pool():
+    """Closes the process-wide session pool, if one was opened."""
+    if _session_pool is not None:
+        await _session_pool.close()
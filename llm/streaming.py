@@ -0,0 +1,115 @@
+# llm/streaming.py
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class StopCondition:
+    """Conditions that end a streamed generation before the model finishes."""
+    max_chars: Optional[int] = None
+    stop_sequences: List[str] = field(default_factory=list)
+    # Stop once the same non-empty line has been emitted this many times in a row
+    max_repeated_lines: Optional[int] = None
+    # Parser hook: returns True once the text so far is a complete answer
+    is_complete: Optional[Callable[[str], bool]] = None
+    # Names what `is_complete` checks; without it, responses stopped by the hook are not cached
+    is_complete_key: Optional[str] = None
+
+    def cache_key(self) -> Optional[dict]:
+        """
+        Returns the parts of the condition that change generated output, or
+        None when a completion hook has no `is_complete_key`: hooks can't be
+        told apart by themselves (every lambda is named `<lambda>`).
+        """
+        if self.is_complete is not None and not self.is_complete_key:
+            return None
+        return {
+            "max_chars": self.max_chars,
+            "stop_sequences": list(self.stop_sequences),
+            "max_repeated_lines": self.max_repeated_lines,
+            "is_complete": self.is_complete_key if self.is_complete is not None else None
+        }
+
+class StreamState:
+    """Accumulates streamed chunks and evaluates a StopCondition incrementally."""
+
+    def __init__(self, condition: Optional[StopCondition] = None):
+        self.condition = condition or StopCondition()
+        self.parts: List[str] = []
+        self.length = 0
+        self.stop_reason: Optional[str] = None
+        self._tail = ""
+        self._max_stop_len = max((len(s) for s in self.condition.stop_sequences), default=0)
+        self._last_line: Optional[str] = None
+        self._repeats = 0
+        self._partial_line = ""
+
+    @property
+    def text(self) -> str:
+        return "".join(self.parts)
+
+    def feed(self, chunk: str) -> str:
+        """
+        Adds a chunk and returns the portion of it that should be emitted.
+
+        Once a stop condition is met `stop_reason` is set and the returned
+        text is truncated at the point where the condition triggered.
+        """
+        if self.stop_reason or not chunk:
+            return ""
+        condition = self.condition
+
+        # Stop sequences may straddle chunk boundaries, so search the tail too
+        if self._max_stop_len:
+            window = self._tail + chunk
+            cut = min((i for i in (window.find(s) for s in condition.stop_sequences) if i >= 0), default=-1)
+            if cut >= 0:
+                overshoot = len(self._tail) - cut
+                chunk = chunk[:max(0, -overshoot)]
+                self.stop_reason = "stop_sequence"
+                if overshoot > 0:
+                    # The sequence began in text that was already accumulated
+                    trimmed = self.text[:-overshoot]
+                    self.parts = [trimmed]
+                    self.length = len(trimmed)
+            else:
+                self._tail = window[-(self._max_stop_len - 1):] if self._max_stop_len > 1 else ""
+
+        if condition.max_chars is not None and self.length + len(chunk) >= condition.max_chars:
+            chunk = chunk[:max(0, condition.max_chars - self.length)]
+            self.stop_reason = self.stop_reason or "max_chars"
+
+        self.parts.append(chunk)
+        self.length += len(chunk)
+
+        if self.stop_reason:
+            return chunk
+
+        if condition.max_repeated_lines and self._is_looping(chunk):
+            self.stop_reason = "repetition"
+        elif condition.is_complete is not None:
+            try:
+                if condition.is_complete(self.text):
+                    self.stop_reason = "complete"
+            except Exception as e:
+                logger.warning(f"Stream completion check failed: {e}")
+        return chunk
+
+    def _is_looping(self, chunk: str) -> bool:
+        """Tracks consecutive identical lines across chunk boundaries."""
+        lines = (self._partial_line + chunk).split("\n")
+        self._partial_line = lines.pop()
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            if line == self._last_line:
+                self._repeats += 1
+            else:
+                self._last_line = line
+                self._repeats = 1
+            if self._repeats >= self.condition.max_repeated_lines:
+                return True
+        return False
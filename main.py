@@ -1,19 +1,53 @@
 # main.py
 
-from typing import Dict, List, Union
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple, Union
 from github import Github
 from github.PullRequest import PullRequest
+from github.Repository import Repository
 import logging
 import json
+import asyncio
+import time
+from collections import Counter
 from agents.review_orchestrator import ReviewOrchestrator, ReviewContext
 from agents.documentation_review_agent import DocumentationReviewAgent
 from agents.code_quality_agent import CodeQualityAgent
 from agents.test_coverage_agent import TestCoverageAgent
 from agents.dependency_review_agent import DependencyReviewAgent
 from agents.security_agent import SecurityAgent
+from analytics.metrics_collector import MetricsCollector
 from llm.ollama_llm import OllamaLLM
-from utils.github_helper import parse_review_comments
-from config import GITHUB_TOKEN
+from llm.scheduler import INTERACTIVE, BACKFILL
+from llm.backend_pool import close_backend_pool
+from llm.session_pool import close_session_pool
+from utils.github_helper import (
+    parse_review_comments,
+    get_position_index,
+    stream_pull_request_diff,
+    get_compare_files,
+    get_open_pull_requests
+)
+from utils.diff_parser import DiffParser, ParsedDiff
+from utils.file_triage import FileTriage, load_gitattributes
+from utils.pr_snapshot import PRSnapshot, iter_patch_lines
+from jobs.job_queue import JobCheckpoint, JobLost
+from utils.review_state import (
+    ReviewState,
+    ReviewStateStore,
+    get_review_state_store,
+    incremental_diff,
+    is_failed_review,
+    merge_reviews
+)
+from config import (
+    GITHUB_TOKEN,
+    DIFF_MAX_FILE_BYTES,
+    TRIAGE_ENABLED,
+    METRICS_PATH,
+    REVIEW_STATE_ENABLED,
+    REVIEW_BATCH_CONCURRENCY,
+    REVIEW_BATCH_PER_REPO
+)
 
 logger = logging.getLogger(__name__)
 
@@ -23,8 +57,13 @@ class ReviewManager:
             raise ValueError("GitHub token not found. Please set GITHUB_TOKEN in .env file")
             
         self.github = Github(GITHUB_TOKEN)
-        self.orchestrator = ReviewOrchestrator()
+        # Repository objects by name, shared by every review in the process
+        self._repos: Dict[str, Repository] = {}
+        self.metrics = MetricsCollector(METRICS_PATH)
+        self.orchestrator = ReviewOrchestrator(metrics_collector=self.metrics)
         self.llm = OllamaLLM()
+        # Last reviewed head per PR, for incremental re-reviews
+        self.review_state: Optional[ReviewStateStore] = get_review_state_store() if REVIEW_STATE_ENABLED else None
         
         # Initialize and register agents with orchestrator
         self.orchestrator.register_agent('documentation', DocumentationReviewAgent())
@@ -42,60 +81,289 @@ class ReviewManager:
             raise RuntimeError("Ollama service is not running. Please start Ollama first.")
         return manager
 
-    async def review_pr(self, repo_name: str, pr_number: int, options: Dict = None):
-        """Review a pull request with all available agents"""
+    def set_stream_handler(self, handler: Optional[Callable[[str, str], None]]):
+        """
+        Streams partial LLM output from every agent to `handler(agent_type, chunk)`.
+        Pass None to stop streaming.
+        """
+        for agent_type, agent in self.orchestrator.agents.items():
+            agent.stream_handler = (
+                (lambda chunk, agent_type=agent_type: handler(agent_type, chunk))
+                if handler is not None else None
+            )
+
+    async def close(self):
+        """Stops backend health checks and releases pooled connections held by the LLM clients."""
+        await close_backend_pool()
+        await close_session_pool()
+
+    async def review_pr(self, repo_name: str, pr_number: int, options: Dict = None,
+                        checkpoint: Optional[JobCheckpoint] = None):
+        """
+        Review a pull request with all available agents.
+
+        Set `options['raw_diff']` to parse the complete diff streamed from
+        GitHub instead of the per-file patches, which the API truncates for
+        very large files. `options['priority']` is the scheduling class of
+        the review's LLM calls: interactive (default), webhook or backfill.
+
+        Once a PR has been reviewed, later runs review only what was pushed
+        since the last reviewed head and merge the results into the stored
+        review state. Set `options['full_review']` to review the whole PR.
+
+        A queued job passes its `checkpoint`: each agent's result is saved
+        as it finishes, and agents already saved for the same head SHA by
+        an interrupted attempt are not run again. Just before posting, the
+        job's lease is checked; a job cancelled or superseded in the
+        meantime raises JobLost instead of posting a stale review.
+        """
+        options = options or {}
         try:
             # Get PR details
-            repo = self.github.get_repo(repo_name)
-            pr = repo.get_pull(pr_number)
+            repo = await self._get_repo(repo_name)
+            pr = await asyncio.to_thread(repo.get_pull, pr_number)
             
-            # Get PR diff as text
-            files = pr.get_files()
-            if not files:
+            # Fetch files, patches and comments once for the whole review
+            snapshot = await PRSnapshot.fetch(pr)
+            if not snapshot.files:
                 raise ValueError("No files found in pull request")
                 
-            # Get patches from all files
-            diff_text = ""
-            for file in files:
-                if hasattr(file, 'patch') and file.patch:
-                    diff_text += f"diff --git a/{file.filename} b/{file.filename}\n"
-                    diff_text += file.patch + "\n"
-            
-            if not diff_text:
+            # Parse file by file; the whole diff is never held as one string
+            if options.get('raw_diff'):
+                parsed_diff = await ParsedDiff.from_stream(stream_pull_request_diff(pr), DIFF_MAX_FILE_BYTES)
+            else:
+                parsed_diff = ParsedDiff.from_files(
+                    DiffParser.iter_files(snapshot.iter_diff_lines(), DIFF_MAX_FILE_BYTES)
+                )
+            if not parsed_diff:
                 raise ValueError("No diff content found in pull request")
+
+            # Re-reviews cover only the commits pushed since the last reviewed head
+            state = None
+            incremental = None
+            changed_files = None
+            if self.review_state is not None and not options.get('full_review'):
+                state = self.review_state.get(repo_name, pr_number)
+            if state is not None:
+                if state.head_sha == snapshot.head_sha:
+                    logger.info(f"PR #{pr_number} already reviewed at {snapshot.head_sha[:7]}")
+                    return self._unchanged_results(state)
+                push_files = await asyncio.to_thread(get_compare_files, repo, state.head_sha, snapshot.head_sha)
+                if push_files is None:
+                    logger.info(f"Reviewing all of PR #{pr_number}: no usable diff since {state.head_sha[:7]}")
+                else:
+                    push_diff = ParsedDiff.from_files(
+                        DiffParser.iter_files(iter_patch_lines(push_files), DIFF_MAX_FILE_BYTES)
+                    )
+                    full_diff = parsed_diff
+                    parsed_diff = incremental_diff(full_diff, push_diff)
+                    changed_files = set(parsed_diff)
+                    incremental = {
+                        "since_sha": state.head_sha,
+                        "head_sha": snapshot.head_sha,
+                        "files": len(parsed_diff),
+                        "hunks": sum(len(d.hunks) for d in parsed_diff.values()),
+                        "pr_files": len(full_diff),
+                        "pr_hunks": sum(len(d.hunks) for d in full_diff.values())
+                    }
+                    if not parsed_diff:
+                        logger.info(f"No reviewable changes in PR #{pr_number} since {state.head_sha[:7]}")
+                        self._save_review_state(snapshot, state, {}, changed_files)
+                        return {**self._unchanged_results(state), "head_sha": snapshot.head_sha,
+                                "incremental": incremental}
+
+            # Keep generated, vendored and oversized files out of the prompts
+            decisions = {}
+            scan_diff = None
+            if TRIAGE_ENABLED:
+                attributes = await asyncio.to_thread(load_gitattributes, repo, snapshot.head_sha)
+                triage = FileTriage(attributes)
+                decisions = await asyncio.to_thread(triage.triage, parsed_diff)
+                scan_diff = triage.apply(parsed_diff, decisions, summarize=False)
+                parsed_diff = triage.apply(parsed_diff, decisions)
                 
-            previous_comments = [comment.body for comment in pr.get_comments()]
-            
             # Create review context
-            context = ReviewContext(pr, diff_text, "\n".join(previous_comments))
+            context = ReviewContext(pr, None, "\n".join(snapshot.review_comments),
+                                    snapshot=snapshot, parsed_diff=parsed_diff)
+            context.triage = decisions
+            context.scan_diff = scan_diff
+            context.priority = options.get('priority', INTERACTIVE)
+            if checkpoint is not None:
+                head_sha = snapshot.head_sha
+                context.completed_reviews = await asyncio.to_thread(checkpoint.load, head_sha)
+                context.on_agent_review = lambda agent_type, review: checkpoint.save(head_sha, agent_type, review)
             
             # Conduct review through orchestrator
             review_results = await self.orchestrator.conduct_review(context)
+            if incremental is not None:
+                review_results['incremental'] = incremental
+            if self.llm.cache is not None:
+                review_results['llm_cache'] = self.llm.cache.stats()
+            review_results['llm_queue'] = self.llm.scheduler.stats()
+            review_results['llm_backends'] = self.llm.backends.stats()
             
-            # Post results to GitHub
-            await self._post_review_to_github(pr, review_results)
+            # Post results to GitHub, unless a newer push or a close took the job away meanwhile
+            if checkpoint is not None:
+                await asyncio.to_thread(checkpoint.ensure_current)
+            await self._post_review_to_github(snapshot, review_results)
+
+            # Recorded only once posted, so a crash in between means a repeat post rather than a lost one
+            if self.review_state is not None and review_results.get('status') == 'success':
+                merged = self._save_review_state(snapshot, state, review_results['reviews'], changed_files)
+                if incremental is not None:
+                    review_results['merged_reviews'] = merged
             
             return review_results
             
+        except JobLost:
+            raise
         except Exception as e:
             logger.error(f"Error reviewing PR #{pr_number}: {e}")
             raise
+
+    async def _get_repo(self, repo_name: str):
+        """Fetches a repository once per process, without blocking the event loop."""
+        repo = self._repos.get(repo_name)
+        if repo is None:
+            repo = self._repos[repo_name] = await asyncio.to_thread(self.github.get_repo, repo_name)
+        return repo
+
+    async def list_open_pull_requests(self, repo_name: str) -> List[int]:
+        """Numbers of the open PRs of a repository, oldest first."""
+        repo = await self._get_repo(repo_name)
+        pulls = await asyncio.to_thread(get_open_pull_requests, repo)
+        return [pr.number for pr in pulls]
+
+    async def review_batch(self, targets: Iterable[Tuple[str, int]], options: Dict = None,
+                           max_concurrent: int = REVIEW_BATCH_CONCURRENCY,
+                           max_per_repo: int = REVIEW_BATCH_PER_REPO,
+                           on_result: Optional[Callable[[Dict], None]] = None) -> Dict:
+        """
+        Reviews many PRs concurrently in this process, sharing the GitHub
+        client, agents, caches and LLM connections.
+
+        At most `max_concurrent` reviews run at once and at most
+        `max_per_repo` per repository. LLM calls default to the backfill
+        priority, so interactive reviews in the same process go first. A
+        failed review is recorded and the batch goes on.
+
+        Args:
+            targets: (repo name, PR number) pairs
+            options: Options passed to every `review_pr`
+            on_result: Called with each outcome as it completes; the full
+                review results are under its 'results' key
+
+        Returns:
+            Dict: One outcome per PR (without the review results) and a
+            summary with counts, latency percentiles and throughput.
+        """
+        options = {'priority': BACKFILL, **(options or {})}
+        targets = list(dict.fromkeys(targets))
+        limit = asyncio.Semaphore(max(1, max_concurrent))
+        repo_limits: Dict[str, asyncio.Semaphore] = {}
+        outcomes: List[Dict] = []
+        start = time.perf_counter()
+
+        async def review_one(repo_name: str, pr_number: int):
+            repo_limit = repo_limits.setdefault(repo_name, asyncio.Semaphore(max(1, max_per_repo)))
+            # Per-repo first, so a PR waiting on its repo does not hold a global slot
+            async with repo_limit, limit:
+                began = time.perf_counter()
+                outcome = {"repo": repo_name, "pr": pr_number}
+                try:
+                    results = await self.review_pr(repo_name, pr_number, options)
+                    outcome["status"] = results.get('status', 'success')
+                except Exception as e:
+                    results = None
+                    outcome.update(status="failed", error=str(e))
+                outcome["seconds"] = round(time.perf_counter() - began, 3)
+            outcomes.append(outcome)
+            logger.debug(f"[{len(outcomes)}/{len(targets)}] {repo_name}#{pr_number}: "
+                        f"{outcome['status']} in {outcome['seconds']}s")
+            if on_result is not None:
+                try:
+                    on_result({**outcome, "results": results})
+                except Exception as e:
+                    logger.warning(f"Batch result handler failed: {e}")
+
+        await asyncio.gather(*(review_one(repo_name, pr_number) for repo_name, pr_number in targets))
+        return {"reviews": outcomes, "summary": self._batch_summary(outcomes, time.perf_counter() - start)}
+
+    def _batch_summary(self, outcomes: List[Dict], seconds: float) -> Dict:
+        latencies = sorted(o["seconds"] for o in outcomes if o["status"] != "failed")
+
+        def percentile(p: float) -> float:
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))] if latencies else 0.0
+
+        summary = {
+            "prs": len(outcomes),
+            "statuses": dict(Counter(o["status"] for o in outcomes)),
+            "repos": dict(Counter(o["repo"] for o in outcomes)),
+            "wall_seconds": round(seconds, 3),
+            "prs_per_minute": round(len(outcomes) / seconds * 60, 2) if seconds else 0.0,
+            "review_seconds_p50": percentile(0.5),
+            "review_seconds_p95": percentile(0.95),
+            "review_seconds_max": latencies[-1] if latencies else 0.0,
+            "llm_queue": self.llm.scheduler.stats(),
+            "llm_backends": self.llm.backends.stats()
+        }
+        if self.llm.cache is not None:
+            summary["llm_cache"] = self.llm.cache.stats()
+        if self.orchestrator.hunk_cache is not None:
+            summary["hunk_cache"] = self.orchestrator.hunk_cache.stats()
+        return summary
+
+    def _save_review_state(self, snapshot: PRSnapshot, prior: Optional[ReviewState],
+                           reviews: Dict, changed_files: Optional[Set[str]]) -> Dict:
+        """
+        Records the snapshot's head as reviewed. Results of an incremental
+        review (`changed_files` set) are merged into the prior state;
+        returns the stored reviews.
+        """
+        if prior is not None and changed_files is not None:
+            merged = merge_reviews(prior.reviews, reviews, changed_files)
+        else:
+            merged = reviews
+        rounds = (prior.rounds if prior is not None else 0) + (1 if reviews else 0)
+        self.review_state.put(ReviewState(snapshot.repo_name, snapshot.number, snapshot.head_sha,
+                                          snapshot.base_sha, time.time(), merged, rounds))
+        return merged
+
+    @staticmethod
+    def _unchanged_results(state: ReviewState) -> Dict:
+        """Results for a PR with nothing new to review; nothing is posted."""
+        return {
+            "status": "unchanged",
+            "head_sha": state.head_sha,
+            "reviews": state.reviews,
+            "review_rounds": state.rounds
+        }
             
-    async def _post_review_to_github(self, pr: PullRequest, review_results: Dict):
+    async def _post_review_to_github(self, pr: Union[PullRequest, PRSnapshot], review_results: Dict):
         """Posts review results as comments on GitHub PR."""
         try:
             # First, post a general review comment
             review_body = "# AI Code Review Results\n\n"
+            incremental = review_results.get('incremental')
+            if incremental:
+                review_body += (f"Reviewing the changes pushed since `{incremental['since_sha'][:7]}`: "
+                                f"{incremental['hunks']} of {incremental['pr_hunks']} hunks "
+                                f"in {incremental['files']} files.\n\n")
             
             for agent_type, review in review_results['reviews'].items():
-                if isinstance(review, dict) and review.get('status') == 'error':
+                title = agent_type.replace('_', ' ').title()
+                if is_failed_review(review):
+                    # Errors are left out; a timeout gets a note so the missing section is explained
+                    if isinstance(review, dict) and review.get('status') == 'timeout':
+                        review_body += f"\n## {title} Review\n\n_{review.get('message', 'The review timed out')}._\n"
                     continue
                     
                 if isinstance(review, dict) and agent_type == 'security':
                     # Add security findings to the main review
                     review_body += f"\n## 🔒 Security Review\n\n"
                     for vuln in review.get('vulnerabilities', []):
-                        review_body += f"- **{vuln['severity']} Severity Issue** in `{vuln['file']}` line {vuln['line']}\n"
+                        review_body += (f"- **{vuln['severity']} Severity Issue** in `{vuln['file']}` "
+                                        f"{_describe_line(vuln['line'])}\n")
                         review_body += f"  - {vuln['description']}\n"
                     
                     if review.get('recommendations'):
@@ -107,34 +375,51 @@ class ReviewManager:
                                 review_body += f"- {item}\n"
                 else:
                     # Add other reviews
-                    review_body += f"\n## {agent_type.replace('_', ' ').title()} Review\n\n"
+                    review_body += f"\n## {title} Review\n\n"
                     review_body += str(review) + "\n"
             
-            # Create the review without inline comments
-            pr.create_review(
+            # Security findings carry new-file line numbers, so place them inline
+            inline_comments = []
+            unplaced = []
+            security = review_results['reviews'].get('security')
+            if isinstance(security, dict) and not is_failed_review(security):
+                position_index = get_position_index(pr)
+                for vuln in security.get('vulnerabilities', []):
+                    body = (
+                        f"🔒 **Security Issue Detected**\n\n"
+                        f"**Severity:** {vuln['severity']}\n"
+                        f"**File:** `{vuln['file']}`\n"
+                        f"**Line:** {vuln['line'] if vuln['line'] is not None else 'removed line'}\n\n"
+                        f"**Description:** {vuln['description']}"
+                    )
+                    # Findings on removed lines have no new-file line to anchor to
+                    position = position_index.get(vuln['file'], vuln['line']) if vuln['line'] is not None else None
+                    if position is not None:
+                        inline_comments.append({'path': vuln['file'], 'position': position, 'body': body})
+                    else:
+                        unplaced.append(body)
+            
+            await asyncio.to_thread(
+                pr.create_review,
                 body=review_body,
-                event='COMMENT'
+                event='COMMENT',
+                comments=inline_comments
             )
             
-            # Post security issues as separate comments
-            if isinstance(review_results['reviews'].get('security'), dict):
-                security_review = review_results['reviews']['security']
-                for vuln in security_review.get('vulnerabilities', []):
-                    try:
-                        pr.create_issue_comment(
-                            f"🔒 **Security Issue Detected**\n\n"
-                            f"**Severity:** {vuln['severity']}\n"
-                            f"**File:** `{vuln['file']}`\n"
-                            f"**Line:** {vuln['line']}\n\n"
-                            f"**Description:** {vuln['description']}"
-                        )
-                    except Exception as e:
-                        logger.warning(f"Failed to create security comment: {e}")
+            # Findings outside the diff hunks can't be inline; post them separately
+            for body in unplaced:
+                try:
+                    await asyncio.to_thread(pr.create_issue_comment, body)
+                except Exception as e:
+                    logger.warning(f"Failed to create security comment: {e}")
         
         except Exception as e:
             logger.error(f"Error posting review to GitHub: {e}")
             raise
 
+def _describe_line(line: Optional[int]) -> str:
+    return f"line {line}" if line is not None else "on a removed line"
+
 async def main():
     try:
         review_manager = await ReviewManager.create()
@@ -143,6 +428,9 @@ async def main():
     except Exception as e:
         logger.error(f"Error in main: {e}")
         raise
+    finally:
+        await close_backend_pool()
+        await close_session_pool()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -56,31 +56,46 @@ def create_review_prompt(diff: str, previous_comments: str) -> str:
 
     return prompt
 
-def create_documentation_review_prompt(diff: str, previous_comments: str) -> str:
+def create_shared_review_prefix(diff: str, previous_comments: str) -> str:
     """
-    Creates a prompt for documentation review.
+    Creates the opening shared by every agent's prompt for a pull request.
+
+    The diff comes first and the text is identical for all agents, so the
+    model evaluates it once and each agent only adds its own instructions.
 
     Args:
-    diff (str): The diff string representing changes in the pull request.
+    diff (str): The formatted diff of the pull request.
     previous_comments (str): A string containing previous comments on the pull request.
 
     Returns:
-    str: A formatted prompt string for documentation review.
+    str: The shared prompt prefix.
     """
-    prompt = f"""
-    You are an expert documentation reviewer. Your task is to ensure that all code changes are properly documented.
+    prefix = f"""
+    You are an expert reviewer examining a pull request.
 
-    **Review Objectives:**
-    - **Inline Comments:** Check if new or modified code includes appropriate inline comments.
-    - **README Updates:** Ensure that the README file is updated to reflect significant changes or new features.
-    - **Documentation Standards:** Verify adherence to the project's documentation standards and guidelines.
+    **Code Diff:**
+    {diff}
 
     **Context:**
     Previous comments on this pull request:
     {previous_comments}
+    """
+    return prefix
 
-    **Code Diff for Documentation Review:**
-    {diff}
+def create_documentation_review_instructions() -> str:
+    """
+    Creates the documentation review instructions that follow the shared prefix.
+
+    Returns:
+    str: The agent-specific part of the documentation review prompt.
+    """
+    instructions = """
+    You are an expert documentation reviewer. Your task is to ensure that all code changes are properly documented.
+
+    **Review Objectives:**
+    - **Inline Comments:** Check if new or modified code includes appropriate inline comments.
+    - **README Updates:** Ensure that the README file is updated to reflect significant changes or new features.
+    - **Documentation Standards:** Verify adherence to the project's documentation standards and guidelines.
 
     **Instructions:**
     - Identify areas where documentation is lacking or could be improved.
@@ -89,21 +104,32 @@ def create_documentation_review_prompt(diff: str, previous_comments: str) -> str
 
     Please provide your review below:
     """
-    return prompt
+    return instructions
 
-def create_code_quality_prompt(diff: str, previous_comments: str, analysis: Dict) -> str:
+def create_documentation_review_prompt(diff: str, previous_comments: str) -> str:
     """
-    Creates a prompt for code quality review.
+    Creates a prompt for documentation review.
 
     Args:
     diff (str): The diff string representing changes in the pull request.
     previous_comments (str): A string containing previous comments on the pull request.
+
+    Returns:
+    str: A formatted prompt string for documentation review.
+    """
+    return create_shared_review_prefix(diff, previous_comments) + create_documentation_review_instructions()
+
+def create_code_quality_instructions(analysis: Dict) -> str:
+    """
+    Creates the code quality instructions that follow the shared prefix.
+
+    Args:
     analysis (Dict): Dictionary containing code quality analysis results.
 
     Returns:
-    str: A formatted prompt string for code quality review.
+    str: The agent-specific part of the code quality prompt.
     """
-    prompt = f"""
+    instructions = f"""
     You are an expert code reviewer. Your task is to analyze code changes for quality and suggest improvements.
 
     **Code Analysis:**
@@ -112,13 +138,6 @@ def create_code_quality_prompt(diff: str, previous_comments: str, analysis: Dict
     Average Complexity: {analysis.get('summary', {}).get('average_complexity', 0)}
     High Complexity Files: {analysis.get('summary', {}).get('high_complexity_files', 0)}
 
-    **Files Changed:**
-    {diff}
-
-    **Context:**
-    Previous comments on this pull request:
-    {previous_comments}
-
     **Instructions:**
     1. Review the code changes and analysis results
     2. Identify:
@@ -131,4 +150,75 @@ def create_code_quality_prompt(diff: str, previous_comments: str, analysis: Dict
 
     Please provide your review below:
     """
-    return prompt
\ No newline at end of file
+    return instructions
+
+def create_code_quality_prompt(diff: str, previous_comments: str, analysis: Dict) -> str:
+    """
+    Creates a prompt for code quality review.
+
+    Args:
+    diff (str): The diff string representing changes in the pull request.
+    previous_comments (str): A string containing previous comments on the pull request.
+    analysis (Dict): Dictionary containing code quality analysis results.
+
+    Returns:
+    str: A formatted prompt string for code quality review.
+    """
+    return create_shared_review_prefix(diff, previous_comments) + create_code_quality_instructions(analysis)
+
+def create_merge_review_prompt(review_type: str, partial_reviews: List[str]) -> str:
+    """
+    Creates a prompt that merges reviews of separate parts of one pull request.
+
+    Args:
+    review_type (str): The kind of review being merged (e.g. "code_quality").
+    partial_reviews (List[str]): Reviews of each chunk of the diff, in order.
+
+    Returns:
+    str: A formatted prompt string asking for one consolidated review.
+    """
+    sections = "\n\n".join(
+        f"### Partial review {i} of {len(partial_reviews)}\n{review}"
+        for i, review in enumerate(partial_reviews, start=1)
+    )
+    prompt = f"""
+    You are an expert code reviewer. The pull request was too large to review at once,
+    so its changes were split into parts and each part received its own {review_type.replace('_', ' ')} review.
+
+    **Partial Reviews:**
+    {sections}
+
+    **Instructions:**
+    - Merge the partial reviews into a single, coherent review.
+    - Remove duplicate findings and keep the most specific version of each.
+    - Keep file names, line references and suggestion blocks intact.
+    - Order findings by severity.
+
+    Please provide the consolidated review below:
+    """
+    return prompt
+
+def create_hunk_triage_prompt(hunks: List[str]) -> str:
+    """
+    Creates a prompt asking which diff hunks need an in-depth review.
+
+    Args:
+    hunks (List[str]): Hunk texts, each starting with a "File:" line.
+
+    Returns:
+    str: A formatted prompt string asking for the numbers of hunks to review.
+    """
+    sections = "\n\n".join(f"### Hunk {i}\n{hunk}" for i, hunk in enumerate(hunks, start=1))
+    prompt = f"""
+    You are triaging code changes before an in-depth review. Static checks judged the hunks
+    below to be trivial: formatting, renames, import changes or comments.
+
+    **Hunks:**
+    {sections}
+
+    **Instructions:**
+    - List the hunks that could change program behavior, security or public APIs.
+    - Answer on one line as "REVIEW: " followed by hunk numbers, e.g. "REVIEW: 2, 5".
+    - Answer "REVIEW: none" when every hunk is trivial.
+    """
+    return prompt
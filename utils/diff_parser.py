@@ -1,22 +1,490 @@
 # utils/diff_parser.py
+from array import array
+from bisect import bisect_right
+from collections.abc import Mapping
 from dataclasses import dataclass
-from typing import Dict, List
+from functools import cached_property
+from itertools import chain
+from types import MappingProxyType
+from typing import AsyncIterable, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+import codecs
 import fnmatch
 import logging
 import re
 
 logger = logging.getLogger(__name__)
 
-@dataclass
+HUNK_HEADER = re.compile(r'@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@ ?(.*)')
+
+ADDED = '+'
+REMOVED = '-'
+CONTEXT = ' '
+NO_NEWLINE = '\\'
+
+class DiffLine:
+    """One line of a hunk body. `text` excludes the leading +/-/space marker."""
+    __slots__ = ('kind', 'old_lineno', 'new_lineno', 'text')
+
+    def __init__(self, kind: str, old_lineno: Optional[int], new_lineno: Optional[int], text: str):
+        self.kind = kind
+        self.old_lineno = old_lineno
+        self.new_lineno = new_lineno
+        self.text = text
+
+    def __repr__(self) -> str:
+        return f"DiffLine({self.kind!r}, {self.old_lineno}, {self.new_lineno}, {self.text!r})"
+
+class Hunk:
+    """
+    A hunk of a file diff.
+
+    Body lines are not stored as objects: the hunk keeps the offset of each
+    line within the file's diff content in an array plus one byte per line
+    for its kind, and DiffLine records are created only while iterating.
+    """
+    __slots__ = ('old_start', 'old_count', 'new_start', 'new_count', 'section',
+                 'header_offset', '_starts', '_kinds', '_content')
+
+    def __init__(self, old_start: int, old_count: int, new_start: int, new_count: int,
+                 section: str = "", header_offset: int = 0):
+        self.old_start = old_start
+        self.old_count = old_count
+        self.new_start = new_start
+        self.new_count = new_count
+        self.section = section
+        self.header_offset = header_offset
+        # One start offset per body line plus a trailing end sentinel
+        self._starts = array('q')
+        self._kinds = bytearray()
+        self._content = ""
+
+    def _append(self, offset: int, kind: str):
+        self._starts.append(offset)
+        self._kinds.append(ord(kind))
+
+    def _finish(self, end_offset: int, content: str):
+        self._starts.append(end_offset)
+        self._content = content
+
+    def __len__(self) -> int:
+        return len(self._kinds)
+
+    def __iter__(self) -> Iterator[DiffLine]:
+        return self._iter_kinds(None)
+
+    def iter_added(self) -> Iterator[DiffLine]:
+        """Yields only the added lines."""
+        return self._iter_kinds(ADDED)
+
+    def iter_removed(self) -> Iterator[DiffLine]:
+        """Yields only the removed lines."""
+        return self._iter_kinds(REMOVED)
+
+    def _iter_kinds(self, only: Optional[str]) -> Iterator[DiffLine]:
+        content = self._content
+        starts = self._starts
+        old_line = self.old_start
+        new_line = self.new_start
+        wanted = ord(only) if only else None
+        for i, code in enumerate(self._kinds):
+            if wanted is None or code == wanted:
+                kind = chr(code)
+                yield DiffLine(
+                    kind,
+                    old_line if code == 32 or code == 45 else None,
+                    new_line if code == 32 or code == 43 else None,
+                    content[starts[i] + 1:starts[i + 1] - 1]
+                )
+            if code == 32:
+                old_line += 1
+                new_line += 1
+            elif code == 43:
+                new_line += 1
+            elif code == 45:
+                old_line += 1
+
+    def line_offsets(self) -> Iterator[Tuple[int, str]]:
+        """Yields (offset in the file's diff content, kind) for every body line."""
+        for i, code in enumerate(self._kinds):
+            yield self._starts[i], chr(code)
+
+# Marks removed lines in LineLocator's line table
+_REMOVED_LINE = -1
+
+class LineLocator:
+    """
+    Resolves character offsets in a file's diff content to new-file line numbers.
+
+    Built from the parsed hunks, so the content is never re-split: each
+    lookup is a binary search over line start offsets. Removed lines have
+    no new-file line and resolve to None; lines before the first hunk
+    resolve to 0.
+    """
+
+    def __init__(self, hunks: Sequence[Hunk]):
+        self._line_starts = array('q', [0])
+        self._new_lines = array('q', [0])
+        for hunk in hunks:
+            self._line_starts.append(hunk.header_offset)
+            self._new_lines.append(hunk.new_start)
+            current = hunk.new_start - 1
+            for offset, kind in hunk.line_offsets():
+                self._line_starts.append(offset)
+                if kind == REMOVED:
+                    self._new_lines.append(_REMOVED_LINE)
+                    continue
+                if kind == ADDED or kind == CONTEXT:
+                    current += 1
+                self._new_lines.append(max(current, hunk.new_start))
+
+    def line_index(self, offset: int) -> int:
+        """Returns the index of the located line entry containing `offset`."""
+        return bisect_right(self._line_starts, offset) - 1
+
+    def new_line(self, offset: int) -> Optional[int]:
+        """Returns the new-file line number for the diff line containing `offset`, None on a removed line."""
+        line = self._new_lines[self.line_index(offset)]
+        return None if line == _REMOVED_LINE else line
+
+@dataclass(frozen=True)
 class FileDiff:
     content: str
     added_lines: int
     removed_lines: int
     modified_lines: int
+    hunks: Tuple[Hunk, ...] = ()
+    old_path: Optional[str] = None
+    new_path: Optional[str] = None
+    status: str = "modified"
+    is_binary: bool = False
+    # Set when content beyond the parser's per-file byte limit was dropped;
+    # the counters still cover the whole file
+    truncated: bool = False
+
+    @property
+    def path(self) -> Optional[str]:
+        """The path the file has after the change, or before it for deletions."""
+        return self.new_path or self.old_path
+
+    def iter_lines(self) -> Iterator[DiffLine]:
+        return chain.from_iterable(self.hunks)
+
+    def iter_added(self) -> Iterator[DiffLine]:
+        """Yields the added lines of every hunk with their new-file line numbers."""
+        return chain.from_iterable(hunk.iter_added() for hunk in self.hunks)
+
+    def iter_removed(self) -> Iterator[DiffLine]:
+        """Yields the removed lines of every hunk with their old-file line numbers."""
+        return chain.from_iterable(hunk.iter_removed() for hunk in self.hunks)
+
+    @cached_property
+    def line_locator(self) -> LineLocator:
+        """Offset-to-line index, built on first use and reused by every consumer."""
+        return LineLocator(self.hunks)
+
+    def hunk_text(self, index: int) -> str:
+        """The text of one hunk, from its @@ header up to the next hunk."""
+        end = self.hunks[index + 1].header_offset if index + 1 < len(self.hunks) else len(self.content)
+        return self.content[self.hunks[index].header_offset:end].rstrip('\n')
+
+    def with_hunks(self, indices: Iterable[int]) -> "FileDiff":
+        """A FileDiff of this file's header and only the given hunks, with its counters recomputed."""
+        header = self.content[:self.hunks[0].header_offset].rstrip('\n') if self.hunks else self.content
+        lines = _iter_text_lines(header)
+        builder = _FileDiffBuilder(next(lines))
+        for line in lines:
+            builder.add(line)
+        for index in indices:
+            for line in _iter_text_lines(self.hunk_text(index)):
+                builder.add(line)
+        return builder.build()
+
+_ESCAPES = {'a': 7, 'b': 8, 't': 9, 'n': 10, 'v': 11, 'f': 12, 'r': 13, '"': 34, '\\': 92}
+
+def _read_quoted(text: str) -> Tuple[str, str]:
+    """
+    Reads a C-style quoted path as git writes it (octal escapes for
+    non-ASCII bytes) from the start of `text`. Returns (path, remainder).
+    """
+    out = bytearray()
+    i = 1
+    while i < len(text):
+        char = text[i]
+        if char == '"':
+            return out.decode('utf-8', errors='replace'), text[i + 1:]
+        if char == '\\' and i + 1 < len(text):
+            nxt = text[i + 1]
+            if nxt in '01234567':
+                out.append(int(text[i + 1:i + 4], 8) & 0xFF)
+                i += 4
+                continue
+            out.append(_ESCAPES.get(nxt, ord(nxt)))
+            i += 2
+            continue
+        out.extend(char.encode('utf-8'))
+        i += 1
+    return out.decode('utf-8', errors='replace'), ""
+
+def _parse_path(text: str) -> Optional[str]:
+    """Parses a path from a ---/+++/rename line, unquoting it; /dev/null is None."""
+    if text.startswith('"'):
+        path = _read_quoted(text)[0]
+    else:
+        # Plain `diff -u` output may append a tab and a timestamp
+        path = text.split('\t', 1)[0]
+    return None if path == '/dev/null' else path
+
+def _strip_prefix(path: Optional[str]) -> Optional[str]:
+    """Removes exactly one a/ or b/ prefix."""
+    if path and path[:2] in ('a/', 'b/'):
+        return path[2:]
+    return path
+
+def _parse_git_header(line: str) -> Tuple[Optional[str], Optional[str]]:
+    """Returns the (old, new) paths of a `diff --git a/... b/...` line."""
+    rest = line[len('diff --git '):]
+    if rest.startswith('"'):
+        old, remainder = _read_quoted(rest)
+        remainder = remainder.lstrip(' ')
+        new = _read_quoted(remainder)[0] if remainder.startswith('"') else remainder
+        return _strip_prefix(old), _strip_prefix(new)
+    if rest.endswith('"') and ' "' in rest:
+        split = rest.rindex(' "')
+        return _strip_prefix(rest[:split]), _strip_prefix(_read_quoted(rest[split + 1:])[0])
+    # Unquoted paths may contain spaces; when old and new are the same path
+    # the header splits exactly in half
+    half = (len(rest) - 1) // 2
+    if len(rest) % 2 == 1 and rest[half] == ' ' and rest[2:half] == rest[half + 3:]:
+        return _strip_prefix(rest[:half]), _strip_prefix(rest[half + 1:])
+    split = rest.find(' b/')
+    if split < 0:
+        parts = rest.split(' ', 1)
+        return _strip_prefix(parts[0]), _strip_prefix(parts[-1])
+    return _strip_prefix(rest[:split]), _strip_prefix(rest[split + 1:])
+
+class _FileDiffBuilder:
+    """
+    Accumulates the lines of one file's diff and builds its FileDiff.
+
+    Once the stored content would exceed `max_bytes`, further lines are
+    only counted, not kept, so one huge file cannot exhaust memory.
+    """
+
+    def __init__(self, header: str, max_bytes: Optional[int] = None):
+        self.lines: List[str] = []
+        self.offset = 0
+        self.max_bytes = max_bytes
+        self.truncated = False
+        self.old_path, self.new_path = _parse_git_header(header)
+        self.status = "modified"
+        self.is_binary = False
+        self.hunks: List[Hunk] = []
+        self.hunk_count = 0
+        self.added = 0
+        self.removed = 0
+        self._hunk: Optional[Hunk] = None
+        self._old_left = 0
+        self._new_left = 0
+        self.add(header)
+
+    def add(self, line: str):
+        start = self.offset
+        store = not self.truncated
+        if store:
+            if self.max_bytes and start + len(line) > self.max_bytes:
+                self.truncated = True
+                store = False
+            else:
+                self.lines.append(line)
+                self.offset += len(line) + 1
+
+        hunk = self._hunk
+        if hunk is not None:
+            # Header counts bound the body, so '+++'/'---' content lines are not misread
+            if self._old_left > 0 or self._new_left > 0:
+                kind = line[:1]
+                if kind == ADDED:
+                    self._new_left -= 1
+                    self.added += 1
+                elif kind == REMOVED:
+                    self._old_left -= 1
+                    self.removed += 1
+                elif kind != NO_NEWLINE:
+                    # Some tools strip the trailing space of empty context lines
+                    kind = CONTEXT
+                    self._old_left -= 1
+                    self._new_left -= 1
+                if store:
+                    hunk._append(start, kind)
+                return
+            if line.startswith(NO_NEWLINE):
+                if store:
+                    hunk._append(start, NO_NEWLINE)
+                return
+
+        if line.startswith('@@'):
+            m = HUNK_HEADER.match(line)
+            if m:
+                hunk = Hunk(
+                    int(m.group(1)), int(m.group(2) or 1),
+                    int(m.group(3)), int(m.group(4) or 1),
+                    m.group(5), start
+                )
+                self.hunk_count += 1
+                if store:
+                    self.hunks.append(hunk)
+                self._hunk = hunk
+                self._old_left = hunk.old_count
+                self._new_left = hunk.new_count
+                return
+        self._hunk = None
+        if self.hunk_count:
+            return
+
+        if line.startswith('--- '):
+            path = _parse_path(line[4:])
+            if path is None:
+                self.old_path = None
+                self.status = "added"
+            else:
+                self.old_path = _strip_prefix(path)
+        elif line.startswith('+++ '):
+            path = _parse_path(line[4:])
+            if path is None:
+                self.new_path = None
+                self.status = "deleted"
+            else:
+                self.new_path = _strip_prefix(path)
+        elif line.startswith('rename from '):
+            self.old_path = _parse_path(line[12:])
+            self.status = "renamed"
+        elif line.startswith('rename to '):
+            self.new_path = _parse_path(line[10:])
+            self.status = "renamed"
+        elif line.startswith('copy from '):
+            self.old_path = _parse_path(line[10:])
+            self.status = "copied"
+        elif line.startswith('copy to '):
+            self.new_path = _parse_path(line[8:])
+            self.status = "copied"
+        elif line.startswith('new file mode'):
+            self.status = "added"
+        elif line.startswith('deleted file mode'):
+            self.status = "deleted"
+        elif line.startswith('Binary files ') or line.startswith('GIT binary patch'):
+            self.is_binary = True
+
+    @property
+    def path(self) -> Optional[str]:
+        return self.new_path if self.status != "deleted" else self.old_path
+
+    def build(self) -> FileDiff:
+        content = '\n'.join(self.lines)
+        for hunk in self.hunks:
+            last = hunk._starts[-1] if hunk._starts else hunk.header_offset
+            hunk._finish(self._line_end(last, content), content)
+        return FileDiff(
+            content=content,
+            added_lines=self.added,
+            removed_lines=self.removed,
+            modified_lines=self.hunk_count,
+            hunks=tuple(self.hunks),
+            old_path=self.old_path if self.status != "added" else None,
+            new_path=self.new_path if self.status != "deleted" else None,
+            status=self.status,
+            is_binary=self.is_binary,
+            truncated=self.truncated
+        )
+
+    @staticmethod
+    def _line_end(start: int, content: str) -> int:
+        """Offset just past the newline ending the line that starts at `start`."""
+        end = content.find('\n', start)
+        return (len(content) if end < 0 else end) + 1
+
+def _iter_text_lines(text: str) -> Iterator[str]:
+    """Yields the lines of `text` like str.split('\\n') without building the list."""
+    start = 0
+    while True:
+        end = text.find('\n', start)
+        if end < 0:
+            yield text[start:]
+            return
+        yield text[start:end]
+        start = end + 1
+
+class DiffStreamParser:
+    """
+    Incremental diff parser fed one line at a time.
+
+    Only the file currently being parsed is held in memory: `feed` returns
+    the previous file's FileDiff as soon as the next file's header arrives,
+    and `close` returns the last one.
+    """
+
+    def __init__(self, max_file_bytes: Optional[int] = None):
+        self.max_file_bytes = max_file_bytes
+        self._builder: Optional[_FileDiffBuilder] = None
+
+    def feed(self, line: str) -> Optional[FileDiff]:
+        if line.startswith('diff --git '):
+            finished = self.close()
+            self._builder = _FileDiffBuilder(line, self.max_file_bytes)
+            return finished
+        if self._builder is not None:
+            self._builder.add(line)
+        return None
+
+    def close(self) -> Optional[FileDiff]:
+        builder, self._builder = self._builder, None
+        return builder.build() if builder is not None else None
 
 class DiffParser:
     """Parser for git diff output to extract meaningful file changes."""
-    
+
+    @staticmethod
+    def iter_files(lines: Iterable[str], max_file_bytes: Optional[int] = None) -> Iterator[FileDiff]:
+        """
+        Yields one FileDiff per file while consuming `lines` (e.g. an open file).
+
+        Trailing newlines on the lines are ignored.
+        """
+        parser = DiffStreamParser(max_file_bytes)
+        for line in lines:
+            if line.endswith('\n'):
+                line = line[:-1]
+            finished = parser.feed(line)
+            if finished is not None:
+                yield finished
+        finished = parser.close()
+        if finished is not None:
+            yield finished
+
+    @staticmethod
+    async def aiter_files(chunks: AsyncIterable[bytes], max_file_bytes: Optional[int] = None,
+                          encoding: str = 'utf-8') -> AsyncIterator[FileDiff]:
+        """
+        Yields one FileDiff per file while consuming an async byte stream,
+        such as an HTTP response body read in chunks.
+        """
+        decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+        parser = DiffStreamParser(max_file_bytes)
+        pending = ""
+        async for chunk in chunks:
+            lines = (pending + decoder.decode(chunk)).split('\n')
+            pending = lines.pop()
+            for line in lines:
+                finished = parser.feed(line)
+                if finished is not None:
+                    yield finished
+        for line in (pending + decoder.decode(b'', final=True)).split('\n'):
+            finished = parser.feed(line)
+            if finished is not None:
+                yield finished
+        finished = parser.close()
+        if finished is not None:
+            yield finished
+
     @staticmethod
     async def parse_diff(diff_text: str) -> Dict[str, FileDiff]:
         """
@@ -27,27 +495,23 @@ class DiffParser:
                 diff_text = "\n".join(str(line) for line in diff_text)
             elif not isinstance(diff_text, str):
                 diff_text = str(diff_text)
-                
-            diffs = {}
-            current_file = None
-            current_content = []
-            
-            for line in diff_text.split('\n'):
-                if line.startswith('diff --git'):
-                    if current_file:
-                        diffs[current_file] = FileDiff("\n".join(current_content))
-                    current_file = line.split()[-1].lstrip('b/')
-                    current_content = []
-                current_content.append(line)
-                
-            if current_file:
-                diffs[current_file] = FileDiff("\n".join(current_content))
-                
-            return diffs
+            return DiffParser._parse_lines(_iter_text_lines(diff_text))
         except Exception as e:
             logger.error(f"Error parsing diff content: {e}")
             return {}
 
+    @staticmethod
+    def parse_patch(patch: str, path: str) -> FileDiff:
+        """Parses a bare per-file patch (hunks only, as the GitHub files API returns it)."""
+        builder = _FileDiffBuilder(f"diff --git a/{path} b/{path}")
+        for line in _iter_text_lines(patch):
+            builder.add(line)
+        return builder.build()
+
+    @staticmethod
+    def _parse_lines(lines: Iterable[str], max_file_bytes: Optional[int] = None) -> Dict[str, FileDiff]:
+        return {diff.path: diff for diff in DiffParser.iter_files(lines, max_file_bytes)}
+
     async def get_relevant_diff_content(self, diff_text: str, patterns: List[str]) -> Dict[str, FileDiff]:
         """
         Gets relevant diff content filtered by file patterns.
@@ -63,14 +527,7 @@ class DiffParser:
             if not diff_text:
                 return {}
                 
-            all_diffs = self._parse_diff(diff_text)
-            relevant_diffs = {}
-            
-            for filename, diff in all_diffs.items():
-                if any(fnmatch.fnmatch(filename, pattern) for pattern in patterns):
-                    relevant_diffs[filename] = diff
-                    
-            return relevant_diffs
+            return dict(ParsedDiff.from_text(diff_text).select(patterns))
         except Exception as e:
             logger.error(f"Error parsing diff: {e}")
             return {}
@@ -78,50 +535,76 @@ class DiffParser:
     def _parse_diff(self, diff_text: str) -> Dict[str, FileDiff]:
         """Parses git diff output into structured format."""
         try:
-            diffs = {}
-            current_file = None
-            current_content = []
-            added_lines = 0
-            removed_lines = 0
-            modified_lines = 0
-            
-            for line in diff_text.split('\n'):
-                if line.startswith('diff --git'):
-                    if current_file:
-                        # Create FileDiff for previous file
-                        diffs[current_file] = FileDiff(
-                            content='\n'.join(current_content),
-                            added_lines=added_lines,
-                            removed_lines=removed_lines,
-                            modified_lines=modified_lines
-                        )
-                    # Reset for new file
-                    current_file = line.split()[-1].lstrip('b/')
-                    current_content = []
-                    added_lines = 0
-                    removed_lines = 0
-                    modified_lines = 0
-                
-                current_content.append(line)
-                
-                # Count line changes
-                if line.startswith('+') and not line.startswith('+++'):
-                    added_lines += 1
-                elif line.startswith('-') and not line.startswith('---'):
-                    removed_lines += 1
-                elif line.startswith('@@ '):
-                    modified_lines += 1
-            
-            # Don't forget the last file
-            if current_file:
-                diffs[current_file] = FileDiff(
-                    content='\n'.join(current_content),
-                    added_lines=added_lines,
-                    removed_lines=removed_lines,
-                    modified_lines=modified_lines
-                )
-                
-            return diffs
+            return self._parse_lines(_iter_text_lines(diff_text))
         except Exception as e:
             logger.error(f"Error parsing diff content: {e}")
             return {}
+
+class FilePatternMatcher:
+    """Tests a filename against a set of fnmatch patterns with one compiled regex."""
+
+    def __init__(self, patterns: Sequence[str]):
+        self.patterns = tuple(patterns)
+        self._regex = re.compile("|".join(f"(?:{fnmatch.translate(p)})" for p in self.patterns)) if self.patterns else None
+
+    def matches(self, filename: str) -> bool:
+        return self._regex is not None and self._regex.match(filename) is not None
+
+class ParsedDiff(Mapping):
+    """
+    Immutable, parse-once view of a pull request diff keyed by filename.
+
+    Built once per review and shared by every agent. `select` hands out the
+    subset of files matching an agent's patterns; selections reference the
+    same FileDiff objects and are cached per pattern set.
+    """
+
+    def __init__(self, files: Dict[str, FileDiff]):
+        self._files = dict(files)
+        self._selections: Dict[Tuple[str, ...], Mapping] = {}
+
+    @classmethod
+    def from_text(cls, diff_text: str) -> "ParsedDiff":
+        """Parses raw diff text."""
+        return cls(DiffParser()._parse_diff(diff_text) if diff_text else {})
+
+    @classmethod
+    def from_files(cls, files: Iterable[FileDiff]) -> "ParsedDiff":
+        """Collects FileDiffs produced incrementally, e.g. by DiffParser.iter_files."""
+        return cls({diff.path: diff for diff in files})
+
+    @classmethod
+    async def from_stream(cls, chunks: AsyncIterable[bytes], max_file_bytes: Optional[int] = None) -> "ParsedDiff":
+        """Parses an async byte stream without holding the raw diff in memory."""
+        return cls({diff.path: diff async for diff in DiffParser.aiter_files(chunks, max_file_bytes)})
+
+    def __getitem__(self, filename: str) -> FileDiff:
+        return self._files[filename]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._files)
+
+    def __len__(self) -> int:
+        return len(self._files)
+
+    def select(self, patterns: Sequence[str]) -> Mapping:
+        """Returns a read-only mapping of the files matching any of `patterns`."""
+        key = tuple(patterns)
+        selection = self._selections.get(key)
+        if selection is None:
+            matcher = _get_matcher(key)
+            selection = MappingProxyType({
+                filename: diff for filename, diff in self._files.items()
+                if matcher.matches(filename)
+            })
+            self._selections[key] = selection
+        return selection
+
+_matchers: Dict[Tuple[str, ...], FilePatternMatcher] = {}
+
+def _get_matcher(patterns: Tuple[str, ...]) -> FilePatternMatcher:
+    """Returns a cached matcher; agents reuse the same pattern lists on every review."""
+    matcher = _matchers.get(patterns)
+    if matcher is None:
+        matcher = _matchers[patterns] = FilePatternMatcher(patterns)
+    return matcher
@@ -0,0 +1,43 @@
+# utils/diff_positions.py
+from typing import Dict, Iterable, Optional
+import logging
+from utils.diff_parser import DiffParser
+
+logger = logging.getLogger(__name__)
+
+def build_line_position_map(patch: str) -> Dict[int, int]:
+    """
+    Maps new-file line numbers to GitHub diff positions from the parsed hunks.
+
+    Position 1 is the line below the first hunk header and keeps counting
+    through removed lines and later hunk headers, matching what the review
+    comments API expects. Added and context lines are both addressable.
+    """
+    positions: Dict[int, int] = {}
+    base = 0
+    for index, hunk in enumerate(DiffParser.parse_patch(patch, "").hunks):
+        # The first header is position 0; later headers occupy a position
+        if index:
+            base += 1
+        for offset, line in enumerate(hunk, start=1):
+            if line.new_lineno is not None:
+                positions[line.new_lineno] = base + offset
+        base += len(hunk)
+    return positions
+
+class DiffPositionIndex:
+    """Per-file line-to-position maps for one review, built lazily per file."""
+
+    def __init__(self, files: Iterable):
+        self._patches: Dict[str, str] = {f.filename: f.patch for f in files if f.patch}
+        self._maps: Dict[str, Dict[int, int]] = {}
+
+    def get(self, file_path: str, line_number: int) -> Optional[int]:
+        """Returns the diff position of a new-file line, or None if it is not in the diff."""
+        positions = self._maps.get(file_path)
+        if positions is None:
+            patch = self._patches.get(file_path)
+            if patch is None:
+                return None
+            positions = self._maps[file_path] = build_line_position_map(patch)
+        return positions.get(line_number)
@@ -0,0 +1,283 @@
+# utils/file_triage.py
+from collections import Counter, OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional, Tuple
+from github.Repository import Repository
+import math
+import logging
+import posixpath
+import re
+import threading
+from utils.diff_parser import FileDiff, ParsedDiff
+from config import (
+    TRIAGE_MAX_FILE_BYTES,
+    TRIAGE_MAX_LINE_LENGTH,
+    TRIAGE_ENTROPY_THRESHOLD,
+    TRIAGE_SUMMARY_LINES
+)
+
+logger = logging.getLogger(__name__)
+
+REVIEW = "review"
+SUMMARIZE = "summarize"
+SKIP = "skip"
+
+# Linguist-style path rules, matched against the whole path
+VENDORED_PATHS = re.compile(
+    r'(?:^|/)(?:vendor|vendors|node_modules|bower_components|third_party|third-party|'
+    r'Godeps|\.yarn|jspm_packages|Carthage|Pods|site-packages|\.venv)/'
+)
+GENERATED_PATHS = re.compile(
+    r'(?:\.min\.(?:js|css)|\.js\.map|\.css\.map|\.pb\.go|\.pb\.cc|\.pb\.h|_pb2\.pyi?|_pb2_grpc\.py|'
+    r'\.pb\.swift|_pb\.js|\.g\.dart|\.freezed\.dart|\.designer\.cs|\.Designer\.cs|\.generated\.\w+|'
+    r'_generated\.\w+|\.snap)$'
+    r'|(?:^|/)(?:dist|generated|__generated__)/'
+)
+LOCKFILES = frozenset({
+    'package-lock.json', 'npm-shrinkwrap.json', 'yarn.lock', 'pnpm-lock.yaml', 'bun.lockb',
+    'poetry.lock', 'Pipfile.lock', 'pdm.lock', 'uv.lock', 'Cargo.lock', 'go.sum',
+    'composer.lock', 'Gemfile.lock', 'Podfile.lock', 'mix.lock', 'flake.lock', 'packages.lock.json'
+})
+
+# Below this many bytes of added text the entropy estimate is too noisy
+_ENTROPY_MIN_SAMPLE = 2048
+_ENTROPY_SAMPLE = 64 * 1024
+
+@dataclass(frozen=True)
+class TriageDecision:
+    path: str
+    action: str
+    reason: str
+    added_lines: int = 0
+    removed_lines: int = 0
+    bytes: int = 0
+
+class GitAttributes:
+    """
+    The `linguist-generated` and `linguist-vendored` attributes from a
+    .gitattributes file. Later lines override earlier ones, as in git.
+    """
+
+    ATTRIBUTES = ('linguist-generated', 'linguist-vendored')
+
+    def __init__(self, text: str = ""):
+        self._rules: List[Tuple[re.Pattern, Dict[str, Optional[bool]]]] = []
+        for line in text.splitlines():
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            pattern, *attrs = line.split()
+            values = {}
+            for attr in attrs:
+                name, _, value = attr.partition('=')
+                if name.startswith('-') and name[1:] in self.ATTRIBUTES:
+                    values[name[1:]] = False
+                elif name.startswith('!') and name[1:] in self.ATTRIBUTES:
+                    values[name[1:]] = None
+                elif name in self.ATTRIBUTES:
+                    values[name] = value.lower() not in ('false', '0') if value else True
+            if values:
+                self._rules.append((self._compile(pattern), values))
+
+    @staticmethod
+    def _compile(pattern: str) -> re.Pattern:
+        """Translates a gitattributes pattern; patterns without a slash match the basename."""
+        anchored = '/' in pattern.rstrip('/')
+        pattern = pattern.lstrip('/')
+        out = []
+        i = 0
+        while i < len(pattern):
+            if pattern.startswith('**/', i):
+                out.append('(?:.*/)?')
+                i += 3
+            elif pattern.startswith('/**', i) and i + 3 == len(pattern):
+                out.append('/.*')
+                i += 3
+            elif pattern[i] == '*':
+                out.append('[^/]*')
+                i += 1
+            elif pattern[i] == '?':
+                out.append('[^/]')
+                i += 1
+            elif pattern[i] == '[':
+                end = pattern.find(']', i + 1)
+                if end < 0:
+                    out.append(re.escape('['))
+                    i += 1
+                else:
+                    out.append('[' + pattern[i + 1:end].replace('!', '^', 1) + ']')
+                    i = end + 1
+            else:
+                out.append(re.escape(pattern[i]))
+                i += 1
+        prefix = '' if anchored else '(?:.*/)?'
+        return re.compile(prefix + ''.join(out) + r'\Z')
+
+    def get(self, path: str, attribute: str) -> Optional[bool]:
+        """Returns the attribute's value for `path`, or None when unspecified."""
+        value = None
+        for regex, values in self._rules:
+            if attribute in values and regex.match(path):
+                value = values[attribute]
+        return value
+
+    def __bool__(self) -> bool:
+        return bool(self._rules)
+
+def shannon_entropy(text: str) -> float:
+    """Bits per character of `text`."""
+    if not text:
+        return 0.0
+    total = len(text)
+    return -sum(n / total * math.log2(n / total) for n in Counter(text).values())
+
+class FileTriage:
+    """
+    Decides per file whether it is reviewed in full, summarized or skipped
+    before any agent sees it.
+
+    Rules run cheapest first: binary flag, .gitattributes, path rules, then
+    size, line-length and entropy heuristics over the added lines. Skipped
+    files are dropped from the diff handed to agents; summarized files are
+    replaced by a short synopsis with a sample of their changed lines.
+    """
+
+    def __init__(self,
+                 gitattributes: Optional[GitAttributes] = None,
+                 max_file_bytes: int = TRIAGE_MAX_FILE_BYTES,
+                 max_line_length: int = TRIAGE_MAX_LINE_LENGTH,
+                 entropy_threshold: float = TRIAGE_ENTROPY_THRESHOLD,
+                 summary_lines: int = TRIAGE_SUMMARY_LINES):
+        self.gitattributes = gitattributes or GitAttributes()
+        self.max_file_bytes = max_file_bytes
+        self.max_line_length = max_line_length
+        self.entropy_threshold = entropy_threshold
+        self.summary_lines = summary_lines
+
+    def classify(self, path: str, diff: FileDiff) -> TriageDecision:
+        action, reason = self._classify(path, diff)
+        return TriageDecision(path, action, reason, diff.added_lines, diff.removed_lines, len(diff.content))
+
+    def _classify(self, path: str, diff: FileDiff) -> Tuple[str, str]:
+        if diff.is_binary:
+            return SKIP, "binary"
+        if self.gitattributes.get(path, 'linguist-generated'):
+            return SKIP, "linguist-generated"
+        if self.gitattributes.get(path, 'linguist-vendored'):
+            return SKIP, "linguist-vendored"
+        if VENDORED_PATHS.search(path):
+            return SKIP, "vendored path"
+        if GENERATED_PATHS.search(path):
+            return SKIP, "generated path"
+        if posixpath.basename(path) in LOCKFILES:
+            return SUMMARIZE, "lockfile"
+        if diff.truncated or (self.max_file_bytes and len(diff.content) > self.max_file_bytes):
+            return SUMMARIZE, "size"
+
+        count = 0
+        total = 0
+        longest = 0
+        sample: List[str] = []
+        sampled = 0
+        for line in diff.iter_added():
+            length = len(line.text)
+            count += 1
+            total += length
+            longest = max(longest, length)
+            if sampled < _ENTROPY_SAMPLE:
+                sample.append(line.text)
+                sampled += length
+        if count and self.max_line_length:
+            if total / count > self.max_line_length or longest > self.max_line_length * 10:
+                return SKIP, "minified"
+        if sampled >= _ENTROPY_MIN_SAMPLE and self.entropy_threshold:
+            entropy = shannon_entropy("".join(sample))
+            if entropy > self.entropy_threshold:
+                return SUMMARIZE, f"high entropy ({entropy:.2f} bits/char)"
+        return REVIEW, "source"
+
+    def triage(self, parsed_diff: ParsedDiff) -> Dict[str, TriageDecision]:
+        """Classifies every file of the diff."""
+        decisions = {}
+        for path, diff in parsed_diff.items():
+            try:
+                decisions[path] = self.classify(path, diff)
+            except Exception as e:
+                logger.error(f"Error triaging {path}: {e}")
+                decisions[path] = TriageDecision(path, REVIEW, "triage error")
+        return decisions
+
+    def summarize(self, path: str, diff: FileDiff, reason: str) -> FileDiff:
+        """Returns a compact stand-in for `diff` with a sample of its changed lines."""
+        lines = [
+            f"diff --git a/{diff.old_path or path} b/{path}",
+            f"# Summarized ({reason}): +{diff.added_lines} -{diff.removed_lines} lines "
+            f"in {diff.modified_lines} hunks; full content omitted"
+        ]
+        for line in diff.iter_lines():
+            if len(lines) - 2 >= self.summary_lines:
+                lines.append("# ...")
+                break
+            if line.kind in ('+', '-'):
+                lines.append(f"{line.kind}{line.text[:200]}")
+        return FileDiff(
+            content="\n".join(lines),
+            added_lines=diff.added_lines,
+            removed_lines=diff.removed_lines,
+            modified_lines=diff.modified_lines,
+            old_path=diff.old_path,
+            new_path=diff.new_path,
+            status=diff.status,
+            is_binary=diff.is_binary,
+            truncated=True
+        )
+
+    def apply(self, parsed_diff: ParsedDiff, decisions: Dict[str, TriageDecision],
+              summarize: bool = True) -> ParsedDiff:
+        """
+        Builds the diff agents review: skipped files dropped, summarized ones
+        condensed. With `summarize` False, files to summarize are kept in
+        full, for agents that scan patches rather than prompt a model.
+        """
+        files = {}
+        for path, diff in parsed_diff.items():
+            decision = decisions.get(path)
+            if decision is None or decision.action == REVIEW:
+                files[path] = diff
+            elif decision.action == SUMMARIZE:
+                files[path] = self.summarize(path, diff, decision.reason) if summarize else diff
+        return ParsedDiff(files)
+
+def triage_report(decisions: Dict[str, TriageDecision]) -> Dict:
+    """Serializable summary of triage decisions for the review results."""
+    counts = Counter(d.action for d in decisions.values())
+    skipped_bytes = sum(d.bytes for d in decisions.values() if d.action != REVIEW)
+    return {
+        "files": {path: asdict(d) for path, d in decisions.items()},
+        "counts": {action: counts.get(action, 0) for action in (REVIEW, SUMMARIZE, SKIP)},
+        "bytes_excluded": skipped_bytes
+    }
+
+_CACHE_SIZE = 64
+_attributes: "OrderedDict[Tuple[str, str], GitAttributes]" = OrderedDict()
+_lock = threading.Lock()
+
+def load_gitattributes(repo: Repository, ref: str) -> GitAttributes:
+    """Fetches the root .gitattributes at `ref`, cached per repository and ref."""
+    key = (repo.full_name, ref)
+    with _lock:
+        if key in _attributes:
+            _attributes.move_to_end(key)
+            return _attributes[key]
+    try:
+        text = repo.get_contents('.gitattributes', ref=ref).decoded_content.decode('utf-8', errors='replace')
+    except Exception as e:
+        # Most repositories have none; the API answers 404
+        logger.debug(f"No .gitattributes for {repo.full_name}@{ref}: {e}")
+        text = ""
+    attributes = GitAttributes(text)
+    with _lock:
+        _attributes[key] = attributes
+        while len(_attributes) > _CACHE_SIZE:
+            _attributes.popitem(last=False)
+    return attributes
@@ -1,15 +1,24 @@
+import aiohttp
 import requests
 from github.Repository import Repository
 from github.PullRequest import PullRequest
 import logging
 from config import GITHUB_TOKEN
-from typing import List, Dict, Optional, Union
+from utils.pr_snapshot import PRFile, PRSnapshot
+from utils.repo_index import RepoTreeIndex, get_repo_tree_index
+from utils.diff_positions import DiffPositionIndex, build_line_position_map
+from utils.diff_parser import DiffParser
+import posixpath
+from typing import AsyncIterator, List, Dict, Optional, Union
 import re
 from datetime import datetime, timedelta
 import json
 
 logger = logging.getLogger(__name__)
 
+# The compare API lists at most this many files
+COMPARE_MAX_FILES = 300
+
 def get_open_pull_requests(repo):
     try:
         pulls = repo.get_pulls(state='open', sort='created')
@@ -31,6 +40,43 @@ def get_pull_request_diff(pr: PullRequest):
         logger.error(f"Error fetching diff for PR #{pr.number}: {e}")
         return ""
 
+async def stream_pull_request_diff(pr: PullRequest, chunk_size: int = 64 * 1024) -> AsyncIterator[bytes]:
+    """
+    Streams the raw diff of a pull request in chunks, so it can be parsed
+    incrementally (see ParsedDiff.from_stream) instead of read into one string.
+    """
+    headers = {
+        'Accept': 'application/vnd.github.v3.diff',
+        'Authorization': f'token {GITHUB_TOKEN}'
+    }
+    timeout = aiohttp.ClientTimeout(total=None, sock_read=60)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        async with session.get(pr.diff_url, headers=headers) as response:
+            response.raise_for_status()
+            async for chunk in response.content.iter_chunked(chunk_size):
+                yield chunk
+
+def get_compare_files(repo: Repository, base_sha: str, head_sha: str) -> Optional[List[PRFile]]:
+    """
+    Returns the files changed between two commits of a PR branch, or None
+    when the comparison cannot stand in for the PR's own diff: the old head
+    is gone or no longer an ancestor (force push), or GitHub capped the
+    file list.
+    """
+    try:
+        comparison = repo.compare(base_sha, head_sha)
+        if comparison.status not in ('ahead', 'identical'):
+            logger.info(f"{base_sha[:7]}...{head_sha[:7]} is {comparison.status}, not a fast-forward")
+            return None
+        files = [PRFile.from_github(f) for f in comparison.files]
+        if len(files) >= COMPARE_MAX_FILES:
+            logger.info(f"{base_sha[:7]}...{head_sha[:7]} changes {len(files)} files or more")
+            return None
+        return files
+    except Exception as e:
+        logger.warning(f"Error comparing {base_sha[:7]}...{head_sha[:7]}: {e}")
+        return None
+
 def parse_review_comments(review_body: str) -> List[Dict]:
     """
     Parses the LLM's review and extracts individual comments with file paths and line numbers.
@@ -50,7 +96,7 @@ def parse_review_comments(review_body: str) -> List[Dict]:
         })
     return comments
 
-def post_review_comment(pr: PullRequest, review_body: str):
+def post_review_comment(pr: Union[PullRequest, PRSnapshot], review_body: str):
     try:
         if not review_body.strip():
             logger.error("Review body is empty. Skipping review post.")
@@ -59,8 +105,9 @@ def post_review_comment(pr: PullRequest, review_body: str):
         comments_data = parse_review_comments(review_body)
         if comments_data:
             review_comments = []
+            position_index = get_position_index(pr)
             for comment in comments_data:
-                position = get_diff_position(pr, comment['path'], comment['line'])
+                position = position_index.get(comment['path'], comment['line'])
                 if position is not None:
                     review_comments.append({
                         'path': comment['path'],
@@ -89,21 +136,24 @@ def post_review_comment(pr: PullRequest, review_body: str):
     except Exception as e:
         logger.error(f"Error posting review for PR #{pr.number}: {e}", exc_info=True)
 
-def get_diff_position(pr: PullRequest, file_path: str, line_number: int) -> int:
+def get_position_index(pr: Union[PullRequest, PRSnapshot]) -> DiffPositionIndex:
+    """
+    Returns the line-to-position index for a PR, reusing the snapshot's
+    index when available so placing many comments costs one file listing.
+    """
+    if isinstance(pr, PRSnapshot):
+        return pr.position_index
+    return DiffPositionIndex(pr.get_files())
+
+def get_diff_position(pr: Union[PullRequest, PRSnapshot], file_path: str, line_number: int) -> int:
     """
     Maps a line number in the file to a position in the diff.
     """
     try:
-        files = pr.get_files()
-        for file in files:
-            if file.filename == file_path:
-                patch = file.patch
-                # Parse the patch to map line numbers to positions
-                position = map_line_to_position(patch, line_number)
-                if position:
-                    return position
-        logger.error(f"Could not find position for {file_path}:{line_number}")
-        return None
+        position = get_position_index(pr).get(file_path, line_number)
+        if position is None:
+            logger.error(f"Could not find position for {file_path}:{line_number}")
+        return position
     except Exception as e:
         logger.error(f"Error getting diff position: {e}")
         return None
@@ -112,46 +162,55 @@ def map_line_to_position(patch: str, line_number: int) -> int:
     """
     Parses the patch text to find the diff position of the given line number.
     """
-    current_line = None
-    position = 0
-    for line in patch.split('\n'):
-        if line.startswith('@@'):
-            # Parse the hunk header to get the starting line number
-            m = re.match(r'@@ \-\d+(?:,\d+)? \+(\d+)(?:,\d+)? @@', line)
-            if m:
-                current_line = int(m.group(1)) - 1
-        elif line.startswith('+'):
-            current_line += 1
-            position += 1
-            if current_line == line_number:
-                return position
-        elif not line.startswith('-'):
-            current_line += 1
-            position += 1
-    return None
-def get_previous_comments(pr: PullRequest) -> str:
+    return build_line_position_map(patch).get(line_number)
+
+def get_previous_comments(pr: Union[PullRequest, PRSnapshot]) -> str:
     """
     Fetches previous comments on a pull request.
     
     Args:
-    pr (PullRequest): The pull request object.
+    pr (PullRequest or PRSnapshot): The pull request object.
     
     Returns:
     str: A formatted string containing previous comments.
     """
-    comments = pr.get_issue_comments()
+    if isinstance(pr, PRSnapshot):
+        comments = pr.issue_comments
+    else:
+        comments = [{'user': c.user.login, 'body': c.body} for c in pr.get_issue_comments()]
     formatted_comments = []
     for comment in comments:
-        formatted_comments.append(f"Commenter: {comment.user.login}\nComment: {comment.body}\n")
+        formatted_comments.append(f"Commenter: {comment['user']}\nComment: {comment['body']}\n")
     
     return "\n".join(formatted_comments)
 
-def analyze_code_quality(pr: PullRequest) -> Dict:
+# Heuristics shared by the code quality analysis and hunk-level triage
+SOURCE_EXTENSIONS = ('.py', '.js', '.ts', '.java', '.cpp', '.cs', '.go', '.rb')
+DEBUG_PATTERNS = {
+    'python': [r'print\(', r'debugger', r'breakpoint\(\)'],
+    'javascript': [r'console\.(log|debug|info)', r'debugger'],
+    'java': [r'System\.out\.print', r'e\.printStackTrace\(\)'],
+}
+TODO_PATTERN = r'(?i)(TODO|FIXME|XXX|HACK):'
+DEFINITION_PATTERN = r'(def\s+|function\s+|class\s+)'
+SECURITY_PATTERNS = [
+    (r'password|secret|key|token|credential', 'Possible sensitive information'),
+    (r'sql\s*=|SELECT\s+.*\s+FROM', 'SQL query detected - verify for injection risks'),
+    (r'eval\(|exec\(', 'Dangerous code execution detected'),
+    (r'subprocess|shell|os\.system', 'System command execution detected'),
+]
+
+def cognitive_complexity(text: str) -> int:
+    """Rough cognitive complexity of code text, weighting loops over branches."""
+    return (text.count('if ') + text.count('else ') + 2 * text.count('for ') + 2 * text.count('while ')
+            + text.count('try') + text.count('catch'))
+
+def analyze_code_quality(pr: Union[PullRequest, PRSnapshot]) -> Dict:
     """
     Analyzes code quality metrics for files in a pull request.
     
     Args:
-        pr: PullRequest object
+        pr: PullRequest object, or a PRSnapshot to reuse its fetched files
         
     Returns:
         Dictionary containing various code quality metrics and analysis
@@ -170,9 +229,10 @@ def analyze_code_quality(pr: PullRequest) -> Dict:
         file_count = len(files)
         
         for file in files:
-            if file.filename.endswith(('.py', '.js', '.ts', '.java', '.cpp', '.cs', '.go', '.rb')):
+            if file.filename.endswith(SOURCE_EXTENSIONS):
                 patch = file.patch if file.patch else ''
                 lines = patch.split('\n')
+                file_diff = DiffParser.parse_patch(patch, file.filename)
                 total_lines_changed += len(lines)
                 
                 # Code style analysis
@@ -187,14 +247,8 @@ def analyze_code_quality(pr: PullRequest) -> Dict:
                     })
                 
                 # Check for debug statements
-                debug_patterns = {
-                    'python': [r'print\(', r'debugger', r'breakpoint\(\)'],
-                    'javascript': [r'console\.(log|debug|info)', r'debugger'],
-                    'java': [r'System\.out\.print', r'e\.printStackTrace\(\)'],
-                }
-                
                 file_ext = file.filename.split('.')[-1]
-                for lang, patterns in debug_patterns.items():
+                for lang, patterns in DEBUG_PATTERNS.items():
                     for pattern in patterns:
                         if re.search(pattern, patch):
                             style_issues.append({
@@ -204,7 +258,7 @@ def analyze_code_quality(pr: PullRequest) -> Dict:
                             })
                 
                 # Check for TODO comments
-                todos = re.findall(r'(?i)(TODO|FIXME|XXX|HACK):', patch)
+                todos = re.findall(TODO_PATTERN, patch)
                 if todos:
                     style_issues.append({
                         'issue': f'Contains {len(todos)} TODO/FIXME comments',
@@ -214,19 +268,11 @@ def analyze_code_quality(pr: PullRequest) -> Dict:
                 
                 # Code complexity analysis
                 complexity_metrics = {
-                    'cognitive_complexity': 0,
+                    'cognitive_complexity': cognitive_complexity(patch),
                     'nested_depth': 0,
-                    'function_count': len(re.findall(r'(def\s+|function\s+|class\s+)', patch)),
+                    'function_count': len(re.findall(DEFINITION_PATTERN, patch)),
                 }
                 
-                # Calculate cognitive complexity
-                complexity_metrics['cognitive_complexity'] += patch.count('if ') * 1
-                complexity_metrics['cognitive_complexity'] += patch.count('else ') * 1
-                complexity_metrics['cognitive_complexity'] += patch.count('for ') * 2
-                complexity_metrics['cognitive_complexity'] += patch.count('while ') * 2
-                complexity_metrics['cognitive_complexity'] += patch.count('try') * 1
-                complexity_metrics['cognitive_complexity'] += patch.count('catch') * 1
-                
                 # Calculate maximum nesting depth
                 current_depth = 0
                 max_depth = 0
@@ -257,21 +303,15 @@ def analyze_code_quality(pr: PullRequest) -> Dict:
                 metrics['complexity'][file.filename] = complexity_metrics
                 
                 # Check for potential issues
-                security_patterns = [
-                    (r'password|secret|key|token|credential', 'Possible sensitive information'),
-                    (r'sql\s*=|SELECT\s+.*\s+FROM', 'SQL query detected - verify for injection risks'),
-                    (r'eval\(|exec\(', 'Dangerous code execution detected'),
-                    (r'subprocess|shell|os\.system', 'System command execution detected'),
-                ]
-                
-                for pattern, message in security_patterns:
+                for pattern, message in SECURITY_PATTERNS:
                     if re.search(pattern, patch, re.IGNORECASE):
                         metrics['potential_issues'].append({
                             'file': file.filename,
                             'issue': message,
                             'severity': 'high',
-                            'line_numbers': [i + 1 for i, line in enumerate(lines) 
-                                          if re.search(pattern, line, re.IGNORECASE)]
+                            'line_numbers': [line.new_lineno for line in file_diff.iter_lines()
+                                             if line.new_lineno is not None
+                                             and re.search(pattern, line.text, re.IGNORECASE)]
                         })
         
         # Generate summary
@@ -289,12 +329,12 @@ def analyze_code_quality(pr: PullRequest) -> Dict:
         logger.error(f"Error analyzing code quality: {e}")
         return {}
 
-def get_test_coverage(pr: PullRequest) -> Dict:
+def get_test_coverage(pr: Union[PullRequest, PRSnapshot]) -> Dict:
     """
     Analyzes test coverage for changes in a pull request.
     
     Args:
-        pr: PullRequest object
+        pr: PullRequest object, or a PRSnapshot to reuse its fetched files
         
     Returns:
         Dictionary containing test coverage analysis and suggestions
@@ -321,6 +361,8 @@ def get_test_coverage(pr: PullRequest) -> Dict:
         }
         
         source_files_map = {}  # Maps source files to their corresponding test files
+        repo = pr.base.repo
+        tree_index = None  # Path index of the base tree, fetched on first use
         
         for file in files:
             file_path = file.filename
@@ -354,7 +396,6 @@ def get_test_coverage(pr: PullRequest) -> Dict:
                     
                     # Check for corresponding test file
                     has_test = False
-                    repo = pr.base.repo
                     
                     # Generate possible test file names
                     test_file_candidates = []
@@ -381,14 +422,14 @@ def get_test_coverage(pr: PullRequest) -> Dict:
                             f'test/java/{file_path}'
                         ]
                     
-                    for test_file in test_file_candidates:
-                        try:
-                            repo.get_contents(test_file)
-                            has_test = True
-                            source_files_map[file_path] = test_file
-                            break
-                        except:
-                            continue
+                    if test_file_candidates and tree_index is None:
+                        tree_index = get_repo_tree_index(repo, pr.base.sha) or False
+                    test_file = _find_test_file(
+                        tree_index or None, repo, pr.base.sha, file_path, test_file_candidates
+                    )
+                    if test_file:
+                        has_test = True
+                        source_files_map[file_path] = test_file
                     
                     if not has_test:
                         coverage_info['untested_files'].append(file_path)
@@ -424,12 +465,74 @@ def get_test_coverage(pr: PullRequest) -> Dict:
         logger.error(f"Error analyzing test coverage: {e}")
         return {}
 
-def analyze_dependencies(pr: PullRequest) -> Dict:
+_TEST_DIRS = ('tests', 'test')
+# Directory names too common to tie a test to a source file on their own
+_GENERIC_DIRS = frozenset(('src', 'lib', 'pkg', 'source', 'app', 'main', 'java', 'python', 'internal'))
+
+def _is_related_test(test_path: str, file_path: str) -> bool:
+    """
+    True when a test file found by name plausibly covers `file_path`: it
+    sits in the source's directory (or a tests/ or test/ directory inside
+    it), at the source's path mirrored under a top-level tests/ or test/
+    (with a leading src/ dropped), or in a directory with the same name as
+    the source's, as in src/main/java/com/x and src/test/java/com/x.
+    """
+    source_dir = posixpath.dirname(file_path)
+    test_dir = posixpath.dirname(test_path)
+    if posixpath.basename(test_dir) in _TEST_DIRS:
+        if posixpath.dirname(test_dir) == source_dir:
+            return True
+    if test_dir == source_dir:
+        return True
+    mirrored = source_dir[4:] if source_dir == 'src' or source_dir.startswith('src/') else source_dir
+    if test_dir in {posixpath.join(root, mirrored).rstrip('/') for root in _TEST_DIRS}:
+        return True
+    name = posixpath.basename(source_dir)
+    return bool(name) and name not in _GENERIC_DIRS and posixpath.basename(test_dir) == name
+
+def _find_test_file(index: Optional[RepoTreeIndex], repo: Repository, ref: str,
+                    file_path: str, candidates: List[str]) -> Optional[str]:
+    """
+    Finds an existing test file for `file_path` in the base tree.
+
+    Candidates are checked against the local tree index first, then test
+    files with a matching name near the source directory (see
+    _is_related_test). The
+    GitHub contents API is only used when no complete index is available.
+    """
+    if index is not None:
+        for candidate in candidates:
+            if candidate in index:
+                return candidate
+        source_name = posixpath.basename(file_path)
+        test_names = dict.fromkeys(
+            posixpath.basename(c) for c in candidates if posixpath.basename(c) != source_name
+        )
+        if source_name.endswith('.py'):
+            # pytest convention; the 'test_{path}' candidate only covers top-level files
+            test_names[f'test_{source_name}'] = None
+        for test_name in test_names:
+            matches = [m for m in index.find(test_name, near=posixpath.dirname(file_path))
+                       if _is_related_test(m, file_path)]
+            if matches:
+                return matches[0]
+        if not index.truncated:
+            return None
+
+    for candidate in candidates:
+        try:
+            repo.get_contents(candidate, ref=ref)
+            return candidate
+        except Exception:
+            continue
+    return None
+
+def analyze_dependencies(pr: Union[PullRequest, PRSnapshot]) -> Dict:
     """
     Analyzes dependency changes in package management files.
     
     Args:
-        pr: PullRequest object
+        pr: PullRequest object, or a PRSnapshot to reuse its fetched files
         
     Returns:
         Dictionary containing dependency analysis and security implications
@@ -602,7 +705,8 @@ def format_security_review(security_review: Dict) -> str:
         output.append("### 🔒 Security Vulnerabilities\n")
         for vuln in security_review['vulnerabilities']:
             output.append(f"- **{vuln['severity']}**: {vuln['description']}")
-            output.append(f"  - File: `{vuln['file']}` Line: {vuln['line']}\n")
+            line = vuln['line'] if vuln['line'] is not None else "removed"
+            output.append(f"  - File: `{vuln['file']}` Line: {line}\n")
     
     if security_review.get('recommendations'):
         output.append("### 📋 Recommendations\n")
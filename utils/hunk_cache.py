@@ -0,0 +1,302 @@
+# utils/hunk_cache.py
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple, Union
+from contextlib import closing
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import time
+from utils.diff_parser import FileDiff, Hunk, ParsedDiff, ADDED, REMOVED, CONTEXT
+from utils.review_state import is_failed_review
+from config import HUNK_CACHE_PATH, HUNK_CACHE_TTL
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r'\s+')
+
+def hunk_fingerprint(path: str, hunk: Hunk) -> str:
+    """
+    Identifies a hunk by its path and changed lines, like `git patch-id`
+    does for a whole patch: line numbers, context lines and whitespace are
+    ignored, so the fingerprint survives rebases and cherry-picks.
+    """
+    digest = hashlib.sha1(path.encode("utf-8"))
+    for line in hunk:
+        if line.kind == ADDED or line.kind == REMOVED:
+            digest.update(f"\n{line.kind}{_WHITESPACE.sub('', line.text)}".encode("utf-8"))
+    return digest.hexdigest()
+
+def _is_finding_list(value) -> bool:
+    return isinstance(value, list) and all(isinstance(i, dict) and 'file' in i and 'line' in i for i in value)
+
+def _anchor(hunk: Hunk) -> int:
+    """
+    New-file line of the hunk's first added or removed line. Findings are
+    stored relative to it: the fingerprint ignores context, so the number
+    of leading context lines can differ between hunks that share one.
+    """
+    leading = 0
+    for line in hunk:
+        if line.kind != CONTEXT:
+            break
+        leading += 1
+    return hunk.new_start + leading
+
+# Findings written before offsets were anchored on the first changed line are dropped
+_SCHEMA_VERSION = 2
+
+def _contains(hunk: Hunk, line: int) -> bool:
+    return hunk.new_start <= line < hunk.new_start + max(hunk.new_count, 1)
+
+@dataclass
+class HunkCacheLookup:
+    """Outcome of looking up one agent's hunks in the cache."""
+    # The hunks that missed, for the agent to review
+    diff: ParsedDiff
+    hunks: int = 0
+    hits: int = 0
+    # Structured findings of the hits, re-based to their current line numbers
+    findings: Dict[str, List[Dict]] = field(default_factory=dict)
+    # Text reviews covering only hunks that hit
+    reviews: List[str] = field(default_factory=list)
+
+    def stats(self) -> Dict:
+        return {"hunks": self.hunks, "hits": self.hits}
+
+class HunkResultCache:
+    """
+    Agent results keyed by hunk fingerprint, so hunks that are unchanged
+    apart from their position are not reviewed again after a rebase,
+    force-push, cherry-pick or backport.
+
+    Structured findings (lists of dicts with 'file' and 'line') are stored
+    per hunk with lines relative to its first changed line. A text review covers a
+    set of hunks; it is reused only while every hunk it covered is still
+    unchanged, so it never speaks for code that has since changed.
+    Entries live in SQLite in WAL mode, like the LLM response cache.
+    """
+
+    def __init__(self, path: str = HUNK_CACHE_PATH, ttl: float = HUNK_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.hunks = 0
+        self.hits = 0
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA busy_timeout = 30000")
+        return conn
+
+    def _init_db(self):
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS hunk_results (
+                    agent TEXT NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    findings TEXT,
+                    review_key TEXT,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (agent, fingerprint)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS hunk_reviews (
+                    key TEXT PRIMARY KEY,
+                    review TEXT NOT NULL,
+                    fingerprints TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            if conn.execute("PRAGMA user_version").fetchone()[0] < _SCHEMA_VERSION:
+                conn.execute("DELETE FROM hunk_results WHERE findings IS NOT NULL")
+                conn.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+
+    @staticmethod
+    def _fingerprints(diff: ParsedDiff) -> List[Tuple[str, int, str]]:
+        """(path, hunk index, fingerprint) of every hunk that can be cached."""
+        return [
+            (path, index, hunk_fingerprint(path, hunk))
+            for path, file_diff in diff.items()
+            if not file_diff.is_binary and not file_diff.truncated
+            for index, hunk in enumerate(file_diff.hunks)
+        ]
+
+    def lookup(self, agent_type: str, diff: ParsedDiff) -> HunkCacheLookup:
+        """Splits `diff` into hunks with a cached result for `agent_type` and hunks to review."""
+        hunks = self._fingerprints(diff)
+        total = sum(len(d.hunks) for d in diff.values())
+        if not hunks:
+            return HunkCacheLookup(diff, total)
+        try:
+            rows = self._load(agent_type, {fp for _, _, fp in hunks})
+        except Exception as e:
+            logger.error(f"Error reading hunk cache: {e}")
+            return HunkCacheLookup(diff, total)
+
+        present = {fp for _, _, fp in hunks}
+        entries, reviews = rows
+        # A text review is usable only if all of the hunks it covered are still here
+        usable = {key for key, (_, fingerprints) in reviews.items() if fingerprints <= present}
+        result = HunkCacheLookup(diff, total)
+        hit: Dict[str, Set[int]] = {}
+        used_reviews: List[str] = []
+        for path, index, fp in hunks:
+            entry = entries.get(fp)
+            if entry is None:
+                continue
+            findings, review_key = entry
+            if review_key is not None:
+                if review_key not in usable:
+                    continue
+                if review_key not in used_reviews:
+                    used_reviews.append(review_key)
+            hunk = diff[path].hunks[index]
+            for key, items in (findings or {}).items():
+                result.findings.setdefault(key, []).extend(
+                    {**item, "file": path, "line": _anchor(hunk) + item["line"]} for item in items
+                )
+            hit.setdefault(path, set()).add(index)
+        result.reviews = [reviews[key][0] for key in used_reviews]
+        result.hits = sum(len(indices) for indices in hit.values())
+        result.diff = self._without(diff, hit) if hit else diff
+        self.hunks += total
+        self.hits += result.hits
+        return result
+
+    def _load(self, agent_type: str, fingerprints: Set[str]) -> Tuple[Dict, Dict]:
+        """Fetches the live entries for `fingerprints` and the text reviews they point to."""
+        cutoff = time.time() - self.ttl if self.ttl else 0
+        entries: Dict[str, Tuple[Optional[Dict], Optional[str]]] = {}
+        reviews: Dict[str, Tuple[str, Set[str]]] = {}
+        with closing(self._connect()) as conn:
+            ordered = sorted(fingerprints)
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(ordered), 500):
+                batch = ordered[start:start + 500]
+                for fp, findings, review_key in conn.execute(
+                    f"SELECT fingerprint, findings, review_key FROM hunk_results "
+                    f"WHERE agent = ? AND created_at >= ? AND fingerprint IN ({','.join('?' * len(batch))})",
+                    (agent_type, cutoff, *batch)
+                ):
+                    entries[fp] = (json.loads(findings) if findings else None, review_key)
+            for key in {key for _, key in entries.values() if key is not None}:
+                row = conn.execute("SELECT review, fingerprints FROM hunk_reviews WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    reviews[key] = (row[0], set(json.loads(row[1])))
+        return entries, reviews
+
+    @staticmethod
+    def _without(diff: ParsedDiff, hit: Dict[str, Set[int]]) -> ParsedDiff:
+        files: Dict[str, FileDiff] = {}
+        for path, file_diff in diff.items():
+            indices = hit.get(path)
+            if not indices:
+                files[path] = file_diff
+                continue
+            kept = [i for i in range(len(file_diff.hunks)) if i not in indices]
+            if kept:
+                files[path] = file_diff.with_hunks(kept)
+        return ParsedDiff(files)
+
+    def store(self, agent_type: str, diff: ParsedDiff, review: Union[str, Dict, None]):
+        """Caches the result of `agent_type` reviewing `diff`; failed reviews are not cached."""
+        if is_failed_review(review):
+            return
+        if isinstance(review, dict):
+            rows = self._findings_rows(diff, review)
+        elif isinstance(review, str) and review.strip():
+            rows = self._review_rows(diff)
+        else:
+            return
+        if not rows[0]:
+            return
+        try:
+            self._save(agent_type, *rows, review if isinstance(review, str) else None)
+        except Exception as e:
+            logger.error(f"Error writing hunk cache: {e}")
+
+    def _findings_rows(self, diff: ParsedDiff, review: Dict) -> Tuple[List[Tuple[str, Dict]], None]:
+        """Per-hunk findings; a file with a finding outside its hunks is not cached."""
+        by_file: Dict[str, List[Tuple[str, Dict]]] = {}
+        for key, items in review.items():
+            if _is_finding_list(items):
+                for item in items:
+                    by_file.setdefault(item['file'], []).append((key, item))
+        rows = []
+        for path, file_diff in diff.items():
+            if file_diff.is_binary or file_diff.truncated:
+                continue
+            per_hunk: List[Dict[str, List[Dict]]] = [{} for _ in file_diff.hunks]
+            placed = True
+            for key, item in by_file.get(path, ()):
+                index = next((i for i, h in enumerate(file_diff.hunks)
+                              if isinstance(item['line'], int) and _contains(h, item['line'])), None)
+                if index is None:
+                    placed = False
+                    break
+                relative = {**item, "line": item['line'] - _anchor(file_diff.hunks[index])}
+                per_hunk[index].setdefault(key, []).append(relative)
+            if placed:
+                rows.extend((hunk_fingerprint(path, hunk), per_hunk[i]) for i, hunk in enumerate(file_diff.hunks))
+        return rows, None
+
+    def _review_rows(self, diff: ParsedDiff) -> Tuple[List[Tuple[str, None]], str]:
+        """Every hunk of `diff` points to one shared text review."""
+        fingerprints = [fp for _, _, fp in self._fingerprints(diff)]
+        if len(fingerprints) != sum(len(d.hunks) for d in diff.values()):
+            # Part of the reviewed diff cannot be fingerprinted, so the review can't be matched later
+            return [], ""
+        key = hashlib.sha256("\n".join(sorted(set(fingerprints))).encode("utf-8")).hexdigest()
+        return [(fp, None) for fp in fingerprints], key
+
+    def _save(self, agent_type: str, rows: List[Tuple[str, Optional[Dict]]], review_key: Optional[str],
+              review: Optional[str]):
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if review is not None:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO hunk_reviews (key, review, fingerprints, created_at) "
+                        "VALUES (?, ?, ?, ?)",
+                        (f"{agent_type}:{review_key}", review, json.dumps(sorted({fp for fp, _ in rows})), now)
+                    )
+                conn.executemany(
+                    "INSERT OR REPLACE INTO hunk_results (agent, fingerprint, findings, review_key, created_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    [(agent_type, fp, json.dumps(findings, ensure_ascii=False) if findings is not None else None,
+                      f"{agent_type}:{review_key}" if review is not None else None, now)
+                     for fp, findings in rows]
+                )
+                if self.ttl:
+                    conn.execute("DELETE FROM hunk_results WHERE created_at < ?", (now - self.ttl,))
+                    conn.execute("DELETE FROM hunk_reviews WHERE created_at < ?", (now - self.ttl,))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def stats(self) -> Dict:
+        """Hunks looked up and hits in this process."""
+        return {
+            "hunks": self.hunks,
+            "hits": self.hits,
+            "hit_ratio": self.hits / self.hunks if self.hunks else 0.0
+        }
+
+_hunk_cache: Optional[HunkResultCache] = None
+
+def get_hunk_cache() -> HunkResultCache:
+    """Returns the process-wide hunk result cache."""
+    global _hunk_cache
+    if _hunk_cache is None:
+        _hunk_cache = HunkResultCache()
+    return _hunk_cache
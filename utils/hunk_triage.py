@@ -0,0 +1,248 @@
+# utils/hunk_triage.py
+from dataclasses import dataclass, replace
+from typing import Dict, List, Optional, Tuple
+import keyword
+import logging
+import re
+from llm.call_context import record_metric
+from llm.ollama_llm import OllamaLLM
+from llm.prompt_budget import estimate_tokens
+from prompts.prompt_templates import create_hunk_triage_prompt
+from utils.diff_parser import FileDiff, ParsedDiff
+from utils.github_helper import (
+    SOURCE_EXTENSIONS,
+    DEBUG_PATTERNS,
+    TODO_PATTERN,
+    DEFINITION_PATTERN,
+    SECURITY_PATTERNS,
+    cognitive_complexity
+)
+from config import CASCADE_THRESHOLD, CASCADE_LLM_MODEL, CASCADE_LLM_MAX_HUNKS
+
+logger = logging.getLogger(__name__)
+
+IMPORT_LINE = re.compile(
+    r'\s*(?:import\s|from\s+\S+\s+import\s|#include\s|using\s+[\w.]+\s*;|package\s|'
+    r'(?:const|let|var)\s+\w+\s*=\s*require\(|require\s)'
+)
+# A bare `*` or `--` only starts a comment when followed by a space (not `*args` or `--i`)
+COMMENT_LINE = re.compile(r'\s*(?:#|//|/\*|\*(?:\s|/|$)|--(?:\s|$)|"""|\'\'\')')
+# In C-family files `#` starts a preprocessor directive (#define, #if, #include...), never a comment
+C_COMMENT_LINE = re.compile(r'\s*(?://|/\*|\*(?:\s|/|$))')
+_C_FAMILY = ('.c', '.h', '.cc', '.cpp', '.cxx', '.hh', '.hpp', '.hxx', '.cs', '.m', '.mm')
+_STRING = r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|`(?:\\.|[^`\\])*`'
+# String literals are single tokens, so edits inside them never look like renames
+_TOKEN = re.compile(rf'{_STRING}|\w+|[^\w\s]')
+_CODE_AND_STRINGS = re.compile(rf'({_STRING})')
+_IDENTIFIER = re.compile(r'[A-Za-z_]\w*\Z')
+# Keywords and literals of the triaged languages; swapping one changes behaviour, never a name
+_KEYWORDS = frozenset(keyword.kwlist) | frozenset((
+    'true', 'false', 'null', 'nil', 'undefined', 'this', 'self', 'super', 'new', 'delete', 'typeof',
+    'instanceof', 'void', 'var', 'let', 'const', 'function', 'func', 'fn', 'then', 'end', 'elsif',
+    'unless', 'switch', 'case', 'default', 'do', 'throw', 'throws', 'catch', 'goto', 'defer', 'go',
+    'chan', 'select', 'public', 'private', 'protected', 'static', 'final', 'abstract', 'extends',
+    'implements', 'interface', 'struct', 'enum', 'int', 'long', 'short', 'float', 'double', 'bool',
+    'boolean', 'char', 'string', 'unsigned', 'signed', 'volatile', 'readonly', 'override', 'virtual'
+))
+# Leading whitespace is syntax in these files
+_INDENT_SENSITIVE = ('.py', '.pyi', '.pyw', '.yaml', '.yml', '.coffee', '.nim', '.haml', '.slim')
+# A hunk renaming more distinct identifiers than this is treated as a real change
+_MAX_RENAMES = 3
+_LLM_HUNK_LINES = 40
+
+@dataclass(frozen=True)
+class HunkScore:
+    path: str
+    index: int
+    score: float
+    reason: str
+    changed_lines: int = 0
+    # Estimated prompt tokens the hunk adds
+    tokens: int = 0
+
+def _normalize(line: str, indent_sensitive: bool) -> str:
+    """The line without whitespace, except inside string literals and, where it is syntax, indentation."""
+    parts = _CODE_AND_STRINGS.split(line)
+    # Odd parts are the string literals
+    code = "".join(part if i % 2 else re.sub(r'\s+', '', part) for i, part in enumerate(parts))
+    if indent_sensitive:
+        return line[:len(line) - len(line.lstrip())] + code
+    return code
+
+def _is_rename(removed: List[str], added: List[str]) -> bool:
+    """
+    True when the added lines equal the removed ones up to a few consistent
+    identifier renames. A renamed name must not be a keyword or literal, and
+    must occur more than once or be defined in the hunk; a single swapped
+    name is as likely a changed reference as a rename.
+    """
+    if not removed or len(removed) != len(added):
+        return False
+    renames: Dict[str, str] = {}
+    occurrences: Dict[str, int] = {}
+    for old, new in zip(removed, added):
+        old_tokens, new_tokens = _TOKEN.findall(old), _TOKEN.findall(new)
+        if len(old_tokens) != len(new_tokens):
+            return False
+        for a, b in zip(old_tokens, new_tokens):
+            if a == b:
+                continue
+            if not (_IDENTIFIER.match(a) and _IDENTIFIER.match(b)) or a in _KEYWORDS or b in _KEYWORDS:
+                return False
+            if renames.setdefault(a, b) != b:
+                return False
+            occurrences[a] = occurrences.get(a, 0) + 1
+    if not 0 < len(renames) <= _MAX_RENAMES:
+        return False
+    text = "\n".join(removed)
+    return all(
+        occurrences[name] > 1
+        or re.search(rf'(?:\b(?:def|class|function|func|fn|let|const|var)\s+{name}\b|\b{name}\s*=[^=])', text)
+        for name in renames
+    )
+
+class HunkTriage:
+    """
+    First stage of the cascade review: scores each hunk so that only the
+    ones worth it reach the expensive agents.
+
+    Static checks recognize whitespace-only edits, identifier renames,
+    reordered imports and comment-only changes, and score the rest from the
+    signals `analyze_code_quality` uses (complexity, definitions, security
+    and debug patterns, size). Hunks of non-source, binary or truncated
+    files are always kept. Optionally a small model gets a second look at
+    the hunks the static checks would skip and can promote them; if that
+    call fails they are all kept.
+    """
+
+    def __init__(self,
+                 threshold: float = CASCADE_THRESHOLD,
+                 llm_model: str = CASCADE_LLM_MODEL,
+                 llm: Optional[OllamaLLM] = None,
+                 llm_max_hunks: int = CASCADE_LLM_MAX_HUNKS):
+        self.threshold = threshold
+        self.llm_model = llm_model
+        self.llm = llm if llm is not None or not llm_model else OllamaLLM()
+        self.llm_max_hunks = llm_max_hunks
+
+    def score(self, path: str, diff: FileDiff, index: int) -> HunkScore:
+        hunk = diff.hunks[index]
+        removed = [line.text for line in hunk.iter_removed()]
+        added = [line.text for line in hunk.iter_added()]
+        changed = len(removed) + len(added)
+        tokens = estimate_tokens(diff.hunk_text(index))
+        score, reason = self._score(path, diff, removed, added)
+        return HunkScore(path, index, score, reason, changed, tokens)
+
+    def _score(self, path: str, diff: FileDiff, removed: List[str], added: List[str]) -> Tuple[float, str]:
+        if diff.is_binary or diff.truncated or not path.endswith(SOURCE_EXTENSIONS):
+            return 1.0, "not triaged"
+        old = [line for line in removed if line.strip()]
+        new = [line for line in added if line.strip()]
+        indent_sensitive = path.endswith(_INDENT_SENSITIVE)
+        if [_normalize(line, indent_sensitive) for line in old] == [_normalize(line, indent_sensitive) for line in new]:
+            return 0.0, "whitespace only"
+        # Only a reorder of the same imports; an added, dropped or changed one is a real change
+        if all(IMPORT_LINE.match(line) for line in old + new) and \
+                sorted(line.strip() for line in old) == sorted(line.strip() for line in new):
+            return 0.1, "imports only"
+        if _is_rename(old, new):
+            return 0.1, "rename only"
+        comment_line = C_COMMENT_LINE if path.endswith(_C_FAMILY) else COMMENT_LINE
+        if all(comment_line.match(line) for line in old + new):
+            return 0.2, "comments only"
+
+        text = "\n".join(old + new)
+        score = 0.4
+        signals = []
+        complexity = cognitive_complexity(text)
+        if complexity:
+            score += min(0.3, 0.05 * complexity)
+            signals.append(f"complexity {complexity}")
+        if re.search(DEFINITION_PATTERN, text):
+            score += 0.1
+            signals.append("definitions")
+        if any(re.search(pattern, text, re.IGNORECASE) for pattern, _ in SECURITY_PATTERNS):
+            score += 0.4
+            signals.append("security pattern")
+        if re.search(TODO_PATTERN, text) or any(
+                re.search(pattern, text) for patterns in DEBUG_PATTERNS.values() for pattern in patterns):
+            score += 0.05
+            signals.append("debug/todo")
+        score += 0.1 * min(len(old) + len(new), 50) / 50
+        return round(min(1.0, score), 3), "code change" + (f" ({', '.join(signals)})" if signals else "")
+
+    async def triage(self, parsed_diff: ParsedDiff) -> List[HunkScore]:
+        """Scores every hunk of the diff, with the optional small-model pass."""
+        scores = []
+        for path, diff in parsed_diff.items():
+            for index in range(len(diff.hunks)):
+                try:
+                    scores.append(self.score(path, diff, index))
+                except Exception as e:
+                    logger.error(f"Error scoring hunk {index} of {path}: {e}")
+                    scores.append(HunkScore(path, index, 1.0, "triage error"))
+        if self.llm is not None:
+            scores = await self._llm_pass(parsed_diff, scores)
+        return scores
+
+    async def _llm_pass(self, parsed_diff: ParsedDiff, scores: List[HunkScore]) -> List[HunkScore]:
+        """Lets the small model promote hunks the static checks would skip (whitespace-only ones excepted)."""
+        candidates = sorted(
+            (i for i, s in enumerate(scores) if 0 < s.score < self.threshold),
+            key=lambda i: -scores[i].score
+        )[:self.llm_max_hunks]
+        if not candidates:
+            return scores
+        hunks = []
+        for i in candidates:
+            s = scores[i]
+            lines = parsed_diff[s.path].hunk_text(s.index).split('\n')
+            if len(lines) > _LLM_HUNK_LINES:
+                lines = lines[:_LLM_HUNK_LINES] + ["..."]
+            hunks.append(f"File: {s.path}\n" + "\n".join(lines))
+        record_metric("cascade_llm_calls", 1)
+        response = await self.llm.call(create_hunk_triage_prompt(hunks),
+                                       {"num_predict": 64}, model=self.llm_model)
+        if response.startswith("Error:"):
+            logger.warning(f"Cascade LLM triage failed, keeping its {len(candidates)} hunks: {response}")
+            promoted, reason = set(range(1, len(candidates) + 1)), "kept, LLM triage failed"
+        else:
+            match = re.search(r'REVIEW:\s*(.*)', response, re.IGNORECASE)
+            promoted = {int(n) for n in re.findall(r'\d+', match.group(1))} if match else set()
+            reason = "promoted by LLM"
+        scores = list(scores)
+        for number, i in enumerate(candidates, start=1):
+            if number in promoted:
+                scores[i] = replace(scores[i], score=self.threshold, reason=f"{scores[i].reason}; {reason}")
+        return scores
+
+    def apply(self, parsed_diff: ParsedDiff, scores: List[HunkScore]) -> ParsedDiff:
+        """Builds the diff for the expensive agents from the hunks scoring at least the threshold."""
+        kept: Dict[str, List[int]] = {}
+        for s in scores:
+            if s.score >= self.threshold:
+                kept.setdefault(s.path, []).append(s.index)
+        files = {}
+        for path, diff in parsed_diff.items():
+            indices = kept.get(path, [])
+            if len(indices) == len(diff.hunks):
+                files[path] = diff
+            elif indices:
+                files[path] = diff.with_hunks(sorted(indices))
+        return ParsedDiff(files)
+
+    def report(self, scores: List[HunkScore], seconds: float) -> Dict:
+        """Summary of the triage for the review results."""
+        skipped = [s for s in scores if s.score < self.threshold]
+        reasons: Dict[str, int] = {}
+        for s in skipped:
+            reasons[s.reason] = reasons.get(s.reason, 0) + 1
+        return {
+            "hunks": len(scores),
+            "skipped": len(skipped),
+            "skipped_fraction": round(len(skipped) / len(scores), 3) if scores else 0.0,
+            "skipped_reasons": reasons,
+            "tokens_skipped": sum(s.tokens for s in skipped),
+            "triage_seconds": round(seconds, 4)
+        }
@@ -0,0 +1,117 @@
+# utils/pr_snapshot.py
+from dataclasses import dataclass
+from functools import cached_property
+from typing import Dict, Iterable, Iterator, List, Optional
+from github.PullRequest import PullRequest
+from utils.diff_positions import DiffPositionIndex
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class PRFile:
+    """A changed file in a pull request, detached from the GitHub API object."""
+    filename: str
+    status: str
+    additions: int
+    deletions: int
+    changes: int
+    patch: Optional[str]
+    previous_filename: Optional[str] = None
+    sha: Optional[str] = None
+
+    @classmethod
+    def from_github(cls, file) -> "PRFile":
+        return cls(
+            filename=file.filename,
+            status=file.status,
+            additions=file.additions,
+            deletions=file.deletions,
+            changes=file.changes,
+            patch=file.patch,
+            previous_filename=getattr(file, 'previous_filename', None),
+            sha=file.sha
+        )
+
+def iter_patch_lines(files: Iterable[PRFile]) -> Iterator[str]:
+    """Yields the unified diff of per-file patches line by line, each file under a git header."""
+    for f in files:
+        if f.patch:
+            yield f"diff --git a/{f.previous_filename or f.filename} b/{f.filename}"
+            yield from f.patch.split('\n')
+
+class PRSnapshot:
+    """
+    Read-only snapshot of a pull request taken once per review.
+
+    The paginated file listing, patches, review comments and metadata are
+    fetched up front so that analysis helpers, agents and comment placement
+    share one copy instead of each hitting the GitHub API. It exposes the
+    same read methods as PullRequest (`get_files`, `get_comments`, `number`,
+    `base`, ...) so existing helpers accept either; writes are delegated to
+    the underlying PullRequest.
+    """
+
+    def __init__(self, pr: PullRequest):
+        self.pr = pr
+        self.number = pr.number
+        self.title = pr.title
+        self.body = pr.body
+        self.state = pr.state
+        self.author = pr.user.login if pr.user else None
+        self.base = pr.base
+        self.head = pr.head
+        self.base_sha = pr.base.sha
+        self.head_sha = pr.head.sha
+        self.repo_name = pr.base.repo.full_name
+        self.files: List[PRFile] = [PRFile.from_github(f) for f in pr.get_files()]
+        self.review_comments: List[str] = [comment.body for comment in pr.get_comments()]
+        self._files_by_name: Dict[str, PRFile] = {f.filename: f for f in self.files}
+        logger.info(f"Snapshot of PR #{self.number}: {len(self.files)} files, "
+                    f"{len(self.review_comments)} review comments")
+
+    @classmethod
+    async def fetch(cls, pr: PullRequest) -> "PRSnapshot":
+        """Takes a snapshot without blocking the event loop on GitHub I/O."""
+        return await asyncio.to_thread(cls, pr)
+
+    def get_files(self) -> List[PRFile]:
+        return self.files
+
+    def get_file(self, filename: str) -> Optional[PRFile]:
+        return self._files_by_name.get(filename)
+
+    def get_comments(self) -> List[str]:
+        return self.review_comments
+
+    @cached_property
+    def issue_comments(self) -> List[Dict]:
+        """Conversation comments, fetched on first use."""
+        return [
+            {'user': comment.user.login, 'body': comment.body}
+            for comment in self.pr.get_issue_comments()
+        ]
+
+    @cached_property
+    def diff_text(self) -> str:
+        """Unified diff assembled from the per-file patches."""
+        return "".join(
+            f"diff --git a/{f.previous_filename or f.filename} b/{f.filename}\n{f.patch}\n"
+            for f in self.files if f.patch
+        )
+
+    def iter_diff_lines(self) -> Iterator[str]:
+        """Yields the lines of `diff_text` one file at a time without joining them."""
+        return iter_patch_lines(self.files)
+
+    @cached_property
+    def position_index(self) -> DiffPositionIndex:
+        """Line-to-diff-position lookup shared by every inline comment of the review."""
+        return DiffPositionIndex(self.files)
+
+    def create_review(self, *args, **kwargs):
+        return self.pr.create_review(*args, **kwargs)
+
+    def create_issue_comment(self, body: str):
+        return self.pr.create_issue_comment(body)
@@ -0,0 +1,110 @@
+# utils/repo_index.py
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+from github.Repository import Repository
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+class _TrieNode:
+    __slots__ = ('children', 'paths')
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        self.paths: List[str] = []
+
+class RepoTreeIndex:
+    """
+    In-memory index of every file path in a git tree.
+
+    Exact lookups go through a set. Lookups by file name go through a trie
+    rooted at the basename whose children are the parent directories in
+    reverse order, so `find('test_x.py', near='pkg/sub')` can return the
+    candidate sharing the longest directory suffix with `near`.
+    """
+
+    def __init__(self, tree_sha: str, paths: Iterable[str], truncated: bool = False):
+        self.tree_sha = tree_sha
+        self.truncated = truncated
+        self.paths = frozenset(paths)
+        self._basenames: Dict[str, _TrieNode] = {}
+        for path in self.paths:
+            self._insert(path)
+
+    def _insert(self, path: str):
+        *dirs, basename = path.split('/')
+        node = self._basenames.get(basename)
+        if node is None:
+            node = self._basenames[basename] = _TrieNode()
+        node.paths.append(path)
+        for directory in reversed(dirs):
+            node = node.children.setdefault(directory, _TrieNode())
+            node.paths.append(path)
+
+    def __contains__(self, path: str) -> bool:
+        return path in self.paths
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def find(self, basename: str, near: str = "") -> List[str]:
+        """
+        Returns paths whose file name is `basename`, narrowed to those sharing
+        the longest trailing directory sequence with `near`.
+        """
+        node = self._basenames.get(basename)
+        if node is None:
+            return []
+        for directory in reversed([d for d in near.split('/') if d]):
+            child = node.children.get(directory)
+            if child is None:
+                break
+            node = child
+        return sorted(node.paths)
+
+_CACHE_SIZE = 16
+_indexes: "OrderedDict[Tuple[str, str], RepoTreeIndex]" = OrderedDict()
+_commit_trees: Dict[Tuple[str, str], str] = {}
+_lock = threading.Lock()
+
+def get_repo_tree_index(repo: Repository, commit_sha: str) -> Optional[RepoTreeIndex]:
+    """
+    Returns the path index for the tree at `commit_sha`, fetching the
+    recursive git tree once and caching it by tree SHA across reviews.
+    """
+    repo_name = repo.full_name
+    with _lock:
+        tree_sha = _commit_trees.get((repo_name, commit_sha))
+        if tree_sha is not None and (repo_name, tree_sha) in _indexes:
+            _indexes.move_to_end((repo_name, tree_sha))
+            return _indexes[(repo_name, tree_sha)]
+
+    try:
+        tree = repo.get_git_tree(commit_sha, recursive=True)
+    except Exception as e:
+        logger.error(f"Error fetching git tree for {repo_name}@{commit_sha}: {e}")
+        return None
+
+    truncated = bool(tree.raw_data.get('truncated'))
+    if truncated:
+        logger.warning(f"Git tree for {repo_name}@{commit_sha} was truncated by the API")
+
+    with _lock:
+        _commit_trees[(repo_name, commit_sha)] = tree.sha
+        index = _indexes.get((repo_name, tree.sha))
+        if index is None:
+            index = RepoTreeIndex(
+                tree.sha,
+                (element.path for element in tree.tree if element.type == 'blob'),
+                truncated=truncated
+            )
+            _indexes[(repo_name, tree.sha)] = index
+            while len(_indexes) > _CACHE_SIZE:
+                _indexes.popitem(last=False)
+            if len(_commit_trees) > _CACHE_SIZE * 8:
+                for key in [k for k, sha in _commit_trees.items() if (k[0], sha) not in _indexes]:
+                    del _commit_trees[key]
+        _indexes.move_to_end((repo_name, tree.sha))
+    logger.info(f"Indexed {len(index)} paths for {repo_name}@{commit_sha[:7]}")
+    return index
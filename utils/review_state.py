@@ -0,0 +1,178 @@
+# utils/review_state.py
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Union
+from contextlib import closing
+import json
+import logging
+import os
+import sqlite3
+import time
+from utils.diff_parser import FileDiff, Hunk, ParsedDiff
+from config import REVIEW_STATE_PATH
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class ReviewState:
+    """What RBRDCK last reviewed on a pull request, and the merged findings so far."""
+    repo: str
+    pr: int
+    head_sha: str
+    base_sha: Optional[str] = None
+    reviewed_at: float = 0.0
+    # Agent type -> review, merged across incremental rounds
+    reviews: Dict[str, Union[str, Dict]] = field(default_factory=dict)
+    # Number of reviews posted for the PR, the first full one included
+    rounds: int = 1
+
+class ReviewStateStore:
+    """
+    Last-reviewed head SHA and review results per pull request.
+
+    Kept in a SQLite database in WAL mode, like the LLM response cache, so
+    several worker processes can share it.
+    """
+
+    def __init__(self, path: str = REVIEW_STATE_PATH):
+        self.path = path
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA busy_timeout = 30000")
+        return conn
+
+    def _init_db(self):
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS pr_reviews (
+                    repo TEXT NOT NULL,
+                    pr INTEGER NOT NULL,
+                    head_sha TEXT NOT NULL,
+                    base_sha TEXT,
+                    reviewed_at REAL NOT NULL,
+                    rounds INTEGER NOT NULL,
+                    reviews TEXT NOT NULL,
+                    PRIMARY KEY (repo, pr)
+                )
+            """)
+
+    def get(self, repo: str, pr: int) -> Optional[ReviewState]:
+        """Returns the stored state of a PR, or None if it was never reviewed."""
+        try:
+            with closing(self._connect()) as conn:
+                row = conn.execute(
+                    "SELECT head_sha, base_sha, reviewed_at, rounds, reviews FROM pr_reviews "
+                    "WHERE repo = ? AND pr = ?", (repo, pr)
+                ).fetchone()
+        except Exception as e:
+            logger.error(f"Error reading review state of {repo}#{pr}: {e}")
+            return None
+        if row is None:
+            return None
+        head_sha, base_sha, reviewed_at, rounds, reviews = row
+        return ReviewState(repo, pr, head_sha, base_sha, reviewed_at, json.loads(reviews), rounds)
+
+    def put(self, state: ReviewState):
+        """Records `state` as the latest review of its PR."""
+        try:
+            with closing(self._connect()) as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO pr_reviews (repo, pr, head_sha, base_sha, reviewed_at, rounds, reviews) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (state.repo, state.pr, state.head_sha, state.base_sha, state.reviewed_at or time.time(),
+                     state.rounds, json.dumps(state.reviews, ensure_ascii=False, default=str))
+                )
+        except Exception as e:
+            logger.error(f"Error writing review state of {state.repo}#{state.pr}: {e}")
+
+    def delete(self, repo: str, pr: int):
+        """Forgets a PR, so its next review is a full one."""
+        with closing(self._connect()) as conn:
+            conn.execute("DELETE FROM pr_reviews WHERE repo = ? AND pr = ?", (repo, pr))
+
+_review_state_store: Optional[ReviewStateStore] = None
+
+def get_review_state_store() -> ReviewStateStore:
+    """Returns the process-wide review state store."""
+    global _review_state_store
+    if _review_state_store is None:
+        _review_state_store = ReviewStateStore()
+    return _review_state_store
+
+def _overlaps(hunk: Hunk, hunks: List[Hunk]) -> bool:
+    """True when `hunk` touches new-file lines covered by any of `hunks`."""
+    start, end = hunk.new_start, hunk.new_start + max(hunk.new_count, 1)
+    return any(other.new_start < end and start < other.new_start + max(other.new_count, 1) for other in hunks)
+
+def incremental_diff(pr_diff: ParsedDiff, push_diff: ParsedDiff) -> ParsedDiff:
+    """
+    The part of the PR diff changed by a push.
+
+    `push_diff` compares the last reviewed head with the new one. Its hunks
+    are kept only where they overlap the PR's own hunks, so changes a merge
+    of the base branch brought in, and changes reverted back to the base,
+    are not reviewed. Files the PR diff holds only partially (binary or
+    truncated) keep the push's hunks as they are.
+    """
+    files: Dict[str, FileDiff] = {}
+    for path, diff in push_diff.items():
+        pr_file = pr_diff.get(path)
+        if pr_file is None:
+            continue
+        if pr_file.is_binary or pr_file.truncated or not diff.hunks:
+            files[path] = diff
+            continue
+        kept = [i for i, hunk in enumerate(diff.hunks) if _overlaps(hunk, pr_file.hunks)]
+        if len(kept) == len(diff.hunks):
+            files[path] = diff
+        elif kept:
+            files[path] = diff.with_hunks(kept)
+    return ParsedDiff(files)
+
+# The text agents return when their LLM call fails: "Error: ..." or "Error generating ... review: ..."
+_ERROR_PREFIXES = ('Error:', 'Error generating ')
+
+def is_failed_review(review: Union[str, Dict, None]) -> bool:
+    """
+    True for a missing review, an error or timeout status, or the error
+    text agents return when their LLM call fails. A review that merely
+    starts with the word "Error" ("Error handling ...") is not failed.
+    """
+    if isinstance(review, str):
+        return review.startswith(_ERROR_PREFIXES)
+    return review is None or isinstance(review, dict) and review.get('status') in ('error', 'timeout')
+
+def merge_reviews(prior: Dict[str, Union[str, Dict]], current: Dict[str, Union[str, Dict]],
+                  changed_files: Set[str]) -> Dict[str, Union[str, Dict]]:
+    """
+    Merges an incremental review into the prior state.
+
+    Structured findings (lists of dicts with a 'file' key, such as the
+    security agent's vulnerabilities) are replaced for the files the push
+    changed and kept for the others. Text reviews are replaced by the
+    latest one; earlier rounds remain on the PR as posted comments. An
+    agent that failed this round keeps its prior review.
+    """
+    merged = dict(prior)
+    for agent_type, review in current.items():
+        previous = prior.get(agent_type)
+        if is_failed_review(review):
+            if previous is None:
+                merged[agent_type] = review
+            continue
+        if not isinstance(review, dict) or not isinstance(previous, dict) or is_failed_review(previous):
+            merged[agent_type] = review
+            continue
+        combined = dict(review)
+        for key, items in previous.items():
+            if not isinstance(items, list) or not all(isinstance(i, dict) and 'file' in i for i in items):
+                continue
+            kept = [i for i in items if i['file'] not in changed_files]
+            combined[key] = kept + list(review.get(key) or [])
+        merged[agent_type] = combined
+    return merged